@@ -0,0 +1,105 @@
+"""
+bench_pivot.py
+
+Compares `pivot_table_values` of `read_table_to_dataframe.py` with the original row-by-row
+implementation (`DataFrame.apply` to coalesce the values and `pivot_table` to pivot them) on a
+synthetic long-format query result, and checks that both produce the same DataFrame. No database
+is needed.
+
+    python benchmarks/bench_pivot.py [number of values]
+"""
+
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from read_table_to_dataframe import pivot_table_values  # noqa: E402
+
+N_PARAMETERS = 50
+N_PROTOCOLS = 5
+
+
+def make_long_values(n_values: int, seed: int = 0) -> pd.DataFrame:
+    """Return a DataFrame shaped like the result of the single-table query, with every item having every parameter."""
+    rng = np.random.default_rng(seed)
+    n_items = n_values // N_PARAMETERS
+    parameter = np.tile(np.arange(N_PARAMETERS), n_items)
+    value_type = parameter % 5
+    df = pd.DataFrame({
+        "title": np.repeat([f"Item {i:07d}" for i in range(n_items)], N_PARAMETERS),
+        "protocol": [f"Protocol {p}" for p in parameter // (N_PARAMETERS // N_PROTOCOLS)],
+        "protocol_rank": parameter // (N_PARAMETERS // N_PROTOCOLS),
+        "parameter": [f"Parameter {p}" for p in parameter],
+        "parameter_rank": parameter % (N_PARAMETERS // N_PROTOCOLS),
+        "quantity": np.where(value_type == 0, rng.normal(500, 50, len(parameter)), np.nan),
+        "unit": np.where(value_type == 0, "nm", None),
+        "text": np.where(value_type == 1, "note", None),
+        "boolean": np.where(value_type == 2, rng.random(len(parameter)) < 0.5, None),
+        "enum": np.where(value_type == 3, "High", None),
+        "link": np.where(value_type == 4, "Item 0000000", None),
+    })
+    # Leave some cells empty, and one parameter without any value
+    df.loc[parameter == N_PARAMETERS - 1, ["quantity", "text", "boolean", "enum", "link"]] = None
+    return df[rng.random(len(df)) > 0.05].reset_index(drop=True)
+
+
+def pivot_row_by_row(df_long: pd.DataFrame) -> pd.DataFrame:
+    """The original implementation of read_table_to_dataframe.py."""
+    df_long = df_long.copy()
+
+    def coalesce_value(row):
+        return (
+            row["quantity"] if pd.notnull(row["quantity"]) else
+            row["text"] if pd.notnull(row["text"]) else
+            row["boolean"] if pd.notnull(row["boolean"]) else
+            row["enum"] if pd.notnull(row["enum"]) else
+            row["link"]
+        )
+
+    df_long["value"] = df_long.apply(coalesce_value, axis=1)
+    df_long["column_key"] = list(zip(
+        df_long["protocol_rank"], df_long["parameter_rank"], df_long["protocol"], df_long["parameter"]
+    ))
+    column_order = sorted(df_long["column_key"].unique())
+    col_name_map = {key: f"{key[2]} | {key[3]}" for key in column_order}
+    df_long["protocol_parameter"] = df_long["column_key"].map(col_name_map)
+    df_wide = df_long.pivot_table(
+        index="title", columns="protocol_parameter", values="value", aggfunc="first"
+    ).reset_index()
+    ordered_columns = ["title"] + [col_name_map[key] for key in column_order]
+    return df_wide[[col for col in ordered_columns if col in df_wide.columns]]
+
+
+def measure(pivot, df_long: pd.DataFrame) -> tuple[pd.DataFrame, float, float]:
+    start = time.perf_counter()
+    df_wide = pivot(df_long)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    pivot(df_long)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return df_wide, elapsed, peak / 2 ** 20
+
+
+def main():
+    n_values = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    df_long = make_long_values(n_values)
+    print(f"{len(df_long)} values")
+
+    expected, elapsed, peak = measure(pivot_row_by_row, df_long)
+    print(f"{'apply + pivot_table':<22} {elapsed:8.2f} s {peak:8.0f} MB peak")
+    actual, elapsed, peak = measure(pivot_table_values, df_long)
+    print(f"{'pivot_table_values':<22} {elapsed:8.2f} s {peak:8.0f} MB peak")
+
+    pd.testing.assert_frame_equal(actual, expected, check_names=False)
+    print("Both implementations produce the same DataFrame.")
+
+
+if __name__ == "__main__":
+    main()
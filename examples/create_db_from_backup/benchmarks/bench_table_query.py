@@ -0,0 +1,68 @@
+"""
+bench_table_query.py
+
+Measures the latency of the single-table query of `read_table_to_dataframe.py` on a restored
+backup, first without the secondary indexes of `create_db_from_backup.py` and then with them.
+The indexes are dropped for the first measurement and rebuilt (and the tables analyzed) for
+the second, so run it on a database restored with `create_db_from_backup.py`.
+
+    python benchmarks/bench_table_query.py [table_id]
+
+Without a table_id, the table with the most values is used.
+"""
+
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from psycopg2 import sql
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from create_db_from_backup import connect, index_and_analyze, index_columns  # noqa: E402
+from read_table_to_dataframe import query  # noqa: E402
+
+REPETITIONS = 5
+
+
+def largest_table_id(cur) -> str:
+    cur.execute("""
+        SELECT ti.table_id FROM table_values tv JOIN table_items ti ON ti.id = tv.table_item_id
+        GROUP BY ti.table_id ORDER BY count(*) DESC LIMIT 1
+    """)
+    return cur.fetchone()[0]
+
+
+def measure(cur, table_id: str) -> tuple[float, int]:
+    timings = []
+    for _ in range(REPETITIONS):
+        start = time.perf_counter()
+        cur.execute(query, (table_id,))
+        row_count = len(cur.fetchall())
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), row_count
+
+
+def main():
+    conn = connect()
+    conn.autocommit = True
+    cur = conn.cursor()
+    table_id = sys.argv[1] if len(sys.argv) > 1 else largest_table_id(cur)
+
+    for indexes in index_columns.values():
+        for index_name in indexes:
+            cur.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(index_name)))
+    cur.execute("ANALYZE")
+    latency, row_count = measure(cur, table_id)
+    print(f"without indexes: {latency * 1000:8.1f} ms (median of {REPETITIONS}, {row_count} values)")
+
+    index_and_analyze()
+    latency, row_count = measure(cur, table_id)
+    print(f"with indexes:    {latency * 1000:8.1f} ms (median of {REPETITIONS}, {row_count} values)")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
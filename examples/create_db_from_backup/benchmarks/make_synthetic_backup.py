@@ -0,0 +1,133 @@
+"""
+make_synthetic_backup.py
+
+Writes a synthetic MaterialsZone backup (the CSV files of `backup/database`) for benchmarking
+`create_db_from_backup.py` and `read_table_to_dataframe.py` without a real backup.
+
+Every table gets the same number of items, protocols and parameters, and every item has a value
+for every parameter (a mix of quantities, texts, booleans, enum values and links). A small share
+of the values and title parameters refer to trashed items that are missing from `table_items.csv`,
+like in real backups.
+
+    python benchmarks/make_synthetic_backup.py --tables 20 --items 1000 --parameters 50 --output backup/database
+"""
+
+import argparse
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+TIMESTAMP = "Tue Mar 05 2024 10:11:12 GMT+0000 (Coordinated Universal Time)"
+TRASHED_SHARE = 0.01  # Share of values that refer to a trashed item
+
+
+def new_ids(count: int) -> np.ndarray:
+    return np.array([str(uuid.uuid4()) for _ in range(count)], dtype=object)
+
+
+def make_backup(n_tables: int, n_items: int, n_parameters: int, n_protocols: int, seed: int = 0) -> dict:
+    """Return a DataFrame for every backup CSV file."""
+    rng = np.random.default_rng(seed)
+    folder_ids = new_ids(2)
+    folders = pd.DataFrame({
+        "id": folder_ids, "title": ["Root", "Projects"], "parent_folder_id": [None, folder_ids[0]],
+        "created_timestamp": TIMESTAMP, "updated_timestamp": TIMESTAMP,
+    })
+    table_ids = new_ids(n_tables)
+    tables = pd.DataFrame({
+        "id": table_ids, "title": [f"Table {i}" for i in range(n_tables)], "folder_id": folder_ids[1],
+        "created_timestamp": TIMESTAMP, "updated_timestamp": TIMESTAMP,
+    })
+
+    item_table = np.repeat(table_ids, n_items)
+    item_ids = new_ids(len(item_table))
+    table_items = pd.DataFrame({
+        "id": item_ids, "code": [f"IT-{i}" for i in range(len(item_ids))],
+        "title": [f"Item {i % n_items:06d}" for i in range(len(item_ids))], "description": None,
+        "table_id": item_table, "created_timestamp": TIMESTAMP, "timestamp": None, "updated_timestamp": TIMESTAMP,
+    })
+
+    protocol_table = np.repeat(table_ids, n_protocols)
+    protocol_ids = new_ids(len(protocol_table))
+    table_protocols = pd.DataFrame({
+        "id": protocol_ids, "title": [f"Protocol {i % n_protocols}" for i in range(len(protocol_ids))],
+        "description": None, "table_id": protocol_table, "rank": np.tile(np.arange(n_protocols), n_tables),
+        "type": "protocol", "unit": None, "created_timestamp": TIMESTAMP, "updated_timestamp": TIMESTAMP,
+    })
+
+    parameter_protocol = np.repeat(protocol_ids, n_parameters // n_protocols)
+    parameter_ids = new_ids(len(parameter_protocol))
+    value_types = np.resize(np.array(["QUANTITY", "TEXT", "BOOLEAN", "ENUM", "LINK"]), len(parameter_ids))
+    # Formulation (QUANTITY) parameters are titled by an item, which is sometimes trashed
+    trashed_title = (value_types == "QUANTITY") & (rng.random(len(parameter_ids)) < TRASHED_SHARE * 5)
+    title_item_ids = np.where(trashed_title, new_ids(len(parameter_ids)), None)
+    table_parameters = pd.DataFrame({
+        "id": parameter_ids, "title": [f"Parameter {i}" for i in range(len(parameter_ids))],
+        "title_table_item_id": title_item_ids, "table_protocol_id": parameter_protocol,
+        "rank": np.tile(np.arange(n_parameters // n_protocols), len(protocol_ids)),
+        "value_type": value_types, "unit": np.where(value_types == "QUANTITY", "nm", None),
+        "created_timestamp": TIMESTAMP, "updated_timestamp": TIMESTAMP,
+    })
+
+    enum_parameter_ids = parameter_ids[value_types == "ENUM"]
+    enum_ids = new_ids(len(enum_parameter_ids) * 3)
+    table_parameter_enum_values = pd.DataFrame({
+        "id": enum_ids, "table_parameter_id": np.repeat(enum_parameter_ids, 3),
+        "value": np.tile(["Low", "Medium", "High"], len(enum_parameter_ids)),
+        "rank": np.tile([0, 1, 2], len(enum_parameter_ids)),
+    })
+
+    # Every item gets a value for every parameter of its table
+    parameters_per_table = len(parameter_ids) // n_tables
+    value_items = np.repeat(item_ids, parameters_per_table)
+    value_parameter_index = np.arange(len(parameter_ids)).reshape(n_tables, parameters_per_table)[
+        np.repeat(np.arange(n_tables), n_items)].ravel()
+    value_parameters = parameter_ids[value_parameter_index]
+    value_type = value_types[value_parameter_index]
+    n_values = len(value_items)
+    trashed = rng.random(n_values) < TRASHED_SHARE
+    value_items[trashed] = new_ids(trashed.sum())
+    enum_choices = table_parameter_enum_values.groupby("table_parameter_id")["id"].first()
+    table_values = pd.DataFrame({
+        "table_item_id": value_items,
+        "table_parameter_id": value_parameters,
+        "quantity": np.where(value_type == "QUANTITY", rng.normal(500, 50, n_values).round(3), np.nan),
+        "text": np.where(value_type == "TEXT", "note", None),
+        "boolean": pd.array(np.where(value_type == "BOOLEAN", rng.random(n_values) < 0.5, None), dtype="boolean"),
+        "link": np.where(value_type == "LINK", item_ids[rng.integers(0, len(item_ids), n_values)], None),
+        "enum_value": np.where(value_type == "ENUM", enum_choices.reindex(value_parameters).to_numpy(), None),
+    })
+
+    item_files = item_ids[:: max(1, n_items // 10)]
+    table_files = pd.DataFrame({
+        "id": new_ids(len(item_files)), "title": "Measurement", "table_item_id": item_files,
+        "raw_filename": [f"{i}.csv" for i in range(len(item_files))],
+        "created_timestamp": TIMESTAMP, "updated_timestamp": TIMESTAMP,
+    })
+
+    return {
+        "folders": folders, "tables": tables, "table_items": table_items, "table_protocols": table_protocols,
+        "table_parameters": table_parameters, "table_parameter_enum_values": table_parameter_enum_values,
+        "table_values": table_values, "table_files": table_files,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, default=20)
+    parser.add_argument("--items", type=int, default=1000, help="items per table")
+    parser.add_argument("--parameters", type=int, default=50, help="parameters per table")
+    parser.add_argument("--protocols", type=int, default=5, help="protocols per table")
+    parser.add_argument("--output", type=Path, default=Path("backup") / "database")
+    args = parser.parse_args()
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    for name, df in make_backup(args.tables, args.items, args.parameters, args.protocols).items():
+        df.to_csv(args.output / f"{name}.csv", index=False)
+        print(f"Wrote {len(df)} rows to {args.output / f'{name}.csv'}")
+
+
+if __name__ == "__main__":
+    main()
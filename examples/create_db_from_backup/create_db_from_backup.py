@@ -1,7 +1,14 @@
+import hashlib
+import io
 import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import numpy as np
 import pandas as pd
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 from pathlib import Path
 
 # Load environment variables
@@ -11,6 +18,17 @@ DB_NAME = os.getenv("DB_DATABASE")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 
+# How rows are loaded into the database:
+#   "copy"           - stream each CSV into a staging table with COPY FROM STDIN, then merge it (fastest)
+#   "execute_values" - multi-row INSERT statements, for servers where COPY is not allowed
+#   "insert"         - one INSERT statement per row
+LOAD_METHOD = os.getenv("LOAD_METHOD", "copy")
+CHUNK_SIZE = 100_000  # Number of CSV rows read into memory at a time
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", os.cpu_count()))  # Number of tables or partitions loaded in parallel
+# Drop the foreign keys while loading and validate them once at the end, which is much faster than checking every
+# row. Set to "false" if your database user is not allowed to alter the tables.
+DEFER_CONSTRAINTS = os.getenv("DEFER_CONSTRAINTS", "true").lower() == "true"
+
 # CSV file paths
 database_path = Path(__file__).parent / "backup" / "database"
 file_paths = {
@@ -24,34 +42,8 @@ file_paths = {
     "table_files": database_path / "table_files.csv",
 }
 
-# FIXME: clean value and parameters that refer to trashed table items
-df_table_items = pd.read_csv(file_paths["table_items"])
-df_table_parameters = pd.read_csv(file_paths["table_parameters"])
-df_table_values = pd.read_csv(file_paths["table_values"])
-valid_table_item_ids = set(df_table_items['id'].dropna())
-df_table_parameters = df_table_parameters[
-    df_table_parameters['title_table_item_id'].isna() |
-    df_table_parameters['title_table_item_id'].isin(valid_table_item_ids)
-]
-df_table_values = df_table_values[
-    df_table_values['table_item_id'].isin(valid_table_item_ids)
-]
-valid_table_parameter_ids = set(df_table_parameters['id'].dropna())
-df_table_values = df_table_values[
-    df_table_values['table_parameter_id'].isin(valid_table_parameter_ids)
-]
-df_table_parameters.to_csv(file_paths["table_parameters"], index=False)
-df_table_values.to_csv(file_paths["table_values"], index=False)
-
-# Connect to PostgreSQL
-conn = psycopg2.connect(
-    dbname=DB_NAME,
-    user=DB_USER,
-    password=DB_PASSWORD,
-    host=DB_HOST,
-    port=DB_PORT
-)
-cur = conn.cursor()
+# The cleaned copies of the CSV files are written here, the files of the backup are not modified
+cleaned_database_path = Path(__file__).parent / "backup" / "cleaned"
 
 # SQL statements to create tables
 create_statements = {
@@ -155,41 +147,420 @@ create_statements = {
     """
 }
 
-# Create all tables
-for name, statement in create_statements.items():
-    cur.execute(statement)
 
-conn.commit()
+def read_ids(path, column):
+    # Read a column of UUIDs into a sorted array of fixed-width byte strings, which takes a fraction of the memory of
+    # a set of Python strings
+    ids = pd.read_csv(path, usecols=[column])[column].dropna().to_numpy(dtype="S36")
+    return np.unique(ids)
+
+
+def isin_ids(values, sorted_ids):
+    # Return a mask of the values that are in sorted_ids, using a binary search instead of a hash set
+    values = values.to_numpy(dtype="S36")
+    if len(sorted_ids) == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.searchsorted(sorted_ids, values).clip(max=len(sorted_ids) - 1)
+    return sorted_ids[positions] == values
+
+
+# Secondary indexes for the joins of the query in read_table_to_dataframe.py, built after loading the data
+index_columns = {
+    "table_items": {
+        "table_items_table_id_idx": ["table_id"],
+    },
+    "table_protocols": {
+        "table_protocols_table_id_idx": ["table_id"],
+    },
+    "table_parameters": {
+        "table_parameters_table_protocol_id_idx": ["table_protocol_id"],
+        "table_parameters_title_table_item_id_idx": ["title_table_item_id"],
+    },
+    "table_values": {
+        "table_values_table_item_id_table_parameter_id_idx": ["table_item_id", "table_parameter_id"],
+        "table_values_enum_value_idx": ["enum_value"],
+        "table_values_link_idx": ["link"],
+    },
+}
+
+
+def clean_trashed_items():
+    # Remove the parameters and values that refer to trashed table items. The cleaned table_parameters and
+    # table_values files are written to cleaned_database_path, the files of the backup are never modified. Only the
+    # IDs of the valid items and parameters are kept in memory and the files are filtered in chunks, so the memory
+    # use doesn't depend on the size of table_values. table_values is written as one partition file per chunk so
+    # that the partitions can be loaded in parallel. Returns the list of files to load for each table.
+    table_values_path = cleaned_database_path / "table_values"
+    table_values_path.mkdir(parents=True, exist_ok=True)
+    for partition_path in table_values_path.glob("part-*.csv"):
+        partition_path.unlink()
+    cleaned_file_paths = {name: [path] for name, path in file_paths.items()}
+    cleaned_file_paths["table_parameters"] = [cleaned_database_path / "table_parameters.csv"]
+    cleaned_file_paths["table_values"] = []
+
+    valid_table_item_ids = read_ids(file_paths["table_items"], "id")
+
+    valid_table_parameter_ids = [np.array([], dtype="S36")]
+    for index, df in enumerate(pd.read_csv(file_paths["table_parameters"], chunksize=CHUNK_SIZE)):
+        df = df[df['title_table_item_id'].isna() | isin_ids(df['title_table_item_id'], valid_table_item_ids)]
+        valid_table_parameter_ids.append(df['id'].dropna().to_numpy(dtype="S36"))
+        df.to_csv(cleaned_file_paths["table_parameters"][0], mode="w" if index == 0 else "a", header=index == 0,
+                  index=False)
+    valid_table_parameter_ids = np.unique(np.concatenate(valid_table_parameter_ids))
+
+    for index, df in enumerate(pd.read_csv(file_paths["table_values"], chunksize=CHUNK_SIZE)):
+        df = df[
+            isin_ids(df['table_item_id'], valid_table_item_ids) &
+            isin_ids(df['table_parameter_id'], valid_table_parameter_ids)
+        ]
+        partition_path = table_values_path / f"part-{index:05d}.csv"
+        df.to_csv(partition_path, index=False)
+        cleaned_file_paths["table_values"].append(partition_path)
+
+    return cleaned_file_paths
+
+
+def connect():
+    # Connect to PostgreSQL
+    return psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT
+    )
+
+
+def parse_timestamps(df):
+    # Clean and parse custom timestamp strings
+    for col in df.columns:
+        if 'timestamp' in col and df[col].notna().any():
+            df[col] = pd.to_datetime(df[col].str.extract(r'^(.*GMT[+-]\d{4})')[0], utc=True)
+    return df
 
-# Load data into tables
-conn.autocommit = False  # Start a transaction
-cur.execute("BEGIN")
 
-try: 
-    for name, path in file_paths.items():
-        df = pd.read_csv(path)
+def insert_rows(cur, name, df):
+    # Insert the rows one by one
+    columns = ', '.join(df.columns)
+    placeholders = ', '.join(['%s'] * len(df.columns))
+    insert_query = sql.SQL("INSERT INTO {} ({}) VALUES ({}) ON CONFLICT DO NOTHING").format(
+        sql.Identifier(name),
+        sql.SQL(columns),
+        sql.SQL(placeholders)
+    )
+    for row in df.itertuples(index=False, name=None):
+        row = tuple(None if pd.isna(x) else x for x in row)
+        cur.execute(insert_query, row)
 
-        # Clean and parse custom timestamp strings
-        for col in df.columns:
-            if 'timestamp' in col and df[col].notna().any():
-                df[col] = pd.to_datetime(df[col].str.extract(r'^(.*GMT[+-]\d{4})')[0], utc=True)
 
-        columns = ', '.join(df.columns)
-        placeholders = ', '.join(['%s'] * len(df.columns))
-        insert_query = sql.SQL("INSERT INTO {} ({}) VALUES ({}) ON CONFLICT DO NOTHING").format(
-            sql.Identifier(name),
-            sql.SQL(columns),
-            sql.SQL(placeholders)
+def execute_values_rows(cur, name, df):
+    # Insert the rows with multi-row INSERT statements
+    insert_query = sql.SQL("INSERT INTO {} ({}) VALUES %s ON CONFLICT DO NOTHING").format(
+        sql.Identifier(name),
+        sql.SQL(', ').join(map(sql.Identifier, df.columns))
+    )
+    rows = [tuple(None if pd.isna(x) else x for x in row) for row in df.itertuples(index=False, name=None)]
+    execute_values(cur, insert_query, rows, page_size=1000)
+
+
+def copy_rows(cur, target_name, df, integer_columns):
+    # Stream the rows into the target table in CSV format. INTEGER columns with missing values are read by pandas
+    # as floats, so they are converted back to integers to be accepted by COPY.
+    for col in integer_columns.intersection(df.columns):
+        df[col] = df[col].astype("Int64")
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+        sql.Identifier(target_name),
+        sql.SQL(', ').join(map(sql.Identifier, df.columns))
+    )
+    cur.copy_expert(copy_query.as_string(cur), buffer)
+
+
+def load_table(cur, name, path):
+    # Load a CSV file into its table in chunks and return the number of rows read. With the "copy" method, the rows
+    # are copied into a temporary staging table and then merged into the table with ON CONFLICT DO NOTHING, so
+    # rows that already exist are skipped like they are with the INSERT-based methods. Tables without a primary key
+    # or unique constraint cannot have conflicts, so they are copied into directly, and if none of their columns
+    # need to be converted, the file is copied as is without parsing it.
+    columns = None
+    row_count = 0
+    if LOAD_METHOD == "copy":
+        cur.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = %s AND data_type = 'integer'",
+            (name,)
         )
-        for row in df.itertuples(index=False, name=None):
-            row = tuple(None if pd.isna(x) else x for x in row)
-            cur.execute(insert_query, row)
+        integer_columns = {column_name for column_name, in cur.fetchall()}
+        cur.execute("SELECT EXISTS (SELECT 1 FROM pg_index WHERE indrelid = %s::regclass AND indisunique)", (name,))
+        use_staging = cur.fetchone()[0]
+        copy_target = f"staging_{name}" if use_staging else name
+        columns = list(pd.read_csv(path, nrows=0).columns)
+        if not use_staging and not integer_columns.intersection(columns) and \
+                not any('timestamp' in col for col in columns):
+            copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, HEADER true)").format(
+                sql.Identifier(name),
+                sql.SQL(', ').join(map(sql.Identifier, columns))
+            )
+            with open(path, encoding="utf-8") as file:
+                cur.copy_expert(copy_query.as_string(cur), file)
+            return cur.rowcount
+        if use_staging:
+            cur.execute(sql.SQL("CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP").format(
+                sql.Identifier(copy_target), sql.Identifier(name)
+            ))
+
+    for df in pd.read_csv(path, chunksize=CHUNK_SIZE):
+        df = parse_timestamps(df)
+        columns = list(df.columns)
+        row_count += len(df)
+        if LOAD_METHOD == "copy":
+            copy_rows(cur, copy_target, df, integer_columns)
+        elif LOAD_METHOD == "execute_values":
+            execute_values_rows(cur, name, df)
+        else:
+            insert_rows(cur, name, df)
+
+    if LOAD_METHOD == "copy" and use_staging:
+        if columns:
+            column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+            cur.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {} ON CONFLICT DO NOTHING").format(
+                sql.Identifier(name), column_list, column_list, sql.Identifier(copy_target)
+            ))
+        cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(copy_target)))
+
+    return row_count
+
+
+def table_dependencies():
+    # Return the tables that each table refers to with a foreign key, based on the create statements
+    return {
+        name: set(re.findall(r"REFERENCES (\w+)", statement)) - {name}
+        for name, statement in create_statements.items()
+    }
+
+
+def drop_foreign_keys(conn):
+    # Drop the foreign keys of the backup tables. Their definitions are first saved in the deferred_foreign_keys
+    # table, so that restore_foreign_keys can add them back even if a previous run was interrupted.
+    with conn, conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS deferred_foreign_keys (
+                table_name TEXT,
+                constraint_name TEXT,
+                definition TEXT,
+                PRIMARY KEY (table_name, constraint_name)
+            );
+        """)
+        cur.execute(
+            "SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE contype = 'f' AND conrelid::regclass::text = ANY(%s)",
+            (list(create_statements),)
+        )
+        foreign_keys = cur.fetchall()
+        execute_values(cur, "INSERT INTO deferred_foreign_keys VALUES %s ON CONFLICT DO NOTHING", foreign_keys)
+        for table_name, constraint_name, _ in foreign_keys:
+            cur.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(
+                sql.Identifier(table_name), sql.Identifier(constraint_name)
+            ))
+
+
+def validate_foreign_key(table_name, constraint_name):
+    with connect() as conn, conn.cursor() as cur:
+        cur.execute(sql.SQL("ALTER TABLE {} VALIDATE CONSTRAINT {}").format(
+            sql.Identifier(table_name), sql.Identifier(constraint_name)
+        ))
+    conn.close()
+
+
+def restore_foreign_keys(conn):
+    # Add back the foreign keys saved by drop_foreign_keys. They are added as NOT VALID, which is instant, and then
+    # validated in parallel, each with a single scan of its table.
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT table_name, constraint_name, definition FROM deferred_foreign_keys")
+        foreign_keys = cur.fetchall()
+        for table_name, constraint_name, definition in foreign_keys:
+            cur.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} {} NOT VALID").format(
+                sql.Identifier(table_name), sql.Identifier(constraint_name), sql.SQL(definition)
+            ))
+        cur.execute("DROP TABLE deferred_foreign_keys")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as executor:
+        futures = [executor.submit(validate_foreign_key, table_name, constraint_name)
+                   for table_name, constraint_name, _ in foreign_keys]
+        for future in futures:
+            future.result()
+    print(f"Validated {len(foreign_keys)} foreign keys in {time.perf_counter() - start:.1f}s")
+
+
+def index_and_analyze_table(name):
+    # Build the secondary indexes of a table one after the other (concurrent builds on the same table would block
+    # each other) and update its planner statistics. Indexes left invalid by an interrupted build are rebuilt.
+    conn = connect()
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with conn.cursor() as cur:
+        for index_name, columns in index_columns.get(name, {}).items():
+            cur.execute("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (index_name,))
+            if (cur.fetchone() or (False,))[0]:
+                cur.execute(sql.SQL("DROP INDEX CONCURRENTLY {}").format(sql.Identifier(index_name)))
+            cur.execute(sql.SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} ({})").format(
+                sql.Identifier(index_name),
+                sql.Identifier(name),
+                sql.SQL(', ').join(map(sql.Identifier, columns))
+            ))
+        cur.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(name)))
+    conn.close()
+
+
+def index_and_analyze():
+    # Build the secondary indexes and analyze all tables, working on several tables in parallel
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as executor:
+        for _ in executor.map(index_and_analyze_table, create_statements):
+            pass
+    print(f"Built indexes and analyzed the tables in {time.perf_counter() - start:.1f}s")
+
+
+worker_conn = None
+
+
+def init_worker():
+    # Every worker process keeps its own connection to the database
+    global worker_conn
+    worker_conn = connect()
+
+
+def file_digest(path):
+    # Return the SHA-256 digest of a file, which identifies its content across runs
+    with open(path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def skip_loaded_files(conn, table_paths):
+    # Every loaded file is recorded in the loaded_backup_files table, in the same transaction as its rows, so a file
+    # is either fully loaded and recorded or not loaded at all. Return the files of every table that are not loaded
+    # yet. Loading a file again would duplicate the rows of tables without a primary key (like table_values), so the
+    # load is refused if a recorded file doesn't match the current one, or if such a table already has rows that
+    # aren't recorded (e.g. loaded by an older version of this script).
+    digests = {name: {path: file_digest(path) for path in paths} for name, paths in table_paths.items()}
+    with conn, conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS loaded_backup_files (
+                table_name TEXT,
+                file_name TEXT,
+                digest TEXT,
+                PRIMARY KEY (table_name, file_name)
+            );
+        """)
+        cur.execute("SELECT table_name, file_name, digest FROM loaded_backup_files")
+        loaded = {(table_name, file_name): digest for table_name, file_name, digest in cur.fetchall()}
+
+        remaining_paths = {}
+        for name, paths in table_paths.items():
+            for path in paths:
+                digest = loaded.get((name, path.name))
+                if digest is not None and digest != digests[name][path]:
+                    raise RuntimeError(f"{path.name} was already loaded into {name} from a different backup. Restore "
+                                       f"into an empty database, or drop the backup tables and loaded_backup_files.")
+            remaining_paths[name] = [path for path in paths if (name, path.name) not in loaded]
+
+            cur.execute("SELECT EXISTS (SELECT 1 FROM pg_index WHERE indrelid = %s::regclass AND indisunique)", (name,))
+            has_unique_key = cur.fetchone()[0]
+            cur.execute(sql.SQL("SELECT EXISTS (SELECT 1 FROM {})").format(sql.Identifier(name)))
+            if not has_unique_key and cur.fetchone()[0] and not any(table_name == name for table_name, _ in loaded):
+                raise RuntimeError(f"{name} already has rows that this script didn't record, loading it again would "
+                                   f"duplicate them. Restore into an empty database.")
+
+    skipped = sum(len(paths) for paths in table_paths.values()) - sum(len(paths) for paths in remaining_paths.values())
+    if skipped:
+        print(f"Skipping {skipped} files that were already loaded by a previous run")
+    return remaining_paths, digests
+
+
+def load_partition(name, path, digest):
+    # Load one file into its table and record it in loaded_backup_files, in its own transaction, and return the
+    # number of rows read
+    with worker_conn, worker_conn.cursor() as cur:
+        row_count = load_table(cur, name, path)
+        cur.execute("INSERT INTO loaded_backup_files VALUES (%s, %s, %s)", (name, path.name, digest))
+        return row_count
+
+
+def load_tables(table_paths, dependencies, digests):
+    # Load the files of every table with a pool of worker processes. A table starts loading once all the tables it
+    # depends on are fully loaded, and the files of a table (e.g. the partitions of table_values) load in parallel.
+    # digests maps every file to its digest, recorded with the file in loaded_backup_files.
+    remaining = {name: len(paths) for name, paths in table_paths.items()}
+    row_counts = dict.fromkeys(table_paths, 0)
+    start_times = {}
+    futures = {}
+
+    with ProcessPoolExecutor(max_workers=LOAD_WORKERS, initializer=init_worker) as executor:
+        def submit_ready_tables():
+            loaded = {name for name, count in remaining.items() if count == 0}
+            for name, paths in table_paths.items():
+                if name not in start_times and dependencies.get(name, set()) <= loaded:
+                    start_times[name] = time.perf_counter()
+                    for path in paths:
+                        futures[executor.submit(load_partition, name, path, digests[name][path])] = name
+
+        try:
+            submit_ready_tables()
+            while futures:
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = futures.pop(future)
+                    row_counts[name] += future.result()
+                    remaining[name] -= 1
+                    if remaining[name] == 0:
+                        elapsed = time.perf_counter() - start_times[name]
+                        print(f"Loaded {row_counts[name]} rows into {name} in {elapsed:.1f}s "
+                              f"({row_counts[name] / elapsed:.0f} rows/sec)")
+                submit_ready_tables()
+        except Exception:
+            executor.shutdown(cancel_futures=True)
+            raise
+
+
+def main():
+    cleaned_file_paths = clean_trashed_items()
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # Create all tables
+    for name, statement in create_statements.items():
+        cur.execute(statement)
 
     conn.commit()
 
-except Exception as e:
-    conn.rollback()
-    raise
+    # Load data into tables. Every table (and every partition of table_values) is loaded in its own transaction, and
+    # the files loaded by a previous, failed run are skipped. With deferred constraints the tables don't depend on
+    # each other while loading, otherwise a table is only loaded after the tables it refers to.
+    start = time.perf_counter()
+    table_paths, digests = skip_loaded_files(conn, cleaned_file_paths)
+    if DEFER_CONSTRAINTS:
+        drop_foreign_keys(conn)
+        dependencies = {}
+    else:
+        dependencies = table_dependencies()
+
+    try:
+        load_tables(table_paths, dependencies, digests)
+    except Exception as exception:
+        # Validating the foreign keys against partially loaded tables would fail and hide this error. They stay
+        # saved in deferred_foreign_keys, and the next run loads the remaining files and then restores them.
+        print(f"Loading the tables failed, the foreign keys were not restored: {exception}")
+        raise
+    if DEFER_CONSTRAINTS:
+        restore_foreign_keys(conn)
+    index_and_analyze()
+    print(f"Restored the database in {time.perf_counter() - start:.1f}s")
+
+    cur.close()
+    conn.close()
+
 
-cur.close()
-conn.close()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from read_table_to_dataframe import connect, write_table_to_parquet
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", os.cpu_count()))  # Number of tables exported in parallel
+# Export every table, even if it hasn't changed since the last export
+EXPORT_ALL = os.getenv("EXPORT_ALL", "false").lower() == "true"
+
+export_path = Path(__file__).parent / "export"
+manifest_path = export_path / "manifest.json"
+
+# SQL query to fetch every table with its number of items, largest tables first
+tables_query = """
+SELECT t.id, t.title, t.updated_timestamp, COUNT(ti.id) AS item_count
+FROM tables t
+LEFT JOIN table_items ti ON ti.table_id = t.id
+GROUP BY t.id
+ORDER BY item_count DESC, t.id;
+"""
+
+
+def read_manifest():
+    # Return the manifest of the last export: table ID -> title, updated timestamp, file name and number of rows
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)["tables"]
+
+
+def write_manifest(manifest):
+    # Replace the manifest atomically, so that an interrupted export never leaves a broken manifest behind
+    temporary_path = manifest_path.with_suffix(".json.tmp")
+    with open(temporary_path, "w") as f:
+        json.dump({"tables": manifest}, f, indent=2, sort_keys=True)
+    os.replace(temporary_path, manifest_path)
+
+
+def is_up_to_date(entry, updated_timestamp):
+    return (
+        entry is not None
+        and entry["updated_timestamp"] == updated_timestamp
+        and (export_path / entry["file"]).exists()
+    )
+
+
+worker_conn = None
+
+
+def init_worker():
+    # Every worker process keeps its own connection to the database
+    global worker_conn
+    worker_conn = connect()
+
+
+def export_table(table_id, file_name):
+    # Write one table to a Parquet file in its own transaction and return the number of rows written. The file is
+    # written under a temporary name first, so that a file in the export directory is always complete.
+    path = export_path / file_name
+    temporary_path = path.with_suffix(".parquet.tmp")
+    with worker_conn:
+        row_count = write_table_to_parquet(worker_conn, table_id, temporary_path)
+    os.replace(temporary_path, path)
+    return row_count
+
+
+def export_tables():
+    export_path.mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest()
+
+    conn = connect()
+    with conn, conn.cursor() as cur:
+        cur.execute(tables_query)
+        tables = cur.fetchall()
+    conn.close()
+
+    # Forget the tables that no longer exist
+    table_ids = {table_id for table_id, _, _, _ in tables}
+    for table_id in set(manifest) - table_ids:
+        (export_path / manifest.pop(table_id)["file"]).unlink(missing_ok=True)
+
+    tables_to_export = []
+    for table_id, title, updated_timestamp, _ in tables:
+        updated_timestamp = updated_timestamp.isoformat() if updated_timestamp else None
+        if EXPORT_ALL or not is_up_to_date(manifest.get(table_id), updated_timestamp):
+            tables_to_export.append((table_id, title, updated_timestamp))
+    print(f"Exporting {len(tables_to_export)} of {len(tables)} tables ({len(tables) - len(tables_to_export)} unchanged)")
+
+    # The largest tables are submitted first, so that the workers aren't left waiting on one large table at the end.
+    # The manifest is updated after every table, so an interrupted export resumes where it stopped.
+    start = time.perf_counter()
+    failures = []
+    with ProcessPoolExecutor(max_workers=EXPORT_WORKERS, initializer=init_worker) as executor:
+        futures = {
+            executor.submit(export_table, table_id, f"{table_id}.parquet"): (table_id, title, updated_timestamp)
+            for table_id, title, updated_timestamp in tables_to_export
+        }
+        for future in as_completed(futures):
+            table_id, title, updated_timestamp = futures[future]
+            try:
+                row_count = future.result()
+            except Exception as exception:
+                print(f"  ✗ Failed to export table {title} ({table_id}): {exception}")
+                failures.append((table_id, title, exception))
+                continue
+            manifest[table_id] = {
+                "title": title,
+                "updated_timestamp": updated_timestamp,
+                "file": f"{table_id}.parquet",
+                "rows": row_count,
+            }
+            write_manifest(manifest)
+            print(f"  ✓ {title}: {row_count} rows")
+
+    write_manifest(manifest)
+    print(f"Exported {len(tables_to_export) - len(failures)} tables in {time.perf_counter() - start:.1f}s")
+    return failures
+
+
+def main():
+    failures = export_tables()
+    if failures:
+        raise SystemExit(f"{len(failures)} tables could not be exported")
+
+
+if __name__ == "__main__":
+    main()
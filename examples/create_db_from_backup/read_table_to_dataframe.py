@@ -1,18 +1,24 @@
 import os
+import numpy as np
 import psycopg2
 import pandas as pd
 
 # Define the table_id to filter on
 table_id = '02a32f95-8242-4c87-b725-14824c53f316'  # Replace with your actual UUID
 
-# Connect to PostgreSQL using environment variables
-conn = psycopg2.connect(
-    host=os.getenv("DB_HOST", "localhost"),
-    port=os.getenv("DB_PORT", "5432"),
-    dbname=os.getenv("DB_DATABASE"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD")
-)
+# Number of rows fetched from the database at a time when streaming a table
+ITERSIZE = 20_000
+
+
+def connect():
+    # Connect to PostgreSQL using environment variables
+    return psycopg2.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        port=os.getenv("DB_PORT", "5432"),
+        dbname=os.getenv("DB_DATABASE"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD")
+    )
 
 # SQL query to fetch the data of a single table by its ID
 query = """
@@ -40,52 +46,162 @@ WHERE t.id = %s
 ORDER BY ti.title, tpr.rank, tp.rank;
 """
 
-# Load query results into DataFrame
-df_long = pd.read_sql_query(query, conn, params=[table_id])
-
-# Consolidate the values into one column
-def coalesce_value(row):
-    return (
-        row["quantity"] if pd.notnull(row["quantity"]) else
-        row["text"] if pd.notnull(row["text"]) else
-        row["boolean"] if pd.notnull(row["boolean"]) else
-        row["enum"] if pd.notnull(row["enum"]) else
-        row["link"]
+# SQL query to fetch the protocol and parameter columns of a single table by its ID
+columns_query = """
+SELECT
+    tpr.rank AS protocol_rank,
+    tp.rank AS parameter_rank,
+    tpr.title AS protocol,
+    COALESCE(tp.title, ti3.title) AS parameter,
+    tp.value_type
+FROM table_protocols tpr
+JOIN table_parameters tp ON tp.table_protocol_id = tpr.id
+LEFT JOIN table_items ti3 ON ti3.id = tp.title_table_item_id
+WHERE tpr.table_id = %s;
+"""
+
+
+def coalesce_values(df_long):
+    # Consolidate the values into one column: the quantity, or else the text, boolean, enum or link value
+    value = df_long["quantity"].astype(object)
+    for column in ["text", "boolean", "enum", "link"]:
+        value = value.where(value.notna(), df_long[column])
+    return value.infer_objects()
+
+
+def format_column_names(protocols, parameters):
+    # Return the "protocol | parameter" names of columns; a missing protocol or parameter title is written "None",
+    # whether it comes from the database as None or from pandas as NaN, so names built from query results and from
+    # grouped values always match
+    def titles(values):
+        values = pd.Series(values, dtype=object)
+        return values.where(values.notna(), "None").astype(str).to_numpy()
+    return pd.Index(titles(protocols) + " | " + titles(parameters))
+
+
+def pivot_table_values(df_long, columns=None):
+    # Convert the long presentation of the values to a standard table: one row per item (sorted by title) and one
+    # "protocol | parameter" column per parameter, ordered by the protocol and parameter ranks. If several values
+    # fall into the same cell, the first one is kept. Columns without any value are dropped, unless the columns are
+    # given, in which case the table has exactly these columns.
+    values = coalesce_values(df_long).to_numpy()
+    has_value = pd.notna(values) & df_long["title"].notna().to_numpy()
+
+    # Number the columns in the order of (protocol rank, parameter rank, protocol, parameter)
+    key_columns = ["protocol_rank", "parameter_rank", "protocol", "parameter"]
+    groups = df_long.groupby(key_columns, sort=True, dropna=False)
+    keys = groups.size().index
+    column_names = format_column_names(keys.get_level_values("protocol"), keys.get_level_values("parameter"))
+    name_codes, column_order = pd.factorize(column_names)
+    column_codes = name_codes[groups.ngroup().to_numpy()][has_value]
+    if columns is None:
+        # Drop the columns without any value
+        has_column = np.zeros(len(column_order), dtype=bool)
+        has_column[column_codes] = True
+        column_codes = (np.cumsum(has_column) - 1)[column_codes]
+        column_order = column_order[has_column]
+    else:
+        column_positions = pd.Index(columns).get_indexer(column_order)
+        missing = column_order[np.unique(column_codes[column_positions[column_codes] < 0])]
+        if len(missing):
+            raise ValueError(f"The values have columns that are not in the given columns: {list(missing)}")
+        column_codes = column_positions[column_codes]
+        column_order = pd.Index(columns)
+    title_codes, titles = pd.factorize(df_long["title"].to_numpy()[has_value], sort=True)
+
+    # Place each value in its cell with index arithmetic, keeping the first value of every cell
+    cells = title_codes.astype(np.int64) * len(column_order) + column_codes
+    first = ~pd.Series(cells).duplicated().to_numpy()
+    values = values[has_value]
+    grid = np.full(len(titles) * len(column_order), np.nan, dtype=float if values.dtype == float else object)
+    grid[cells[first]] = values[first]
+
+    df_wide = pd.DataFrame(grid.reshape(len(titles), len(column_order)), columns=column_order)
+    df_wide.insert(0, "title", titles)
+    return df_wide
+
+
+def read_table_columns(conn, table_id):
+    # Return the "protocol | parameter" columns of a table in display order, with the value type of each column
+    df_columns = pd.read_sql_query(columns_query, conn, params=[table_id])
+    df_columns = df_columns.sort_values(["protocol_rank", "parameter_rank", "protocol", "parameter"])
+    names = format_column_names(df_columns["protocol"], df_columns["parameter"])
+    return dict(zip(names, df_columns["value_type"]))
+
+
+def iter_table_chunks(conn, table_id, columns, itersize=ITERSIZE):
+    # Stream the values of a table with a server-side cursor and yield the table in chunks of items, each with the
+    # given columns. The query is ordered by title, so all the values of an item are in consecutive rows; the rows of
+    # the last title of each batch are kept back until the next batch, so that an item is never split between
+    # chunks. Memory use is proportional to itersize, not to the size of the table.
+    with conn.cursor(name="table_values_cursor") as cur:
+        cur.itersize = itersize
+        cur.execute(query, (table_id,))
+        pending = []
+        while True:
+            rows = cur.fetchmany(itersize)
+            if not rows:
+                if pending:
+                    yield pivot_table_values(pd.DataFrame(pending, columns=column_names), columns)
+                break
+            column_names = [column.name for column in cur.description]
+            rows = pending + rows
+            split = len(rows)
+            while split > 0 and rows[split - 1][0] == rows[-1][0]:
+                split -= 1
+            pending, rows = rows[split:], rows[:split]
+            if rows:
+                yield pivot_table_values(pd.DataFrame(rows, columns=column_names), columns)
+
+
+def read_table(conn, table_id, itersize=ITERSIZE):
+    # Read a table into a wide DataFrame by streaming it, which gives the same result as pivoting the whole query
+    # result with pivot_table_values but needs a fraction of the memory
+    columns = list(read_table_columns(conn, table_id))
+    chunks = list(iter_table_chunks(conn, table_id, columns, itersize))
+    if not chunks:
+        return pd.DataFrame(columns=["title"])
+    df_wide = pd.concat(chunks, ignore_index=True)
+    df_wide = df_wide.sort_values("title", kind="stable", ignore_index=True)
+    return df_wide.dropna(axis="columns", how="all")
+
+
+def write_table_to_parquet(conn, table_id, path, itersize=ITERSIZE):
+    # Stream a table into a Parquet file, one row group per chunk of items, and return the number of rows written.
+    # Quantity columns are stored as floats, boolean columns as booleans and all other columns as strings.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    column_types = read_table_columns(conn, table_id)
+    arrow_types = {"QUANTITY": pa.float64(), "BOOLEAN": pa.bool_()}
+    schema = pa.schema(
+        [("title", pa.string())] +
+        [(name, arrow_types.get(value_type, pa.string())) for name, value_type in column_types.items()]
     )
+    row_count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in iter_table_chunks(conn, table_id, list(column_types), itersize):
+            arrays = []
+            for field in schema:
+                values = chunk[field.name].to_numpy(dtype=object)
+                if field.type == pa.string():
+                    values = np.array([value if pd.isna(value) else str(value) for value in values], dtype=object)
+                arrays.append(pa.array(values, type=field.type, from_pandas=True))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            row_count += len(chunk)
+    return row_count
+
+
+def main():
+    conn = connect()
+
+    # Stream the query results into a wide DataFrame. For small tables, you can also load the whole query result
+    # with pd.read_sql_query(query, conn, params=[table_id]) and pivot it with pivot_table_values.
+    df_wide = read_table(conn, table_id)
+
+    # Preview the result
+    print(df_wide.head())
+
 
-df_long["value"] = df_long.apply(coalesce_value, axis=1)
-
-# Construct a multi-index header using rank for sorting of the protocols and parameters
-df_long["column_key"] = list(zip(
-    df_long["protocol_rank"], 
-    df_long["parameter_rank"], 
-    df_long["protocol"], 
-    df_long["parameter"]
-))
-
-# Sort the unique headers by rank
-column_order = sorted(df_long["column_key"].unique())
-
-# Create a mapping from (protocol, parameter) to ordered column name
-col_name_map = {
-    key: f"{key[2]} | {key[3]}"  # use protocol | parameter for display
-    for key in column_order
-}
-
-# Map the column_key to final column names
-df_long["protocol_parameter"] = df_long["column_key"].map(col_name_map)
-
-# Pivot to wide format
-df_wide = df_long.pivot_table(
-    index="title",
-    columns="protocol_parameter",
-    values="value",
-    aggfunc="first"
-).reset_index()
-
-# Enforce column order: "title" first, then ranked protocol-parameter columns
-ordered_columns = ["title"] + [col_name_map[key] for key in column_order]
-df_wide = df_wide[[col for col in ordered_columns if col in df_wide.columns]]
-
-# Preview the result
-print(df_wide.head())
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+bench_local_parser.py
+
+Compares running the `keithley_iv` parser on a directory of synthetic I-V sweep files with
+`local_parser.parse_directory` (sequentially and in a pool of processes) with a plain Python
+parser that reads the files row by row with the `csv` module. It also checks that:
+
+- both parsers give the same columns and metadata for every file;
+- files with non-numeric values are reported as failures without stopping the others;
+- a footer that the parser doesn't expect is rejected, and read when it is expected.
+
+Run it from the example directory:
+
+    python benchmarks/bench_local_parser.py [number of files]
+"""
+
+import copy
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from local_parser import parse_content, parse_directory  # noqa: E402
+
+PARSER_PATH = Path(__file__).resolve().parent.parent / "new_parsers" / "keithley_iv.json"
+N_ROWS = 500  # Rows per synthetic file
+BROKEN_EVERY = 250  # Every this many files, one has a non-numeric value
+
+
+def write_files(directory: str, count: int) -> None:
+    rng = np.random.default_rng(0)
+    voltages = np.linspace(-1.0, 1.0, N_ROWS)
+    for index in range(count):
+        currents = voltages / rng.uniform(10, 100) + rng.normal(0, 1e-4, N_ROWS)
+        rows = "\n".join(f"{voltage:.4f},{current:.6g}" for voltage, current in zip(voltages, currents))
+        if index % BROKEN_EVERY == BROKEN_EVERY - 1:
+            rows = rows.replace("\n", "\nn/a,n/a\n", 1)
+        with open(os.path.join(directory, f"sweep_{index:05d}.csv"), "w") as f:
+            f.write(f"# Instrument: Keithley 2450 SourceMeter\n# Sample: S{index}\nVoltage (V),Current (A)\n{rows}\n")
+
+
+def parse_with_csv(file_path: str) -> dict:
+    """Parse a Keithley file row by row, as a plain Python parser would."""
+    metadata, voltages, currents, resistances = {}, [], [], []
+    with open(file_path, newline="") as f:
+        reader = csv.reader(f)
+        for row in reader:
+            if row[0].startswith("#"):
+                key, value = row[0].lstrip("#").split(":", 1)
+                metadata[key.strip()] = value.strip()
+            elif row[0] == "Voltage (V)":
+                continue
+            else:
+                voltage, current = float(row[0]), float(row[1])
+                voltages.append(voltage)
+                currents.append(current)
+                resistances.append(voltage / current if current else float("inf"))
+    return {"metadata": metadata, "columns": {"Voltage": voltages, "Current": currents, "Resistance": resistances}}
+
+
+def main():
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with open(PARSER_PATH, encoding="utf-8") as f:
+        parser = json.load(f)
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_files(directory, n_files)
+        file_paths = sorted(str(path) for path in Path(directory).iterdir())
+
+        start = time.perf_counter()
+        expected = {}
+        for file_path in file_paths:
+            try:
+                expected[file_path] = parse_with_csv(file_path)
+            except ValueError as exception:
+                expected[file_path] = exception
+        elapsed = time.perf_counter() - start
+        print(f"{'csv module, row by row':<36} {n_files / elapsed:>8.0f} files/sec")
+
+        for workers in sorted({1, os.cpu_count()}):
+            start = time.perf_counter()
+            results = parse_directory(parser, directory, workers)
+            elapsed = time.perf_counter() - start
+            print(f"{f'parse_directory ({workers} workers)':<36} {n_files / elapsed:>8.0f} files/sec")
+
+            assert [file_path for file_path, _ in results] == file_paths
+            for file_path, result in results:
+                if isinstance(expected[file_path], Exception):
+                    assert isinstance(result, ValueError), file_path
+                    continue
+                assert result["metadata"] == expected[file_path]["metadata"]
+                for name, values in expected[file_path]["columns"].items():
+                    assert np.allclose(result["columns"][name], values), (file_path, name)
+        assert sum(isinstance(result, Exception) for _, result in results) == n_files // BROKEN_EVERY
+
+    content = "# Instrument: Keithley 2450\nVoltage (V),Current (A)\n0.1,0.002\n0.2,0.004\nEnd of sweep\n"
+    try:
+        parse_content(parser, content)
+    except ValueError as exception:
+        assert "footer" in str(exception)
+    else:
+        raise AssertionError("An unexpected footer was not rejected")
+    footer_parser = copy.deepcopy(parser)
+    footer_parser["parserConfiguration"]["footerExpected"] = True
+    parsed = parse_content(footer_parser, content)
+    assert parsed["footer"] == ["End of sweep"] and parsed["columns"]["Resistance"].tolist() == [50.0, 50.0]
+
+    print("Both parsers give the same columns and metadata; broken files and footers are handled as expected.")
+
+
+if __name__ == "__main__":
+    main()
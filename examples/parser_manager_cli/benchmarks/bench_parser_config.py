@@ -0,0 +1,132 @@
+"""
+bench_parser_config.py
+
+Compares validating a directory of thousands of parser configurations with
+`jsonschema.validate`, which checks the schema and builds a new validator for every file, with
+the validator of `parser_config.py`, built once, in one process and in a pool of processes. It
+reports the time of each, and checks that all of them reject the same files and that
+`parser_config.py` reports the problem of each kind of invalid configuration:
+
+- a viewType that isn't a string, a missing columnNameInResult, an empty computed column
+  function or a flag that isn't a boolean (schema errors);
+- a computed column using an unknown column, computed columns depending on each other or a
+  duplicated result name (references between fields);
+- a file that isn't valid JSON.
+
+Configurations with fields, view types and functions that the schema doesn't know are valid.
+
+Run it from the example directory:
+
+    python benchmarks/bench_parser_config.py [number of configurations]
+"""
+
+import copy
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import jsonschema
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from computed_columns import order_computed_columns  # noqa: E402
+from parser_config import PARSER_SCHEMA, VALIDATE_WORKERS, read_parser_configs  # noqa: E402
+
+EXAMPLE_CONFIG_PATH = Path(__file__).resolve().parent.parent / "new_parsers" / "keithley_iv.json"
+INVALID_EVERY = 10  # One configuration in this many is invalid
+
+
+def _configuration(config: dict) -> dict:
+    return config["parserConfiguration"]
+
+
+# (change, part of the expected message) for every kind of invalid configuration
+INVALID_CHANGES = [
+    (lambda config: config.update(viewType=3), "viewType: 3 is not of type 'string'"),
+    (lambda config: _configuration(config)["configurationColumns"][0].pop("columnNameInResult"),
+     "configurationColumns[0]: 'columnNameInResult' is a required property"),
+    (lambda config: _configuration(config)["computedColumns"][0].update(function=""),
+     "computedColumns[0].function: '' should be non-empty"),
+    (lambda config: _configuration(config).update(metadataExpected="yes"),
+     "metadataExpected: 'yes' is not of type 'boolean'"),
+    (lambda config: _configuration(config)["computedColumns"][0].update(inputColumnNames=["Voltage", "Temperature"]),
+     "uses the unknown columns ['Temperature']"),
+    (lambda config: _configuration(config)["computedColumns"].append(
+        {"inputColumnNames": ["Resistance"], "function": "ADD", "computedColumnName": "Voltage"}),
+     "'Voltage' is defined twice"),
+    (lambda config: _configuration(config)["computedColumns"].append(
+        {"inputColumnNames": ["Resistance", "Loop"], "function": "ADD", "computedColumnName": "Loop"}),
+     "Loop -> Loop"),
+    (lambda config: _configuration(config)["configurationColumns"][1].update(columnNameInResult="Voltage"),
+     "'Voltage' is already the result name of column 0"),
+]
+
+
+def validate_with_jsonschema(paths: list[str]) -> set[str]:
+    invalid = set()
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8") as config_file:
+                config = json.load(config_file)
+            jsonschema.validate(config, PARSER_SCHEMA)
+            result_names = [column["columnNameInResult"] for column in _configuration(config)["configurationColumns"]]
+            order_computed_columns(_configuration(config).get("computedColumns") or [], result_names)
+        except (ValueError, jsonschema.ValidationError):
+            invalid.add(path)
+    return invalid
+
+
+def measure(label: str, validate):
+    start = time.perf_counter()
+    result = validate()
+    print(f"{label:<40} {time.perf_counter() - start:>6.2f} s")
+    return result
+
+
+def main():
+    n_configs = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    with open(EXAMPLE_CONFIG_PATH, encoding="utf-8") as config_file:
+        example = json.load(config_file)
+
+    with tempfile.TemporaryDirectory() as folder:
+        expected_errors = {}
+        for index in range(n_configs):
+            path = os.path.join(folder, f"parser_{index:05d}.json")
+            config = {**copy.deepcopy(example), "name": f"parser_{index:05d}"}
+            kind = index // INVALID_EVERY % (len(INVALID_CHANGES) + 1)
+            with open(path, "w", encoding="utf-8") as config_file:
+                if index % INVALID_EVERY:
+                    if index % 2:
+                        # Fields, view types and functions that only the API knows about
+                        config.update(viewType="VIEW_OTHER", headerRowIndex=2)
+                        _configuration(config)["computedColumns"][0]["function"] = "LOG"
+                    json.dump(config, config_file)
+                elif kind == len(INVALID_CHANGES):
+                    config_file.write(json.dumps(config)[:-10])
+                    expected_errors[path] = "not valid JSON"
+                else:
+                    change, expected_errors[path] = INVALID_CHANGES[kind]
+                    change(config)
+                    json.dump(config, config_file)
+
+        paths = sorted(str(path) for path in Path(folder).glob("*.json"))
+        naive_invalid = measure("jsonschema.validate per file", lambda: validate_with_jsonschema(paths))
+        configs, failures = measure("validator built once, 1 process", lambda: read_parser_configs(folder, 1))
+        workers = max(2, VALIDATE_WORKERS)  # Always check the pool of processes, even on a single CPU
+        parallel = measure(f"validator built once, {workers} processes", lambda: read_parser_configs(folder, workers))
+
+    assert naive_invalid == {path for path, _ in failures} == set(expected_errors)
+    assert parallel[0] == configs and [path for path, _ in parallel[1]] == [path for path, _ in failures]
+    assert len(configs) == n_configs - len(expected_errors)
+    for path, exception in failures:
+        assert expected_errors[path] in str(exception), (expected_errors[path], str(exception))
+
+    print(f"All validations reject the same {len(failures)} of {n_configs} configurations, with the expected "
+          "messages.")
+
+
+if __name__ == "__main__":
+    main()
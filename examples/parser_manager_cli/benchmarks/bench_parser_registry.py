@@ -0,0 +1,113 @@
+"""
+bench_parser_registry.py
+
+Compares menu actions of the CLI that download the whole parser listing every time (as
+`main.py` used to do at the top of every menu iteration) with the parser registry of
+`mz_operations.py`, against a local stub API with many parsers and some latency per request. It
+reports the time, requests and bytes downloaded of each, and checks that:
+
+- the registry returns the same parsers as the listing;
+- a registry loaded from disk revalidates the listing with 304 responses and no bodies;
+- parsers created, updated and deleted through `mz_operations.py` show up without a request, and
+  revalidating afterwards only downloads the pages that changed.
+
+Run it from the example directory:
+
+    python benchmarks/bench_parser_registry.py
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import mz_api_helpers  # noqa: E402
+import mz_operations  # noqa: E402
+from mz_api_helpers import PAGE_SIZE, MZClient, get  # noqa: E402
+from mz_operations import ParserRegistry  # noqa: E402
+from stub_server import StubAPIServer  # noqa: E402
+
+N_PARSERS = 3_000
+N_ACTIONS = 50
+N_PAGES = N_PARSERS // PAGE_SIZE + 1  # The listing ends with the first page that isn't full
+LATENCY = 0.02  # Seconds added by the stub server to every request
+PARSERS = [{"id": f"parser-{index}", "code": f"MZ-PR-{index:05d}", "name": f"Parser {index}",
+            "systemParser": index % 3 == 0, "description": "x" * 200,
+            "parserConfiguration": {"configurationColumns": [{"columnNameInFile": f"Column {column}",
+                                                              "columnNameInResult": f"Column {column}"}
+                                                             for column in range(5)]}}
+           for index in range(N_PARSERS)]
+
+
+def menu_actions_with_full_listing() -> list[dict | None]:
+    found = []
+    for index in range(N_ACTIONS):
+        all_parsers = get("/parsers")
+        found.append(next((parser for parser in all_parsers if parser.get("code") == f"MZ-PR-{index * 7:05d}"),
+                          None))
+    return found
+
+
+def menu_actions_with_registry() -> list[dict | None]:
+    return [mz_operations.find_parser_by_code(f"MZ-PR-{index * 7:05d}") for index in range(N_ACTIONS)]
+
+
+def measure(label: str, server: StubAPIServer, actions) -> list:
+    server.reset_counts()
+    start = time.perf_counter()
+    results = actions()
+    elapsed = time.perf_counter() - start
+    counts = ", ".join(f"{count} x {status}" for status, count in sorted(server.status_counts.items()))
+    print(f"{label:<40} {elapsed:>6.2f} s {counts:<24} {server.bytes_sent / 1e6:>8.2f} MB downloaded")
+    return results
+
+
+def main():
+    with tempfile.TemporaryDirectory() as folder, StubAPIServer(PARSERS, latency=LATENCY) as server:
+        mz_api_helpers.API_KEY = "stub-api-key"
+        mz_api_helpers.set_client(MZClient(base_url=server.base_url, headers={"authorization": "stub-api-key"},
+                                           max_retries=0))
+        registry_path = os.path.join(folder, "parser_registry.json")
+
+        expected = measure("full listing per action", server, menu_actions_with_full_listing)
+        mz_operations.set_registry(ParserRegistry(registry_path))
+        found = measure("registry, first run", server, menu_actions_with_registry)
+        assert found == expected and all(parser is not None for parser in found)
+        assert server.status_counts == {200: N_PAGES}
+
+        # A new run loads the listing from disk and revalidates every page without downloading it
+        mz_operations.set_registry(ParserRegistry(registry_path))
+        found = measure("registry, next run", server, menu_actions_with_registry)
+        assert found == expected
+        assert server.status_counts == {304: N_PAGES} and server.bytes_sent == 0
+
+        # Writes through mz_operations update the registry without listing the parsers again
+        server.reset_counts()
+        with contextlib.redirect_stdout(io.StringIO()):
+            created = mz_operations.create_parser({"name": "New parser"})
+            mz_operations.update_parser(PARSERS[-1]["id"], {"name": "Renamed parser"})
+            assert mz_operations.find_parser_by_code(created["code"])["name"] == "New parser"
+            assert mz_operations.find_parser_by_code(PARSERS[-1]["code"])["name"] == "Renamed parser"
+            mz_operations.delete_parser(created["id"])
+            assert mz_operations.find_parser_by_code(created["code"]) is None
+        assert sum(server.status_counts.values()) == 3
+
+        # Only the page of the renamed parser changed, so revalidating downloads it again and nothing else
+        mz_operations.invalidate_registry()
+        found = measure("registry, after changes", server, menu_actions_with_registry)
+        assert found == expected
+        assert server.status_counts == {304: N_PAGES - 1, 200: 1}
+        assert mz_operations.get_all_parsers() == [parser for page in mz_api_helpers.iter_pages("/parsers")
+                                                   for parser in page]
+
+    print("The registry returns the same parsers, revalidates unchanged pages and follows the changes made "
+          "through mz_operations.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+bench_parser_sync.py
+
+Compares syncing a directory of parser configurations one parser at a time (as the menu of
+`main.py` does) with the concurrent `sync_parsers` of `mz_operations.py`, against a local stub
+API with some latency per request. The directory has new, changed and unchanged
+configurations, and the server has organization parsers without a configuration and system
+parsers. It reports the time and requests of each, and checks that:
+
+- the dry run plan finds the right changes and makes no changes on the server;
+- both syncs leave the server with the same parsers, matching the configurations;
+- planning again after a sync finds nothing to change.
+
+Run it from the example directory:
+
+    python benchmarks/bench_parser_sync.py
+"""
+
+import json
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import mz_api_helpers  # noqa: E402
+import mz_operations  # noqa: E402
+from mz_api_helpers import MZClient  # noqa: E402
+from mz_operations import ParserRegistry, plan_parser_sync, sync_parsers  # noqa: E402
+from parser_config import read_parser_configs  # noqa: E402
+from stub_server import StubAPIServer  # noqa: E402
+
+N_CONFIGS = 300
+N_NEW = 100  # Configurations without a parser on the server
+N_CHANGED = 100  # Configurations whose parser on the server has a different description
+N_EXTRA = 20  # Organization parsers without a configuration, deleted by the sync
+N_SYSTEM = 500
+LATENCY = 0.05  # Seconds added by the stub server to every request
+
+
+def make_config(index: int) -> dict:
+    return {"name": f"parser_{index:03d}", "description": f"Parser number {index}",
+            "supportedFileExtensions": ["csv"], "viewType": "VIEW_2D_CUSTOM_AXES",
+            "parserConfiguration": {"configurationColumns": [{"columnNameInFile": f"Column {column}",
+                                                              "columnNameInResult": f"Column {column}", "unit": "V"}
+                                                             for column in range(3)],
+                                    "computedColumns": [], "metadataExpected": True, "footerExpected": False}}
+
+
+def make_server_parsers() -> list[dict]:
+    parsers = []
+    for index in range(N_NEW, N_CONFIGS):
+        # The server returns the configuration with its own fields, which are not changes
+        parser = {**make_config(index), "id": f"parser-{index}", "code": f"MZ-PR-{index:05d}", "systemParser": False}
+        parser["parserConfiguration"] = {**parser["parserConfiguration"], "headerRowIndex": None}
+        if index < N_NEW + N_CHANGED:
+            parser["description"] = "Outdated description"
+        parsers.append(parser)
+    parsers += [{**make_config(N_CONFIGS + index), "id": f"extra-{index}", "code": f"MZ-PR-X{index:04d}",
+                 "systemParser": False} for index in range(N_EXTRA)]
+    parsers += [{**make_config(index), "id": f"system-{index}", "code": f"MZ-PR-S{index:04d}", "systemParser": True}
+                for index in range(N_SYSTEM)]
+    return parsers
+
+
+def sync(label: str, server: StubAPIServer, configs: dict[str, dict], workers: int) -> dict[str, str]:
+    mz_api_helpers.set_client(MZClient(base_url=server.base_url, headers={"authorization": "stub-api-key"},
+                                       max_retries=0))
+    mz_operations.set_registry(ParserRegistry(None))
+    server.reset_counts()
+    start = time.perf_counter()
+    changes = plan_parser_sync(configs, delete_missing=True)
+    failures = sync_parsers(configs, changes, workers)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed:>6.2f} s {sum(server.status_counts.values()):>5} requests")
+    assert not failures, failures
+
+    plan = plan_parser_sync(configs, delete_missing=True)
+    assert all(change["action"] == "unchanged" for change in plan), plan
+    return {parser["name"]: parser["description"] for parser in mz_operations.get_all_parsers()
+            if not parser.get("systemParser")}
+
+
+def main():
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as folder:
+        for index in range(N_CONFIGS):
+            with open(Path(folder, f"parser_{index:03d}.json"), "w", encoding="utf-8") as config_file:
+                json.dump(make_config(index), config_file)
+        configs, read_failures = read_parser_configs(folder)
+        assert len(configs) == N_CONFIGS and not read_failures
+
+        with StubAPIServer(make_server_parsers(), latency=LATENCY) as server:
+            mz_api_helpers.API_KEY = "stub-api-key"
+            mz_api_helpers.set_client(MZClient(base_url=server.base_url, headers={"authorization": "stub-api-key"},
+                                               max_retries=0))
+            mz_operations.set_registry(ParserRegistry(None))
+            plan = plan_parser_sync(configs, delete_missing=True)
+            actions = [change["action"] for change in plan]
+            assert actions.count("create") == N_NEW and actions.count("update") == N_CHANGED
+            assert actions.count("unchanged") == N_CONFIGS - N_NEW - N_CHANGED
+            assert actions.count("delete") == N_EXTRA and "error" not in actions
+            assert all(change["fields"] == ["description"] for change in plan if change["action"] == "update")
+            assert plan_parser_sync(configs, delete_missing=True) == plan, "The dry run plan made changes on the server"
+
+            one_by_one = sync("one parser at a time", server, configs, workers=1)
+
+        with StubAPIServer(make_server_parsers(), latency=LATENCY) as server:
+            concurrent = sync(f"sync_parsers, {mz_operations.SYNC_WORKERS} workers", server, configs,
+                              mz_operations.SYNC_WORKERS)
+
+    assert one_by_one == concurrent == {config["name"]: config["description"] for config in configs.values()}
+    print("Both syncs leave the server with the configurations of the directory, and nothing to change afterwards.")
+
+
+if __name__ == "__main__":
+    main()
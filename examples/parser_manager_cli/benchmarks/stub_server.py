@@ -0,0 +1,127 @@
+"""
+stub_server.py
+
+A minimal local stand-in for the parser endpoints of the MaterialsZone API, used by the
+benchmarks in this folder.
+
+It keeps a list of parsers in memory and answers every request with a `{"data": ...}` JSON body
+like the real API: GET `/parsers` returns the page of the listing given by the `limit` and
+`offset` query parameters with an ETag header, or a 304 response without a body if the
+If-None-Match header of the request matches it. POST `/parsers` creates a parser with a new
+code, PATCH `/parsers/<id>` updates it and DELETE `/parsers/<id>` deletes it. The number of
+requests per status code and the number of response body bytes sent are counted in
+`status_counts` and `bytes_sent`, and an artificial latency can be injected to simulate the
+round trip to the real server.
+"""
+
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep connections alive between requests
+    disable_nagle_algorithm = True
+
+    def _respond(self, data: object, status: int = 200, headers: dict | None = None) -> None:
+        body = json.dumps({"data": data}).encode() if status != 304 else b""
+        with self.server.lock:
+            self.server.status_counts[status] += 1
+            self.server.bytes_sent += len(body)
+        time.sleep(self.server.latency)
+        self.send_response(status)
+        if body:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_payload(self) -> dict:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        return json.loads(body) if body else {}
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        offset = int(params.get("offset", 0))
+        with self.server.lock:
+            page = list(self.server.parsers.values())
+        page = page[offset:offset + int(params.get("limit", len(page)))]
+        etag = '"' + hashlib.sha256(json.dumps(page).encode()).hexdigest()[:32] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self._respond(None, status=304, headers={"ETag": etag})
+        else:
+            self._respond(page, headers={"ETag": etag})
+
+    def do_POST(self):
+        payload = self._read_payload()
+        parser_id = str(uuid.uuid4())
+        parser = {**payload, "id": parser_id, "code": f"MZ-PR-{parser_id[:8].upper()}", "systemParser": False}
+        with self.server.lock:
+            self.server.parsers[parser_id] = parser
+        self._respond(parser)
+
+    def do_PATCH(self):
+        payload = self._read_payload()
+        parser_id = self.path.rsplit("/", 1)[-1]
+        with self.server.lock:
+            parser = self.server.parsers[parser_id] = {**self.server.parsers[parser_id], **payload}
+        self._respond(parser)
+
+    def do_DELETE(self):
+        with self.server.lock:
+            self.server.parsers.pop(self.path.rsplit("/", 1)[-1], None)
+        self._respond({})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubAPIServer:
+    """Run the stub API on a random local port in a background thread.
+
+    Use it as a context manager; `base_url` can be passed to `MZClient`.
+    """
+
+    def __init__(self, parsers: list[dict], latency: float = 0.0):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.parsers = {parser["id"]: parser for parser in parsers}
+        self._server.latency = latency
+        self._server.status_counts = Counter()
+        self._server.bytes_sent = 0
+        self._server.lock = threading.Lock()
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def status_counts(self) -> Counter:
+        return self._server.status_counts
+
+    @property
+    def bytes_sent(self) -> int:
+        return self._server.bytes_sent
+
+    def reset_counts(self) -> None:
+        with self._server.lock:
+            self._server.status_counts.clear()
+            self._server.bytes_sent = 0
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,175 @@
+"""
+computed_columns.py
+
+This module compiles the `computedColumns` of a parser configuration into a plan that evaluates
+them on NumPy columns.
+
+Computed columns may use the columns of the file and other computed columns, in any order. The
+plan orders them by their dependencies, and rejects cycles, unknown functions and unknown input
+columns before any file is read. Every function is applied with the `out=` argument of the
+NumPy ufuncs, so a computed column with many inputs is accumulated in place instead of through
+one temporary array per input. Computed columns that are only needed to compute others share
+scratch buffers, which are kept between evaluations, and output arrays can be passed in to be
+filled again for the next file.
+"""
+from typing import Any
+
+import numpy as np
+
+# Functions of the computed columns, applied from left to right to the input columns
+FUNCTIONS = {
+    "ADD": np.add,
+    "SUBTRACT": np.subtract,
+    "MULTIPLY": np.multiply,
+    "DIVIDE": np.divide,
+}
+
+
+class ComputedColumnsPlan:
+    """The computed columns of a parser, compiled into steps in dependency order.
+
+    Each step applies a function to its input columns and writes the result to an output array, or to a scratch
+    buffer for the computed columns that are only inputs of others. A scratch buffer is reused by the next step as
+    soon as the column in it isn't needed any more. Build plans with `compile_computed_columns`. A plan keeps its
+    scratch buffers between evaluations, so it must not be shared between threads.
+    """
+
+    def __init__(self, steps: list[tuple[str, np.ufunc, list[str], int | None]], outputs: list[str],
+                 n_scratch: int):
+        self.steps = steps  # (name, function, input names, scratch buffer or None for outputs)
+        self.outputs = outputs
+        self.n_scratch = n_scratch
+        self._scratch: list[np.ndarray] = []
+
+    def evaluate(self, columns: dict[str, np.ndarray],
+                 out: dict[str, np.ndarray] | None = None) -> dict[str, np.ndarray]:
+        """Evaluate the computed columns on the given input columns and return the output columns.
+
+        The output columns are written to the arrays of `out` that have the right length (e.g. the results of the
+        previous file), and to new arrays otherwise. Divisions by zero give infinite or NaN values rather than
+        failing.
+        """
+        if not self.steps:
+            return {}
+        n_rows = len(columns[next(name for _, _, inputs, _ in self.steps for name in inputs if name in columns)])
+        if len(self._scratch) != self.n_scratch or self.n_scratch and len(self._scratch[0]) != n_rows:
+            self._scratch = [np.empty(n_rows) for _ in range(self.n_scratch)]
+        out = out or {}
+        values = dict(columns)
+        results = {}
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            for name, function, inputs, scratch in self.steps:
+                if scratch is not None:
+                    destination = self._scratch[scratch]
+                elif name in out and out[name].shape == (n_rows,) and out[name].dtype == np.float64:
+                    destination = results[name] = out[name]
+                else:
+                    destination = results[name] = np.empty(n_rows)
+                if len(inputs) == 1:
+                    np.copyto(destination, values[inputs[0]])
+                else:
+                    function(values[inputs[0]], values[inputs[1]], out=destination)
+                    for input_name in inputs[2:]:
+                        function(destination, values[input_name], out=destination)
+                values[name] = destination
+        return {name: results[name] for name in self.outputs}
+
+
+def _find_cycle(name: str, by_name: dict[str, dict[str, Any]], path: list[str]) -> list[str] | None:
+    for input_name in by_name[name]["inputColumnNames"]:
+        if input_name in path:
+            return path[path.index(input_name):] + [input_name]
+        if input_name in by_name:
+            cycle = _find_cycle(input_name, by_name, path + [input_name])
+            if cycle is not None:
+                return cycle
+    return None
+
+
+def order_computed_columns(computed_columns: list[dict[str, Any]], input_names: list[str],
+                           outputs: list[str] | None = None) -> list[str]:
+    """Return the names of the computed columns that `outputs` need (all of them by default), ordered so that every
+    column comes after its inputs.
+
+    Raise a ValueError if a computed column is defined twice, has no input columns, uses an unknown input column or
+    depends on itself. The functions aren't checked, so this also checks the columns of parsers that use functions
+    that can't be evaluated locally.
+    """
+    by_name = {}
+    for computed_column in computed_columns:
+        name = computed_column["computedColumnName"]
+        if name in by_name or name in input_names:
+            raise ValueError(f"Computed column {name!r} is defined twice")
+        if not computed_column["inputColumnNames"]:
+            raise ValueError(f"Computed column {name!r} has no input columns")
+        by_name[name] = computed_column
+    for name, computed_column in by_name.items():
+        missing = [input_name for input_name in computed_column["inputColumnNames"]
+                   if input_name not in by_name and input_name not in input_names]
+        if missing:
+            raise ValueError(f"Computed column {name!r} uses the unknown columns {missing}")
+    outputs = list(by_name) if outputs is None else outputs
+    unknown_outputs = [name for name in outputs if name not in by_name]
+    if unknown_outputs:
+        raise ValueError(f"The outputs {unknown_outputs} are not computed columns")
+
+    order, done = [], set()
+
+    def visit(name: str, path: list[str]) -> None:
+        if name in done:
+            return
+        if name in path:
+            cycle = _find_cycle(name, by_name, [name])
+            raise ValueError(f"The computed columns {' -> '.join(cycle)} depend on each other")
+        for input_name in by_name[name]["inputColumnNames"]:
+            if input_name in by_name:
+                visit(input_name, path + [name])
+        done.add(name)
+        order.append(name)
+
+    for name in outputs:
+        visit(name, [])
+    return order
+
+
+def compile_computed_columns(computed_columns: list[dict[str, Any]], input_names: list[str],
+                             outputs: list[str] | None = None) -> ComputedColumnsPlan:
+    """Compile the computed columns of a parser into a plan that evaluates them on columns named `input_names`.
+
+    `outputs` are the computed columns returned by the plan, all of them by default; the others are only computed
+    if an output needs them. Raise a ValueError if a computed column uses an unknown function, or for the problems
+    reported by `order_computed_columns`.
+    """
+    for computed_column in computed_columns:
+        if computed_column["function"] not in FUNCTIONS:
+            raise ValueError(f"Computed column {computed_column['computedColumnName']!r} uses the unknown function "
+                             f"{computed_column['function']!r}; the known functions are {', '.join(FUNCTIONS)}")
+    order = order_computed_columns(computed_columns, input_names, outputs)
+    by_name = {computed_column["computedColumnName"]: computed_column for computed_column in computed_columns}
+    outputs = list(by_name) if outputs is None else outputs
+
+    # Assign scratch buffers to the computed columns that aren't outputs, reusing the buffers of the columns that
+    # aren't needed by later steps
+    last_use = {input_name: index for index, name in enumerate(order)
+                for input_name in by_name[name]["inputColumnNames"]}
+    scratch_of, free, n_scratch = {}, [], 0
+    steps = []
+    for index, name in enumerate(order):
+        inputs = by_name[name]["inputColumnNames"]
+        released = [input_name for input_name in dict.fromkeys(inputs)
+                    if input_name in scratch_of and last_use[input_name] == index]
+        scratch = None
+        if name not in outputs:
+            # The result may overwrite one of the first two inputs, which are only read by the first operation
+            reusable = [input_name for input_name in released if input_name not in inputs[2:]]
+            if reusable:
+                scratch = scratch_of[reusable[0]]
+                released.remove(reusable[0])
+            elif free:
+                scratch = free.pop()
+            else:
+                scratch, n_scratch = n_scratch, n_scratch + 1
+            scratch_of[name] = scratch
+        free.extend(scratch_of[input_name] for input_name in released)
+        steps.append((name, FUNCTIONS[by_name[name]["function"]], list(inputs), scratch))
+    return ComputedColumnsPlan(steps, outputs, n_scratch)
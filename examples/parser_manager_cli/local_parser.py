@@ -0,0 +1,271 @@
+"""
+local_parser.py
+
+This module runs a parser configuration, like the ones in `new_parsers/`, on measurement files
+locally, so a parser can be checked and previewed on instrument files before it is created or
+updated on the MaterialsZone platform.
+
+A file is split into its metadata lines (before the header), the header, the data rows and its
+footer lines (after the data). The data rows are parsed at once into NumPy columns, the
+`configurationColumns` of the parser pick and rename the columns of the file, and the
+`computedColumns` are evaluated on whole columns, compiled once per parser by
+`computed_columns.py`. Whole directories are parsed in parallel in a pool of processes.
+
+Run it from the example directory to preview a parser on a file or a directory of files:
+
+    python local_parser.py new_parsers/keithley_iv.json measurement_files/keithley_iv.csv
+    python local_parser.py new_parsers/keithley_iv.json measurement_files/ --workers 4
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from computed_columns import ComputedColumnsPlan, compile_computed_columns
+
+DELIMITERS = (",", "\t", ";")  # Delimiters tried, in this order, when a file doesn't use a comma
+COMMENT_PREFIXES = "#!%"  # Characters stripped from the start of metadata lines
+METADATA_SEPARATORS = (":", "=")  # Separators between the keys and values of metadata lines
+PARSE_WORKERS = os.cpu_count()  # Number of processes parsing files in parallel in parse_directory
+PARSE_BATCH_SIZE = 64  # Maximum number of files parsed together by a parsing process
+PREVIEW_ROWS = 5  # Number of rows printed when previewing a file
+
+def _split_fields(line: str, delimiter: str) -> list[str]:
+    return [field.strip() for field in line.split(delimiter)]
+
+
+def _is_data_line(line: str, delimiter: str, n_fields: int | None = None) -> bool:
+    fields = _split_fields(line, delimiter)
+    if n_fields is not None and len(fields) != n_fields:
+        return False
+    try:
+        [float(field) for field in fields]
+    except ValueError:
+        return False
+    return True
+
+
+def _find_data(lines: list[str], delimiter: str) -> tuple[int, int] | None:
+    """Return the index of the first data row and the index after the last one, or None if there are none.
+
+    Only the lines around the data are checked one by one, the rows in between are left to the C parser.
+    """
+    start = next((index for index, line in enumerate(lines) if _is_data_line(line, delimiter)), None)
+    if start is None:
+        return None
+    n_fields = len(_split_fields(lines[start], delimiter))
+    end = len(lines)
+    while not _is_data_line(lines[end - 1], delimiter, n_fields):
+        end -= 1
+    return start, end
+
+
+def detect_delimiter(lines: list[str]) -> str:
+    """Return the delimiter that splits the middle line of a file, which is a data row in all but the shortest files,
+    into the most numeric values."""
+    middle_line = lines[len(lines) // 2] if lines else ""
+    numeric_delimiters = [delimiter for delimiter in DELIMITERS if _is_data_line(middle_line, delimiter)]
+    return max(numeric_delimiters, key=lambda delimiter: middle_line.count(delimiter), default=DELIMITERS[0])
+
+
+def parse_metadata(lines: list[str]) -> dict[str, str]:
+    """Return the metadata lines of a file as a map from keys to values, e.g. `# Instrument: Keithley 2450`.
+
+    Lines without a separator are kept as keys with an empty value.
+    """
+    metadata = {}
+    for line in lines:
+        line = line.lstrip(COMMENT_PREFIXES).strip()
+        if not line:
+            continue
+        positions = [position for position in map(line.find, METADATA_SEPARATORS) if position > 0]
+        if positions:
+            metadata[line[:min(positions)].strip()] = line[min(positions) + 1:].strip()
+        else:
+            metadata[line] = ""
+    return metadata
+
+
+def split_sections(content: str, metadata_expected: bool, footer_expected: bool,
+                   delimiter: str | None = None) -> dict[str, Any]:
+    """Split the content of a file into its metadata lines, header, data lines and footer lines.
+
+    The header is the line just before the first data row, unless that line is a comment (starts with one of
+    `COMMENT_PREFIXES`) or there is none. The delimiter is detected when it isn't given. Raise a ValueError if the
+    file has no data rows, or has metadata or a footer that the parser doesn't expect.
+    """
+    lines = [line for line in content.splitlines() if line.strip()]
+    delimiter = delimiter or detect_delimiter(lines)
+    data = _find_data(lines, delimiter)
+    if data is None:
+        raise ValueError("The file has no numeric data rows")
+    start, end = data
+    header = None
+    if start > 0 and not lines[start - 1].lstrip().startswith(tuple(COMMENT_PREFIXES)):
+        header = _split_fields(lines[start - 1], delimiter)
+    metadata_lines = lines[:start - 1 if header is not None else start]
+    footer_lines = lines[end:]
+    if metadata_lines and not metadata_expected:
+        raise ValueError(f"The file has {len(metadata_lines)} metadata lines before the header, but the parser "
+                         "doesn't expect metadata")
+    if footer_lines and not footer_expected:
+        raise ValueError(f"The file has {len(footer_lines)} footer lines after the data, but the parser doesn't "
+                         "expect a footer")
+    return {"delimiter": delimiter, "metadata_lines": metadata_lines, "header": header,
+            "data_lines": lines[start:end], "footer_lines": footer_lines}
+
+
+def _find_column(column: dict[str, Any], header: list[str] | None, n_columns: int) -> int:
+    name = column.get("columnNameInFile")
+    if name is not None and header is not None and name.strip() in header:
+        return header.index(name.strip())
+    index = column.get("columnIndexInFile")
+    if index is not None and 0 <= int(index) < n_columns:
+        return int(index)
+    if name is not None:
+        raise ValueError(f"Column {name!r} was not found in the header {header}")
+    raise ValueError(f"Column index {index} is out of range for a file with {n_columns} columns")
+
+
+def _result_name(column: dict[str, Any]) -> str:
+    return column.get("columnNameInResult") or column.get("columnNameInFile")
+
+
+def compile_parser(parser: dict[str, Any]) -> ComputedColumnsPlan:
+    """Compile the computed columns of a parser, raising a ValueError if they are invalid (see
+    `computed_columns.compile_computed_columns`)."""
+    configuration = parser.get("parserConfiguration") or {}
+    input_names = [_result_name(column) for column in configuration.get("configurationColumns") or []]
+    return compile_computed_columns(configuration.get("computedColumns") or [], input_names)
+
+
+def parse_content(parser: dict[str, Any], content: str,
+                  plan: ComputedColumnsPlan | None = None) -> dict[str, Any]:
+    """Run a parser on the content of a file and return the parsed file.
+
+    `parser` is a parser configuration like the ones in `new_parsers/`, and `plan` its compiled computed columns,
+    which are compiled here if not given. The parsed file is a dictionary with the metadata as a map from keys to
+    values, the result columns (configured, then computed) as a map from names to float64 arrays, the units of the
+    result columns and the footer lines.
+    """
+    plan = plan or compile_parser(parser)
+    configuration = parser.get("parserConfiguration") or {}
+    sections = split_sections(content, bool(configuration.get("metadataExpected")),
+                              bool(configuration.get("footerExpected")))
+    data = np.loadtxt(sections["data_lines"], delimiter=sections["delimiter"], ndmin=2)
+
+    columns, units = {}, {}
+    for column in configuration.get("configurationColumns") or []:
+        name = _result_name(column)
+        columns[name] = data[:, _find_column(column, sections["header"], data.shape[1])]
+        units[name] = column.get("unit")
+    computed_columns = configuration.get("computedColumns") or []
+    columns.update(plan.evaluate(columns))
+    units.update({column["computedColumnName"]: column.get("unit") for column in computed_columns})
+
+    return {"metadata": parse_metadata(sections["metadata_lines"]), "columns": columns, "units": units,
+            "footer": sections["footer_lines"]}
+
+
+def parse_file(parser: dict[str, Any], file_path: str,
+               plan: ComputedColumnsPlan | None = None) -> dict[str, Any]:
+    """Run a parser on a file and return the parsed file (see `parse_content`)."""
+    with open(file_path, encoding="utf-8", errors="replace") as f:
+        return parse_content(parser, f.read(), plan)
+
+
+def parse_files(file_paths: list[str], parser: dict[str, Any]) -> list[dict[str, Any] | Exception]:
+    """Run a parser on a batch of files in a parsing process and return the parsed file (or the exception raised
+    for it) for every file."""
+    plan = compile_parser(parser)
+    results = []
+    for file_path in file_paths:
+        try:
+            results.append(parse_file(parser, file_path, plan))
+        except Exception as exception:
+            results.append(exception)
+    return results
+
+
+def find_files(parser: dict[str, Any], directory: str) -> list[str]:
+    """Return the files in a directory and its subdirectories that have one of the file extensions of a parser."""
+    extensions = {f".{extension.lower().lstrip('.')}" for extension in parser.get("supportedFileExtensions") or []}
+    return sorted(str(path) for path in Path(directory).rglob("*")
+                  if path.is_file() and (not extensions or path.suffix.lower() in extensions))
+
+
+def parse_directory(parser: dict[str, Any], directory: str,
+                    workers: int = PARSE_WORKERS) -> list[tuple[str, dict[str, Any] | Exception]]:
+    """Run a parser on all the files of a directory that it supports and return a (file path, parsed file or
+    exception) pair for every file.
+
+    The files are spread over `workers` processes in batches, so a failing file doesn't stop the others. Raise a
+    ValueError before parsing any file if the computed columns of the parser are invalid.
+    """
+    compile_parser(parser)
+    file_paths = find_files(parser, directory)
+    if not file_paths:
+        return []
+    batch_size = max(1, min(PARSE_BATCH_SIZE, -(-len(file_paths) // workers)))
+    batches = [file_paths[start:start + batch_size] for start in range(0, len(file_paths), batch_size)]
+    if workers == 1:
+        results = list(map(parse_files, batches, repeat(parser)))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(parse_files, batches, repeat(parser)))
+    return [pair for batch, batch_results in zip(batches, results) for pair in zip(batch, batch_results)]
+
+
+def print_parsed_file(parsed: dict[str, Any], rows: int = PREVIEW_ROWS) -> None:
+    """Print the metadata, columns and first rows of a parsed file."""
+    for key, value in parsed["metadata"].items():
+        print(f"  {key}: {value}")
+    names = list(parsed["columns"])
+    labels = [f"{name} ({parsed['units'][name]})" if parsed["units"].get(name) else name for name in names]
+    n_rows = len(next(iter(parsed["columns"].values()))) if names else 0
+    print(f"  {n_rows} rows")
+    print("  " + " | ".join(f"{label:>16}" for label in labels))
+    for row in range(min(rows, n_rows)):
+        print("  " + " | ".join(f"{parsed['columns'][name][row]:>16.6g}" for name in names))
+    for line in parsed["footer"]:
+        print(f"  {line}")
+
+
+def main() -> None:
+    argument_parser = argparse.ArgumentParser(description="Run a parser configuration on files locally.")
+    argument_parser.add_argument("parser", help="path to a parser configuration JSON file")
+    argument_parser.add_argument("path", help="a measurement file, or a directory of measurement files")
+    argument_parser.add_argument("--workers", type=int, default=PARSE_WORKERS,
+                                 help="number of processes parsing the files of a directory")
+    arguments = argument_parser.parse_args()
+
+    with open(arguments.parser, encoding="utf-8") as config_file:
+        parser = json.load(config_file)
+
+    if not os.path.isdir(arguments.path):
+        print(f"{arguments.path}:")
+        print_parsed_file(parse_file(parser, arguments.path))
+        return
+
+    start = time.perf_counter()
+    results = parse_directory(parser, arguments.path, arguments.workers)
+    elapsed = time.perf_counter() - start
+    failures = 0
+    for file_path, result in results:
+        if isinstance(result, Exception):
+            failures += 1
+            print(f"  ✗ {file_path}: {result}")
+        else:
+            n_rows = len(next(iter(result["columns"].values()))) if result["columns"] else 0
+            print(f"  ✓ {file_path}: {n_rows} rows, {len(result['columns'])} columns")
+    print(f"Parsed {len(results) - failures} of {len(results)} files in {elapsed:.1f} s ({failures} failed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,29 +3,37 @@ main.py
 
 This is the main script that runs the full example workflow.
 
-It contains examples on how to use the parser APIs.
+It contains examples on how to use the parser APIs. Run it without arguments for an interactive menu, or
+with `sync` to bring the parsers of your organization in line with a directory of parser configurations:
+
+    python main.py sync new_parsers/ --dry-run
+    python main.py sync new_parsers/
 For additional examples and information, please go to https://developer.materials.zone/
 """
+import argparse
 import json
+import logging
+import sys
+import time
 
 from requests import HTTPError
 
 from mz_operations import (
-    get_all_parsers,
+    SYNC_WORKERS,
+    find_parser_by_code,
+    get_organization_parsers,
+    get_system_parsers,
     create_parser,
     update_parser,
     delete_parser,
+    plan_parser_sync,
+    sync_parsers,
 )
+from parser_config import read_parser_config, read_parser_configs
 
 
 EXAMPLE_PARSER_CONFIG_PATH = "new_parsers/keithley_iv.json"
-
-
-def find_parser_by_code(all_parsers: list, parser_code: str) -> dict | None:
-    return next(
-        (parser for parser in all_parsers if parser.get("code") == parser_code),
-        None
-    )
+LOG_LEVEL = logging.INFO  # Set to logging.WARNING to hide the messages of the parser operations
 
 
 def print_parsers(title: str, group: list[dict]) -> None:
@@ -65,6 +73,14 @@ def format_value(key: str, value: object) -> str:
     return str(value)
 
 
+def print_retrieval_error(exception: Exception) -> None:
+    if isinstance(exception, HTTPError):
+        print(f"There was an error retrieving the parsers! "
+              f"Server response: {exception.response.text}")
+    else:
+        print(exception)
+
+
 def load_parser_config(action: str) -> dict | None:
     parser_config_path = input(
         f"Enter the path to the parser configuration JSON for {action} "
@@ -73,150 +89,211 @@ def load_parser_config(action: str) -> dict | None:
     print()
 
     try:
-        with open(parser_config_path, "r", encoding="utf-8") as config_file:
-            return json.load(config_file)
+        return read_parser_config(parser_config_path)
     except FileNotFoundError:
         print("Parser configuration file was not found.")
-    except json.JSONDecodeError as exception:
-        print("Parser configuration file is not valid JSON.")
+    except ValueError as exception:
+        print("Parser configuration file is not a valid parser configuration.")
         print(exception)
     return None
 
 
-while True:
+def print_sync_plan(changes: list[dict]) -> None:
+    symbols = {"create": "+", "update": "~", "delete": "-", "unchanged": "=", "error": "✗"}
+    for change in changes:
+        if change["action"] == "unchanged":
+            continue
+        line = f"  {symbols[change['action']]} {change['action']:<7} {change['name']} [{change['code'] or 'new'}]"
+        if change["path"] is not None:
+            line += f" ({change['path']})"
+        if change["fields"]:
+            line += f": {', '.join(change['fields'])}"
+        if change["error"]:
+            line += f": {change['error']}"
+        print(line)
+    counts = {action: sum(change["action"] == action for change in changes) for action in symbols}
+    print(f"Plan: {counts['create']} to create, {counts['update']} to update, {counts['delete']} to delete, "
+          f"{counts['unchanged']} unchanged, {counts['error']} with errors")
+
+
+def run_sync(directory: str, dry_run: bool, delete_missing: bool, workers: int) -> int:
+    """Sync the parsers with the configurations of a directory and return the exit status of the script."""
+    configs, read_failures = read_parser_configs(directory)
+    for path, exception in read_failures:
+        print(f"  ✗ {path}: {exception}")
     try:
-        all_parsers = get_all_parsers()
-    except RuntimeError as error:
-        print(error)
-        break
-    except HTTPError as exception:
-        print(f"There was an error retrieving the parsers! "
-              f"Server response: {exception.response.text}")
-        break
-
-    sorted_parsers = sorted(
-        all_parsers,
-        key=lambda parser: parser.get("systemParser", False)
-    )
-    organization_parsers = [
-        parser for parser in sorted_parsers
-        if not parser.get("systemParser", False)
-    ]
-    system_parsers = [
-        parser for parser in sorted_parsers
-        if parser.get("systemParser", False)
-    ]
-
-    print("\n1. Show my organization parsers")
-    print("2. Show system parsers")
-    print("3. Show parser details")
-    print("4. Create a new parser")
-    print("5. Update a parser")
-    print("6. Delete a parser")
-    print("7. Quit")
-    choice = input("Choose an option: ").strip()
-    print()
-
-    if choice == "7":
-        print("Goodbye!")
-        break
-
-    if choice == "1":
-        print_parsers("Organization Parsers", organization_parsers)
-        continue
-
-    if choice == "2":
-        print_parsers("System Parsers", system_parsers)
-        continue
-
-    if choice == "3":
-        parser_code = input("Enter the parser code: ").strip()
+        # An invalid file may be the configuration of an organization parser, so nothing is deleted then
+        changes = plan_parser_sync(configs, delete_missing and not read_failures)
+    except (RuntimeError, HTTPError) as exception:
+        print_retrieval_error(exception)
+        return 1
+    print_sync_plan(changes)
+    errors = len(read_failures) + sum(change["action"] == "error" for change in changes)
+    if delete_missing and errors:
+        print("No parsers are deleted because some configurations have errors")
+    if dry_run:
+        return 1 if errors else 0
+
+    start = time.perf_counter()
+    failures = sync_parsers(configs, changes, workers)
+    applied = sum(change["action"] in ("create", "update", "delete") for change in changes) - len(failures)
+    print(f"Applied {applied} changes in {time.perf_counter() - start:.1f} s ({len(failures)} failed)")
+    return 1 if errors or failures else 0
+
+
+def run_menu() -> None:
+    while True:
+        print("\n1. Show my organization parsers")
+        print("2. Show system parsers")
+        print("3. Show parser details")
+        print("4. Create a new parser")
+        print("5. Update a parser")
+        print("6. Delete a parser")
+        print("7. Quit")
+        choice = input("Choose an option: ").strip()
         print()
-        parser = find_parser_by_code(all_parsers, parser_code)
-        if parser is None:
-            print("No parser with that code was found.")
+
+        if choice == "7":
+            print("Goodbye!")
+            return
+
+        if choice in ("1", "2"):
+            try:
+                if choice == "1":
+                    print_parsers("Organization Parsers", get_organization_parsers())
+                else:
+                    print_parsers("System Parsers", get_system_parsers())
+            except (RuntimeError, HTTPError) as exception:
+                print_retrieval_error(exception)
+                return
             continue
-        indent = "  "
-        fields = [
-            ("code", "Code", parser),
-            ("name", "Name", parser),
-            ("description", "Description", parser),
-            ("physicalMeasurement", "Physical Measurement", parser),
-            ("instrumentManufacturer", "Instrument Manufacturer", parser),
-            ("instrumentModel", "Instrument Model", parser),
-            ("supportedFileExtensions", "Supported File Extensions", parser),
-            ("viewType", "View Type", parser)
-        ]
-        parser_configuration = parser.get("parserConfiguration") or {}
-        if parser_configuration:
-            fields += [
-                ("configurationColumns", "Configuration Columns", parser_configuration),
-                ("computedColumns", "Computed Columns", parser_configuration),
-                ("metadataExpected", "Metadata Expected", parser_configuration),
-                ("footerExpected", "Footer Expected", parser_configuration),
-            ]
 
-        for index, (key, label, source) in enumerate(fields):
-            formatted_value = format_value(key, source.get(key))
-            if "\n" in formatted_value:
-                print(f"{indent}{label}:")
-                for line in formatted_value.splitlines():
-                    print(f"{indent}  {line}")
-            else:
-                print(f"{indent}{label}: {formatted_value}")
-        continue
+        if choice == "3":
+            parser_code = input("Enter the parser code: ").strip()
+            print()
+            try:
+                parser = find_parser_by_code(parser_code)
+            except (RuntimeError, HTTPError) as exception:
+                print_retrieval_error(exception)
+                return
+            if parser is None:
+                print("No parser with that code was found.")
+                continue
+            indent = "  "
+            fields = [
+                ("code", "Code", parser),
+                ("name", "Name", parser),
+                ("description", "Description", parser),
+                ("physicalMeasurement", "Physical Measurement", parser),
+                ("instrumentManufacturer", "Instrument Manufacturer", parser),
+                ("instrumentModel", "Instrument Model", parser),
+                ("supportedFileExtensions", "Supported File Extensions", parser),
+                ("viewType", "View Type", parser)
+            ]
+            parser_configuration = parser.get("parserConfiguration") or {}
+            if parser_configuration:
+                fields += [
+                    ("configurationColumns", "Configuration Columns", parser_configuration),
+                    ("computedColumns", "Computed Columns", parser_configuration),
+                    ("metadataExpected", "Metadata Expected", parser_configuration),
+                    ("footerExpected", "Footer Expected", parser_configuration),
+                ]
 
-    if choice == "4":
-        parser_config = load_parser_config("creating a parser")
-        if parser_config is None:
+            for index, (key, label, source) in enumerate(fields):
+                formatted_value = format_value(key, source.get(key))
+                if "\n" in formatted_value:
+                    print(f"{indent}{label}:")
+                    for line in formatted_value.splitlines():
+                        print(f"{indent}  {line}")
+                else:
+                    print(f"{indent}{label}: {formatted_value}")
             continue
 
-        try:
-            parser = create_parser(parser_config)
-            print("Your parser was created successfully!")
-            print(f"Use it with the code [{parser["code"]}]")
-
-        except HTTPError as exception:
-            print(f"There was an error creating your parser, it was not created! "
-                  f"Server response: {exception.response.text}")
-        continue
+        if choice == "4":
+            parser_config = load_parser_config("creating a parser")
+            if parser_config is None:
+                continue
+
+            try:
+                parser = create_parser(parser_config)
+                print("Your parser was created successfully!")
+                print(f"Use it with the code [{parser['code']}]")
+
+            except HTTPError as exception:
+                print(f"There was an error creating your parser, it was not created! "
+                      f"Server response: {exception.response.text}")
+            except RuntimeError as exception:
+                print_retrieval_error(exception)
+                return
+            continue
 
-    if choice == "5":
-        parser_code = input("Enter the parser code to update: ").strip()
-        print()
-        parser_to_update = find_parser_by_code(all_parsers, parser_code)
-        if parser_to_update is None:
-            print("No parser with that code was found.")
+        if choice == "5":
+            parser_code = input("Enter the parser code to update: ").strip()
+            print()
+            try:
+                parser_to_update = find_parser_by_code(parser_code)
+            except (RuntimeError, HTTPError) as exception:
+                print_retrieval_error(exception)
+                return
+            if parser_to_update is None:
+                print("No parser with that code was found.")
+                continue
+
+            parser_config = load_parser_config("updating the parser")
+            if parser_config is None:
+                continue
+
+            try:
+                update_parser(parser_to_update["id"], parser_config)
+                print("Parser updated successfully.")
+            except HTTPError as exception:
+                print(f"There was an error updating the parser! "
+                      f"Server response: {exception.response.text}")
             continue
 
-        parser_config = load_parser_config("updating the parser")
-        if parser_config is None:
+        if choice == "6":
+            parser_code = input("Enter the parser code to delete: ").strip()
+            print()
+            try:
+                parser_to_delete = find_parser_by_code(parser_code)
+            except (RuntimeError, HTTPError) as exception:
+                print_retrieval_error(exception)
+                return
+            if parser_to_delete is None:
+                print("No parser with that code was found.")
+                continue
+
+            try:
+                delete_parser(parser_to_delete["id"])
+            except HTTPError as exception:
+                print(f"There was an error deleting the parser! "
+                      f"Server response: {exception.response.text}")
+                continue
+
+            print("Parser deleted successfully.")
             continue
 
-        try:
-            update_parser(parser_to_update["id"], parser_config)
-            print("Parser updated successfully.")
-        except HTTPError as exception:
-            print(f"There was an error updating the parser! "
-                  f"Server response: {exception.response.text}")
-        continue
+        print("Invalid choice")
 
-    if choice == "6":
-        parser_code = input("Enter the parser code to delete: ").strip()
-        print()
-        parser_to_delete = find_parser_by_code(all_parsers, parser_code)
-        if parser_to_delete is None:
-            print("No parser with that code was found.")
-            continue
 
-        try:
-            delete_parser(parser_to_delete["id"])
-        except HTTPError as exception:
-            print(f"There was an error deleting the parser! "
-                  f"Server response: {exception.response.text}")
-            continue
+def main() -> None:
+    logging.basicConfig(level=LOG_LEVEL, format="%(message)s", stream=sys.stdout)
+    argument_parser = argparse.ArgumentParser(description="Manage the parsers of your MaterialsZone organization.")
+    subparsers = argument_parser.add_subparsers(dest="command")
+    sync_parser = subparsers.add_parser("sync", help="create, update and delete parsers to match a directory of "
+                                                     "parser configurations")
+    sync_parser.add_argument("directory", help="directory of parser configuration JSON files")
+    sync_parser.add_argument("--dry-run", action="store_true", help="print the changes without making them")
+    sync_parser.add_argument("--delete", action="store_true",
+                             help="delete the organization parsers that have no configuration in the directory")
+    sync_parser.add_argument("--workers", type=int, default=SYNC_WORKERS,
+                             help="number of parsers changed in parallel")
+    arguments = argument_parser.parse_args()
+
+    if arguments.command == "sync":
+        sys.exit(run_sync(arguments.directory, arguments.dry_run, arguments.delete, arguments.workers))
+    run_menu()
 
-        print("Parser deleted successfully.")
-        continue
 
-    print("Invalid choice")
+if __name__ == "__main__":
+    main()
@@ -5,17 +5,37 @@ This module contains helper functions for interacting with the MaterialsZone API
 It defines how to send GET, POST, PATCH, and DELETE requests, including support for
 file uploads. It also stores the base API URL, API key, and request headers.
 
+All requests go through a shared `MZClient`, which keeps a pool of open connections
+to the API (so repeated calls don't pay for a new TCP/TLS handshake each time) and
+retries requests that fail with 429 or 5xx responses using exponential backoff. Requests
+that create objects (POST and PATCH) are only sent again when the server tells that it
+didn't process them, so a slow response never creates an object twice (see `SafeRetry`).
+Listings are fetched one page of `PAGE_SIZE` records at a time with `iter_pages`, which can
+also revalidate previously fetched pages with their ETags instead of downloading them again.
+
 You do not need to change anything here. Just use the functions provided to
 communicate with the API.
 """
 
 import os
+import threading
+from collections.abc import Iterator
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 API_BASE_URL = "https://api.materials.zone/v2beta1"
 API_KEY = os.getenv("MZ_API_KEY")  # Set this in your environment (see README)
 HEADERS = {"authorization": API_KEY}
 
+POOL_MAXSIZE = 16  # Maximum number of open connections kept to the API
+TIMEOUT = (5, 60)  # (connect, read) timeouts in seconds
+MAX_RETRIES = 5  # Number of retries for failed requests
+BACKOFF_FACTOR = 0.5  # Retries wait 0.5s, 1s, 2s, 4s, ... between attempts
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+RETRY_AFTER_STATUS_CODES = (429, 503)  # POST and PATCH are only retried on these, and only with a Retry-After header
+PAGE_SIZE = 500  # Number of records fetched per request by iter_pages and iter_listing
+
 
 def _assert_api_key():
     if not API_KEY:
@@ -28,33 +48,194 @@ def _raise_for_auth(response: requests.Response):
         raise RuntimeError("Authentication failed. Check that MZ_API_KEY is correct. "
                            f"Server response: {response.text}")
 
-def get(endpoint: str) -> dict | list:
-    """Send a GET request to the API to fetch an object."""
+
+class SafeRetry(Retry):
+    """The retry policy of `MZClient`, which never sends a request again if the server may have processed it.
+
+    GET, PUT, DELETE and the other idempotent methods are retried on connection errors, read timeouts and the
+    status codes of `status_forcelist`. POST and PATCH, which would create an object twice, are only retried when
+    the connection failed before the request was sent, and on the `RETRY_AFTER_STATUS_CODES` responses with a
+    Retry-After header, with which the server tells that it didn't process the request.
+    """
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if self.allowed_methods is None or method.upper() in self.allowed_methods:
+            return super().is_retry(method, status_code, has_retry_after)
+        return bool(self.total and has_retry_after and status_code in RETRY_AFTER_STATUS_CODES
+                    and status_code in (self.status_forcelist or ()))
+
+
+class MZClient:
+    """A client for the MaterialsZone API that reuses connections and retries failed requests.
+
+    The client is safe to share between threads. Requests block while all `pool_maxsize`
+    connections are busy, so the pool size bounds the number of concurrent requests.
+    """
+
+    def __init__(self, base_url: str = API_BASE_URL, headers: dict | None = None,
+                 pool_maxsize: int = POOL_MAXSIZE, timeout: float | tuple[float, float] = TIMEOUT,
+                 max_retries: int = MAX_RETRIES, backoff_factor: float = BACKOFF_FACTOR):
+        self.base_url = base_url
+        self.headers = HEADERS if headers is None else headers
+        self.timeout = timeout
+        retry = SafeRetry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            respect_retry_after_header=True,
+            raise_on_status=False,  # Return the last response so raise_for_status() reports it
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, pool_block=True, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        """Send a request to the API and return the response, raising an HTTPError on failure."""
+        kwargs["headers"] = {**self.headers, **kwargs.get("headers", {})}
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session.request(method, f"{self.base_url}{endpoint}", **kwargs)
+        _raise_for_auth(response)
+        response.raise_for_status()
+        return response
+
+    def get(self, endpoint: str, params: dict | None = None) -> dict | list:
+        """Send a GET request to the API to fetch an object, with optional query parameters."""
+        return self.request("GET", endpoint, params=params).json()["data"]
+
+    def get_page(self, endpoint: str, params: dict | None = None,
+                 cached: tuple[str, list[dict]] | None = None) -> tuple[list[dict], str | None]:
+        """Fetch one page of a listing and return it with its ETag.
+
+        With a `cached` (ETag, page) pair, the request is sent with an If-None-Match header, and the cached page is
+        returned without downloading it again if the server answers that it hasn't changed (304 Not Modified).
+        """
+        headers = {"If-None-Match": cached[0]} if cached is not None and cached[0] else {}
+        response = self.request("GET", endpoint, params=params, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            return cached[1], cached[0]
+        return response.json()["data"], response.headers.get("ETag")
+
+    def iter_pages(self, endpoint: str, params: dict | None = None, page_size: int = PAGE_SIZE,
+                   cache: dict[int, tuple[str, list[dict]]] | None = None) -> Iterator[list[dict]]:
+        """Fetch a listing from the API one page at a time, with `limit` and `offset` query parameters, and yield
+        the pages as they arrive.
+
+        No more pages are fetched once the caller stops iterating, so a search can stop at the first match. A
+        server that ignores the pagination and returns the whole listing at once is detected (a page longer than
+        `page_size`), and its listing is yielded once. A server that applies the limit but ignores the offset sends
+        the first page again; the rest of the listing is then fetched in one request without pagination, and a
+        RuntimeError is raised if it doesn't start with the first page.
+
+        A `cache` maps the offsets of pages to their (ETag, page) pairs. Cached pages are revalidated with the
+        server rather than downloaded again (see `get_page`), and the cache is updated with the pages that changed.
+        Once the whole listing is fetched, the pages past its end are removed from the cache.
+        """
+        params = dict(params or {})
+        offset = 0
+        first_id = None
+        while True:
+            page, etag = self.get_page(endpoint, {**params, "limit": page_size, "offset": offset},
+                                       cache.get(offset) if cache is not None else None)
+            if offset > 0 and page and page[0].get("id") == first_id:
+                # The server ignores the offset and sent the first page again, so the pages past the first one aren't
+                # cached
+                rest = self._unpaginated_rest(endpoint, self.get(endpoint, params or None), first_id, offset)
+                if rest:
+                    yield rest
+                break
+            if cache is not None:
+                if etag:
+                    cache[offset] = (etag, page)
+                else:
+                    cache.pop(offset, None)
+            yield page
+            last_offset = offset
+            if len(page) != page_size:
+                break  # The last page, or the whole listing if the server ignores the limit
+            if offset == 0:
+                first_id = page[0].get("id")
+            offset += len(page)
+        if cache is not None:
+            for stale_offset in [cached_offset for cached_offset in cache if cached_offset > last_offset]:
+                del cache[stale_offset]
+
+    @staticmethod
+    def _unpaginated_rest(endpoint: str, listing: list[dict], first_id: str | None, offset: int) -> list[dict]:
+        """Return the records of an unpaginated `listing` past the `offset` records that were already yielded."""
+        if listing and listing[0].get("id") != first_id:
+            raise RuntimeError(f"The server ignores the offset of {endpoint} and its unpaginated listing is in a "
+                               f"different order, so the listing can't be fetched completely.")
+        return listing[offset:]
+
+    def post(self, endpoint: str, payload: dict) -> dict:
+        """Send a POST request to the API to create an object."""
+        return self.request("POST", endpoint, json=payload).json()["data"]
+
+    def patch(self, endpoint: str, payload: dict) -> dict:
+        """Send a PATCH request to the API to update an object."""
+        return self.request("PATCH", endpoint, json=payload).json()["data"]
+
+    def delete(self, endpoint: str) -> None:
+        """Send a DELETE request to the API to delete an object."""
+        self.request("DELETE", endpoint)
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_client: MZClient | None = None
+_client_lock = threading.Lock()
+
+def get_client() -> MZClient:
+    """Return the shared client used by the module-level request functions."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MZClient()
+        return _client
+
+def set_client(client: MZClient) -> None:
+    """Replace the shared client, e.g. to change the pool size, timeouts or retry settings."""
+    global _client
+    with _client_lock:
+        _client = client
+
+def get(endpoint: str, params: dict | None = None) -> dict | list:
+    """Send a GET request to the API to fetch an object, with optional query parameters."""
     _assert_api_key()
-    response = requests.get(f"{API_BASE_URL}{endpoint}", headers=HEADERS)
-    _raise_for_auth(response)
-    response.raise_for_status()
-    return response.json()["data"]
+    return get_client().get(endpoint, params)
+
+def iter_pages(endpoint: str, params: dict | None = None, page_size: int = PAGE_SIZE,
+               cache: dict[int, tuple[str, list[dict]]] | None = None) -> Iterator[list[dict]]:
+    """Fetch a listing from the API one page at a time and yield the pages as they arrive, revalidating the pages
+    of `cache` instead of downloading them again."""
+    _assert_api_key()
+    return get_client().iter_pages(endpoint, params, page_size, cache)
+
+def iter_listing(endpoint: str, params: dict | None = None, page_size: int = PAGE_SIZE) -> Iterator[dict]:
+    """Fetch a listing from the API one page at a time and yield its records one by one."""
+    for page in iter_pages(endpoint, params, page_size):
+        yield from page
 
 def post(endpoint: str, payload: dict) -> dict:
     """Send a POST request to the API to create an object."""
     _assert_api_key()
-    response = requests.post(f"{API_BASE_URL}{endpoint}", headers=HEADERS, json=payload)
-    _raise_for_auth(response)
-    response.raise_for_status()
-    return response.json()["data"]
+    return get_client().post(endpoint, payload)
 
 def patch(endpoint: str, payload: dict) -> dict:
     """Send a PATCH request to the API to update an object."""
     _assert_api_key()
-    response = requests.patch(f"{API_BASE_URL}{endpoint}", headers=HEADERS, json=payload)
-    _raise_for_auth(response)
-    response.raise_for_status()
-    return response.json()["data"]
+    return get_client().patch(endpoint, payload)
 
 def delete(endpoint: str) -> None:
     """Send a DELETE request to the API to delete an object."""
     _assert_api_key()
-    response = requests.delete(f"{API_BASE_URL}{endpoint}", headers=HEADERS)
-    _raise_for_auth(response)
-    response.raise_for_status()
+    get_client().delete(endpoint)
@@ -9,32 +9,313 @@ specific tasks like creating materials and experiment tables, or uploading data
 
 You can use these operations in your main script to build and manage your workspace.
 """
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import Any
 
-from mz_api_helpers import delete, get, patch, post
+from mz_api_helpers import PAGE_SIZE, POOL_MAXSIZE, delete, iter_listing, iter_pages, patch, post
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_PATH = str(Path(__file__).resolve().parent / "parser_registry.json")  # Local copy of the parser listing
+REGISTRY_TTL = 60  # Seconds during which the parser listing is used without checking the server for changes
+SYNC_WORKERS = POOL_MAXSIZE  # Number of parsers created, updated or deleted in parallel by sync_parsers
+
+
+class ParserRegistry:
+    """The parsers accessible to the organization, kept in memory with indexes by code and ID.
+
+    The listing is fetched page by page and saved to `path` with the ETag of every page. When it is older than `ttl`
+    seconds, every page is revalidated with the server (If-None-Match), so only the pages that changed are
+    downloaded again; in between, lookups make no API calls. `create_parser`, `update_parser` and `delete_parser`
+    update the registry in place. Call `invalidate` after changing parsers in another way (e.g. in the MaterialsZone
+    web app).
+    """
+
+    def __init__(self, path: str | None = REGISTRY_PATH, ttl: float = REGISTRY_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._pages = self._load_pages()  # Offset -> (ETag, page)
+        self._parsers_by_id = None
+        self._ids_by_code = {}
+        self._fetched_at = 0.0
+
+    def _load_pages(self) -> dict[int, tuple[str, list[dict[str, Any]]]]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (TypeError, OSError, ValueError):
+            return {}
+        if saved.get("pageSize") != PAGE_SIZE:
+            return {}
+        return {int(offset): (etag, page) for offset, (etag, page) in saved["pages"].items()}
+
+    def _save_pages(self) -> None:
+        if self.path is None:
+            return
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump({"pageSize": PAGE_SIZE, "pages": {str(offset): [etag, page]
+                                                        for offset, (etag, page) in self._pages.items()}}, f)
+        os.replace(temporary_path, self.path)  # Never leave a half-written file behind
+
+    def _ensure_fresh(self) -> None:
+        if self._parsers_by_id is not None and time.monotonic() - self._fetched_at < self.ttl:
+            return
+        parsers = [parser for page in iter_pages("/parsers", cache=self._pages) for parser in page]
+        self._save_pages()
+        self._parsers_by_id = {}
+        self._ids_by_code = {}
+        for parser in parsers:
+            self._index(parser)
+        self._fetched_at = time.monotonic()
+
+    def _index(self, parser: dict[str, Any]) -> None:
+        self._parsers_by_id[parser["id"]] = parser
+        if parser.get("code") is not None:
+            self._ids_by_code.setdefault(parser["code"], parser["id"])
+
+    def parsers(self) -> list[dict[str, Any]]:
+        """Return all the parsers, in the order of the listing."""
+        with self._lock:
+            self._ensure_fresh()
+            return list(self._parsers_by_id.values())
+
+    def by_code(self, code: str) -> dict[str, Any] | None:
+        """Return the parser with the given code, or None if there is none."""
+        with self._lock:
+            self._ensure_fresh()
+            parser_id = self._ids_by_code.get(code)
+            return self._parsers_by_id[parser_id] if parser_id is not None else None
+
+    def by_id(self, parser_id: str) -> dict[str, Any] | None:
+        """Return the parser with the given ID, or None if there is none."""
+        with self._lock:
+            self._ensure_fresh()
+            return self._parsers_by_id.get(parser_id)
+
+    def add(self, parser: dict[str, Any]) -> None:
+        """Record a parser that was just created or updated."""
+        with self._lock:
+            if self._parsers_by_id is None:
+                return
+            previous = self._parsers_by_id.get(parser["id"])
+            if previous is not None:
+                if self._ids_by_code.get(previous.get("code")) == parser["id"]:
+                    del self._ids_by_code[previous["code"]]
+                parser = {**previous, **parser}  # Keep the fields that an update doesn't return
+            self._index(parser)
+
+    def remove(self, parser_id: str) -> None:
+        """Forget a parser that was just deleted."""
+        with self._lock:
+            if self._parsers_by_id is None:
+                return
+            parser = self._parsers_by_id.pop(parser_id, None)
+            if parser is not None and self._ids_by_code.get(parser.get("code")) == parser_id:
+                del self._ids_by_code[parser["code"]]
+
+    def invalidate(self) -> None:
+        """Check the server for changes on the next lookup, downloading only the pages that changed."""
+        with self._lock:
+            self._fetched_at = 0.0
+
+
+_registry: ParserRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ParserRegistry:
+    """Return the registry used by the parser lookup functions, creating it with the default path and time to live
+    (which reads `REGISTRY_PATH`) on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ParserRegistry()
+        return _registry
+
+
+def set_registry(registry: ParserRegistry) -> None:
+    """Replace the registry used by the parser lookup functions, e.g. to change its path or time to live."""
+    global _registry
+    _registry = registry
+
+
+def invalidate_registry() -> None:
+    """Check the server for changes to the parsers on the next lookup."""
+    if _registry is not None:
+        _registry.invalidate()
 
 
 def create_parser(parser_payload: dict[str, Any]) -> dict[str, Any]:
     """Create a parser with the provided payload and return the parser details."""
     parser = post("/parsers", parser_payload)
-    print(f"  ✓ Created parser [{parser_payload.get('name', 'N/A')}] with id [{parser['id']}] and code [{parser['code']}]")
+    get_registry().add({**parser_payload, **parser})
+    logger.info("  ✓ Created parser [%s] with id [%s] and code [%s]", parser_payload.get("name", "N/A"), parser["id"],
+                parser["code"])
     return parser
 
 
 def update_parser(parser_id: str, parser_payload: dict[str, Any]) -> dict[str, Any]:
     """Update an existing parser by its id using the provided payload and return the parser details."""
     parser = patch(f"/parsers/{parser_id}", parser_payload)
-    print(f"  ✓ Updated parser [{parser_payload.get('name', 'N/A')}] with id [{parser_id}] and code [{parser['code']}]")
+    get_registry().add({**parser_payload, **parser, "id": parser_id})
+    logger.info("  ✓ Updated parser [%s] with id [%s] and code [%s]", parser_payload.get("name", "N/A"), parser_id,
+                parser["code"])
     return parser
 
 
 def delete_parser(parser_id: str) -> None:
     """Delete the parser specified by parser_id"""
     delete(f"/parsers/{parser_id}")
-    print(f"  ✓ Deleted parser {parser_id}")
+    get_registry().remove(parser_id)
+    logger.info("  ✓ Deleted parser %s", parser_id)
+
+
+def iter_parsers() -> Iterator[dict[str, Any]]:
+    """Yield the details of the parsers accessible to the user's organization, fetching them one page at a time"""
+    return iter_listing("/parsers")
 
 
 def get_all_parsers() -> list[dict[str, Any]]:
-    """Get the details for all parsers accessible to the user's organization"""
-    all_accessible_parsers = get("/parsers")
-    return all_accessible_parsers
+    """Get the details for all parsers accessible to the user's organization, from the parser registry"""
+    return get_registry().parsers()
+
+
+def get_organization_parsers() -> list[dict[str, Any]]:
+    """Get the details for the parsers created by the user's organization"""
+    return [parser for parser in get_registry().parsers() if not parser.get("systemParser", False)]
+
+
+def get_system_parsers() -> list[dict[str, Any]]:
+    """Get the details for the system parsers"""
+    return [parser for parser in get_registry().parsers() if parser.get("systemParser", False)]
+
+
+def find_parser_by_code(parser_code: str) -> dict[str, Any] | None:
+    """Return the parser with the given code, or None if there is none"""
+    return get_registry().by_code(parser_code)
+
+
+def _differs(expected: Any, actual: Any) -> bool:
+    """Return whether a value of a parser configuration differs from the value of the parser on the server.
+
+    Only the keys of `expected` are compared, so fields that the server adds (e.g. defaults) aren't changes.
+    """
+    if isinstance(expected, dict):
+        return not isinstance(actual, dict) or any(_differs(value, actual.get(key)) for key, value in expected.items())
+    if isinstance(expected, list):
+        return (not isinstance(actual, list) or len(expected) != len(actual)
+                or any(_differs(value, actual_value) for value, actual_value in zip(expected, actual)))
+    return expected != actual
+
+
+def plan_parser_sync(configs: dict[str, dict[str, Any]], delete_missing: bool = False) -> list[dict[str, Any]]:
+    """Compare parser configurations to the organization parsers on the server and return the changes that bring the
+    server in line with them.
+
+    `configs` maps file paths to configurations, e.g. from `parser_config.read_parser_configs`. A configuration is
+    matched to a parser by its `code` if it has one, otherwise by its `name`. Every change is a dictionary with the
+    `action` ("create", "update", "unchanged", "delete" or "error"), the `name` and `path` of the configuration, the
+    `id` and `code` of the parser, the `fields` that differ for an update and an `error` message for configurations
+    that can't be synced (unknown code, system parser, name used by several parsers or configurations). Organization
+    parsers that no configuration names or codes are deleted only if `delete_missing` is set and no configuration has
+    an error, since a configuration with an error may be meant for one of them. The parsers are revalidated with the
+    server first, so the plan reflects changes made elsewhere.
+    """
+    registry = get_registry()
+    registry.invalidate()
+    parsers = registry.parsers()
+    organization_parsers = [parser for parser in parsers if not parser.get("systemParser", False)]
+    parsers_by_name: dict[str, list[dict[str, Any]]] = {}
+    for parser in organization_parsers:
+        parsers_by_name.setdefault(parser.get("name"), []).append(parser)
+    paths_by_name: dict[str, list[str]] = {}
+    paths_by_code: dict[str, list[str]] = {}
+    for path, config in configs.items():
+        paths_by_name.setdefault(config["name"], []).append(path)
+        if config.get("code") is not None:
+            paths_by_code.setdefault(config["code"], []).append(path)
+
+    changes, matched_ids = [], set()
+    for path, config in configs.items():
+        change = {"action": "error", "name": config["name"], "path": path, "id": None, "code": config.get("code"),
+                  "fields": [], "error": None}
+        changes.append(change)
+        # Never delete a parser that a configuration names, even if the configuration can't be synced
+        matched_ids.update(parser["id"] for parser in parsers_by_name.get(config["name"], []))
+        if config.get("code") is not None:
+            parser = registry.by_code(config["code"])
+            if parser is not None:
+                matched_ids.add(parser["id"])
+            if len(paths_by_code[config["code"]]) > 1:
+                change["error"] = (f"The code is also used by "
+                               f"{', '.join(other for other in paths_by_code[config['code']] if other != path)}")
+                continue
+            if parser is None:
+                change["error"] = f"No parser has the code {config['code']}"
+                continue
+            if parser.get("systemParser", False):
+                change["error"] = f"{config['code']} is a system parser"
+                continue
+        elif len(paths_by_name[config["name"]]) > 1:
+            others = [other for other in paths_by_name[config["name"]] if other != path]
+            change["error"] = f"The name is also used by {', '.join(others)}"
+            continue
+        elif len(parsers_by_name.get(config["name"], [])) > 1:
+            change["error"] = (f"The name is used by the parsers "
+                               f"{', '.join(parser['code'] for parser in parsers_by_name[config['name']])}; "
+                               f"add the code of one of them to the configuration")
+            continue
+        else:
+            parser = next(iter(parsers_by_name.get(config["name"], [])), None)
+        if parser is None:
+            change["action"] = "create"
+            continue
+        matched_ids.add(parser["id"])
+        change.update(id=parser["id"], code=parser.get("code"),
+                      fields=[key for key, value in config.items() if _differs(value, parser.get(key))])
+        change["action"] = "update" if change["fields"] else "unchanged"
+
+    if delete_missing and not any(change["action"] == "error" for change in changes):
+        changes += [{"action": "delete", "name": parser.get("name"), "path": None, "id": parser["id"],
+                     "code": parser.get("code"), "fields": [], "error": None}
+                    for parser in organization_parsers if parser["id"] not in matched_ids]
+    return changes
+
+
+def sync_parsers(configs: dict[str, dict[str, Any]], changes: list[dict[str, Any]],
+                 max_workers: int = SYNC_WORKERS) -> list[tuple[dict[str, Any], Exception]]:
+    """Apply the changes of `plan_parser_sync` concurrently and return a list of failures.
+
+    Parsers are created and updated with the whole configuration of their file, without its `code`. A change that
+    fails is reported as a (change, exception) pair without stopping the others; unchanged parsers and
+    configurations with errors are skipped.
+    """
+    def apply(change: dict[str, Any]) -> Exception | None:
+        payload = {key: value for key, value in configs.get(change["path"], {}).items() if key != "code"}
+        try:
+            if change["action"] == "create":
+                change["code"] = create_parser(payload)["code"]
+            elif change["action"] == "update":
+                update_parser(change["id"], payload)
+            elif change["action"] == "delete":
+                delete_parser(change["id"])
+        except Exception as exception:
+            return exception
+
+    pending = [change for change in changes if change["action"] in ("create", "update", "delete")]
+    failures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for change, result in zip(pending, executor.map(apply, pending)):
+            if result is not None:
+                logger.warning("  ✗ Failed to %s parser [%s]: %s", change["action"], change["name"], result)
+                failures.append((change, result))
+    return failures
@@ -0,0 +1,202 @@
+"""
+parser_config.py
+
+This module loads parser configurations, like the ones in `new_parsers/`, and validates them
+before they are sent to the MaterialsZone API, so a mistake in a configuration is reported with
+its location in the file instead of as an error response from the server.
+
+A configuration is checked against a JSON schema of the parser payload (required fields and
+their types), and then for the references between fields: result column names must be unique,
+and computed columns may only use result columns and other computed columns, without cycles
+(see `computed_columns.py`). Fields that the schema doesn't describe, view types and computed
+column functions are left to the API, so no configuration that the API accepts is refused. The
+schema is checked and its validator built once, when the module is imported, and reused for
+every configuration. Whole directories are validated in parallel in a pool of processes.
+
+Run it from the example directory to validate a configuration or a directory of configurations:
+
+    python parser_config.py new_parsers/keithley_iv.json
+    python parser_config.py new_parsers/ --workers 4
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from jsonschema import Draft202012Validator
+
+from computed_columns import order_computed_columns
+
+VALIDATE_WORKERS = os.cpu_count()  # Number of processes validating configurations in parallel in read_parser_configs
+VALIDATE_BATCH_SIZE = 128  # Maximum number of configurations validated together by a process
+
+_TEXT = {"type": "string", "minLength": 1}
+_UNIT = {"type": ["string", "null"]}
+
+PARSER_SCHEMA = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "type": "object",
+    "required": ["name", "parserConfiguration"],
+    "properties": {
+        "code": _TEXT,  # Only in configurations of existing parsers, see mz_operations.plan_parser_sync
+        "name": _TEXT,
+        "description": {"type": "string"},
+        "physicalMeasurement": {"type": "string"},
+        "instrumentManufacturer": {"type": "string"},
+        "instrumentModel": {"type": "string"},
+        "supportedFileExtensions": {"type": "array", "items": _TEXT},
+        "viewType": _TEXT,
+        "parserConfiguration": {
+            "type": "object",
+            "required": ["configurationColumns"],
+            "properties": {
+                "configurationColumns": {
+                    "type": "array",
+                    "minItems": 1,
+                    "items": {
+                        "type": "object",
+                        "required": ["columnNameInResult"],
+                        "anyOf": [{"required": ["columnNameInFile"]}, {"required": ["columnIndexInFile"]}],
+                        "properties": {
+                            "columnNameInFile": _TEXT,
+                            "columnIndexInFile": {"type": "integer", "minimum": 0},
+                            "columnNameInResult": _TEXT,
+                            "unit": _UNIT,
+                        },
+                    },
+                },
+                "computedColumns": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "required": ["inputColumnNames", "function", "computedColumnName"],
+                        "properties": {
+                            "inputColumnNames": {"type": "array", "minItems": 1, "items": _TEXT},
+                            "function": _TEXT,
+                            "computedColumnName": _TEXT,
+                            "unit": _UNIT,
+                        },
+                    },
+                },
+                "metadataExpected": {"type": "boolean"},
+                "footerExpected": {"type": "boolean"},
+            },
+        },
+    },
+}
+
+Draft202012Validator.check_schema(PARSER_SCHEMA)
+_validator = Draft202012Validator(PARSER_SCHEMA)
+
+
+def _location(path) -> str:
+    return "".join(f"[{part}]" if isinstance(part, int) else f".{part}" for part in path).lstrip(".") or "(root)"
+
+
+def validate_parser_config(config: Any) -> list[str]:
+    """Return the problems of a parser configuration as messages like `parserConfiguration.configurationColumns[0]:
+    'columnNameInResult' is a required property`, or an empty list if it is valid.
+
+    The references between fields are only checked when the configuration matches the schema.
+    """
+    errors = [f"{_location(error.absolute_path)}: {error.message}"
+              for error in sorted(_validator.iter_errors(config), key=lambda error: list(map(str, error.path)))]
+    if errors:
+        return errors
+
+    columns = config["parserConfiguration"]["configurationColumns"]
+    result_names = [column["columnNameInResult"] for column in columns]
+    for index, name in enumerate(result_names):
+        if name in result_names[:index]:
+            errors.append(f"parserConfiguration.configurationColumns[{index}].columnNameInResult: {name!r} is "
+                          f"already the result name of column {result_names.index(name)}")
+    try:
+        order_computed_columns(config["parserConfiguration"].get("computedColumns") or [], result_names)
+    except ValueError as exception:
+        errors.append(f"parserConfiguration.computedColumns: {exception}")
+    return errors
+
+
+def read_parser_config(path: str) -> dict[str, Any]:
+    """Read a parser configuration file and return the configuration, raising a ValueError with all its problems
+    if it isn't valid JSON or isn't a valid configuration."""
+    with open(path, encoding="utf-8") as config_file:
+        try:
+            config = json.load(config_file)
+        except json.JSONDecodeError as exception:
+            raise ValueError(f"The file is not valid JSON: {exception}") from exception
+    errors = validate_parser_config(config)
+    if errors:
+        raise ValueError("; ".join(errors))
+    return config
+
+
+def read_parser_configs_batch(paths: list[str]) -> list[dict[str, Any] | Exception]:
+    """Read a batch of parser configuration files in a validating process and return the configuration (or the
+    exception raised for it) for every file."""
+    results = []
+    for path in paths:
+        try:
+            results.append(read_parser_config(path))
+        except (OSError, ValueError) as exception:
+            results.append(exception)
+    return results
+
+
+def read_parser_configs(directory: str, workers: int = VALIDATE_WORKERS
+                        ) -> tuple[dict[str, dict[str, Any]], list[tuple[str, Exception]]]:
+    """Read and validate the parser configurations (`*.json` files) of a directory and its subdirectories.
+
+    Return a map from file paths to the valid configurations and a list of (file path, exception) pairs for the
+    others. The files are spread over `workers` processes in batches; a directory that fits in one batch is read
+    in this process.
+    """
+    paths = sorted(str(path) for path in Path(directory).rglob("*.json"))
+    batch_size = max(1, min(VALIDATE_BATCH_SIZE, -(-len(paths) // max(1, workers))))
+    batches = [paths[start:start + batch_size] for start in range(0, len(paths), batch_size)]
+    if workers == 1 or len(batches) <= 1:
+        results = list(map(read_parser_configs_batch, batches))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(read_parser_configs_batch, batches))
+
+    configs, failures = {}, []
+    for path, result in zip(paths, (result for batch_results in results for result in batch_results)):
+        if isinstance(result, Exception):
+            failures.append((path, result))
+        else:
+            configs[path] = result
+    return configs, failures
+
+
+def main() -> None:
+    argument_parser = argparse.ArgumentParser(description="Validate parser configurations without calling the API.")
+    argument_parser.add_argument("path", help="a parser configuration JSON file, or a directory of them")
+    argument_parser.add_argument("--workers", type=int, default=VALIDATE_WORKERS,
+                                 help="number of processes validating the configurations of a directory")
+    arguments = argument_parser.parse_args()
+
+    if not os.path.isdir(arguments.path):
+        try:
+            read_parser_config(arguments.path)
+        except (OSError, ValueError) as exception:
+            print(f"  ✗ {arguments.path}: {exception}")
+            raise SystemExit(1)
+        print(f"  ✓ {arguments.path}")
+        return
+
+    start = time.perf_counter()
+    configs, failures = read_parser_configs(arguments.path, arguments.workers)
+    elapsed = time.perf_counter() - start
+    for path, exception in failures:
+        print(f"  ✗ {path}: {exception}")
+    print(f"Validated {len(configs) + len(failures)} configurations in {elapsed:.1f} s ({len(failures)} invalid)")
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
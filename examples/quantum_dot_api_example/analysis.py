@@ -11,18 +11,44 @@ meaningful results from CSV files and attach them to the right items.
 
 import os
 import glob
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 from scipy.signal import find_peaks
-from mz_operations import create_measurement, update_item
+from measurement_reader import read_measurement
+from mz_api_helpers import POOL_MAXSIZE
+from mz_operations import create_measurement_from_file, update_item
+from upload_state import UploadState
+
+logger = logging.getLogger(__name__)
 
 MEASUREMENT_FOLDER = "measurements"  # Folder containing measurement CSV files
+ANALYSIS_WORKERS = os.cpu_count()  # Number of processes analyzing measurement files in parallel
+ANALYSIS_BATCH_SIZE = 256  # Maximum number of files analyzed together by an analysis process
+PEAK_BLOCK_SIZE = 4096  # Number of spectra searched for peaks at a time by find_peak_indices
+UPLOAD_WORKERS = POOL_MAXSIZE // 2  # Number of measurements uploaded in parallel (each upload makes two requests)
+UPLOAD_QUEUE_SIZE = 256  # Number of analyzed files that may wait for an upload worker
+PARSER_CODE = "MZ-PH-AG-CA"
+MEASUREMENT_TITLE = "Emission Spectrum"
+
+def read_spectrum(file_path: str) -> tuple[np.ndarray, np.ndarray]:
+    """Return the wavelengths and intensities of an emission spectrum CSV file."""
+    _, data = read_measurement(file_path)
+    return data[:, 0], data[:, 1]
 
 def find_emission_spectrum_peak_wavelength(file_path: str) -> float | None:
     """Return the peak wavelength from an emission spectrum CSV file, or None if not found."""
-    df = pd.read_csv(file_path)
-    x = df.iloc[:, 0].values
-    y = df.iloc[:, 1].values
+    try:
+        x, y = read_spectrum(file_path)
+    except ValueError:
+        # Files that aren't plain numeric CSV files (e.g. with missing values) are read with pandas
+        df = pd.read_csv(file_path)
+        x = df.iloc[:, 0].values
+        y = df.iloc[:, 1].values
 
     # Simple peak detection
     peaks, _ = find_peaks(y)
@@ -30,20 +56,190 @@ def find_emission_spectrum_peak_wavelength(file_path: str) -> float | None:
 
     return peak_x
 
-def upload_emission_spectrum_measurements(exp_col_param_map: dict[str, str], experiments_ids_map: dict[str, str]):
-    """Analyze emission spectrum files, extract peak wavelengths, upload results and raw measurements."""
-    for file_path in glob.glob(f"{MEASUREMENT_FOLDER}/experiment_*_measurement.csv"):
-        peak_x = find_emission_spectrum_peak_wavelength(file_path)
-
-        # Match file to experiment
-        name = os.path.basename(file_path).split("_")[1]  # e.g., "01" from "experiment_01_measurement.csv"
-        experiment_title = f"QD_EXP_{int(name):02d}"
-
-        # Upload the analysis result as an item value
-        if peak_x is not None:
-            values = [{"parameterId": exp_col_param_map["Peak Wavelength (nm)"], "value": str(peak_x)}]
-            update_item(experiments_ids_map[experiment_title], values)
-            parser_code = "MZ-PH-AG-CA"
-            file = (os.path.basename(file_path), open(file_path, "rb"), "text/csv")
-            measurement_title = "Emission Spectrum"
-            create_measurement(experiments_ids_map[experiment_title], measurement_title, parser_code, file)
+def find_peak_indices(y: np.ndarray) -> np.ndarray:
+    """Return the index of the highest peak of every row of a 2-D array of spectra, or -1 for rows without a peak.
+
+    This gives the same peaks as calling `find_peaks` on every row, but searches for the strict local maxima of all
+    rows at once. Rows with two equal neighbouring values, which may contain a flat peak, are passed to `find_peaks`
+    instead. The rows are processed in blocks, so `y` can also be a memory-mapped array larger than memory.
+    """
+    indices = np.full(len(y), -1)
+    for start in range(0, len(y), PEAK_BLOCK_SIZE):
+        block = np.asarray(y[start:start + PEAK_BLOCK_SIZE], dtype=float)
+        center = block[:, 1:-1]
+        is_peak = (center > block[:, :-2]) & (center > block[:, 2:])
+        # The first of the highest peaks of each row, like np.argmax over the peaks found by find_peaks
+        highest = np.argmax(np.where(is_peak, center, -np.inf), axis=1) + 1
+        block_indices = np.where(is_peak.any(axis=1), highest, -1)
+        for row in np.flatnonzero((block[:, 1:] == block[:, :-1]).any(axis=1)):
+            peaks, _ = find_peaks(block[row])
+            block_indices[row] = peaks[np.argmax(block[row][peaks])] if len(peaks) > 0 else -1
+        indices[start:start + len(block)] = block_indices
+    return indices
+
+def find_emission_spectrum_peak_wavelengths(file_paths: list[str]) -> list[float | None]:
+    """Return the peak wavelength of every emission spectrum CSV file in the list, or None for files without a peak.
+
+    The spectra that share the wavelengths of the first file are stacked into one 2-D array and searched for peaks
+    together with `find_peak_indices`. Files with other wavelengths, or that `read_measurement` can't read, are
+    analyzed one by one with `find_emission_spectrum_peak_wavelength`.
+    """
+    results = [None] * len(file_paths)
+    wavelengths = None
+    stacked_indices, stacked_intensities, other_indices = [], [], []
+    for index, file_path in enumerate(file_paths):
+        try:
+            x, y = read_spectrum(file_path)
+        except ValueError:
+            other_indices.append(index)
+            continue
+        if wavelengths is None:
+            wavelengths = x
+        if np.array_equal(x, wavelengths):
+            stacked_indices.append(index)
+            stacked_intensities.append(y)
+        else:
+            other_indices.append(index)
+
+    if stacked_indices:
+        peak_indices = find_peak_indices(np.vstack(stacked_intensities))
+        for index, peak_index in zip(stacked_indices, peak_indices):
+            results[index] = wavelengths[peak_index] if peak_index >= 0 else None
+    for index in other_indices:
+        results[index] = find_emission_spectrum_peak_wavelength(file_paths[index])
+
+    return results
+
+def experiment_title_from_path(file_path: str) -> str:
+    """Return the title of the experiment a measurement file belongs to."""
+    name = os.path.basename(file_path).split("_")[1]  # e.g., "01" from "experiment_01_measurement.csv"
+    return f"QD_EXP_{int(name):02d}"
+
+class StageStats:
+    """Thread-safe counters of a pipeline stage: files processed and failed, and the time spent on them."""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, failed: bool = False) -> None:
+        with self._lock:
+            self.processed += 1
+            self.failed += failed
+            self.busy_seconds += seconds
+            self.finished_at = time.perf_counter()
+
+    def summary(self) -> str:
+        elapsed = (self.finished_at or self.started_at) - self.started_at
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        mean_ms = 1000 * self.busy_seconds / self.processed if self.processed else 0.0
+        return (f"{self.name}: {self.processed} files ({self.failed} failed) in {elapsed:.1f} s, "
+                f"{rate:.1f} files/s with {self.workers} workers, {mean_ms:.1f} ms per file")
+
+def analyze_measurements(file_paths: list[str]) -> tuple[list[float | None | Exception], float]:
+    """Run the peak detection on a batch of files in an analysis process and return the result for every file (or
+    the exception raised for it) and the time it took."""
+    start = time.perf_counter()
+    try:
+        results = find_emission_spectrum_peak_wavelengths(file_paths)
+    except Exception:
+        # Analyze the files one by one to find out which ones fail
+        results = []
+        for file_path in file_paths:
+            try:
+                results.append(find_emission_spectrum_peak_wavelength(file_path))
+            except Exception as exception:
+                results.append(exception)
+    return results, time.perf_counter() - start
+
+def upload_measurement(file_path: str, item_id: str, peak_parameter_id: str, peak_x: float) -> None:
+    """Upload the peak wavelength as an item value and the file as a measurement of the item."""
+    values = [{"parameterId": peak_parameter_id, "value": str(peak_x)}]
+    update_item(item_id, values)
+    create_measurement_from_file(item_id, MEASUREMENT_TITLE, PARSER_CODE, file_path)
+
+def upload_emission_spectrum_measurements(exp_col_param_map: dict[str, str], experiments_ids_map: dict[str, str],
+                                          analysis_workers: int = ANALYSIS_WORKERS,
+                                          upload_workers: int = UPLOAD_WORKERS, state: UploadState | None = None
+                                          ) -> tuple[list[tuple[str, Exception]], dict[str, StageStats]]:
+    """Analyze emission spectrum files, extract peak wavelengths, upload results and raw measurements.
+
+    The files go through a two-stage pipeline: the peak detection runs on batches of files in a pool of
+    `analysis_workers` processes, and the analyzed files are passed through a bounded queue to `upload_workers`
+    threads that upload them, so uploads start as soon as the first files are analyzed. A file that fails to be analyzed or uploaded does not
+    stop the others. Return the failures as (file path, exception) pairs and the statistics of each stage.
+
+    With a state, the files that were already uploaded to their item with the same content are skipped, and every
+    uploaded file is recorded in the state.
+    """
+    file_paths = sorted(glob.glob(f"{MEASUREMENT_FOLDER}/experiment_*_measurement.csv"))
+    if state is not None:
+        uploaded_paths = [
+            file_path for file_path in file_paths
+            if experiment_title_from_path(file_path) in experiments_ids_map
+            and state.is_measurement_uploaded(file_path, experiments_ids_map[experiment_title_from_path(file_path)])
+        ]
+        file_paths = sorted(set(file_paths) - set(uploaded_paths))
+        logger.info("  ✓ %d measurement files unchanged since the last run, %d to upload", len(uploaded_paths),
+                    len(file_paths))
+    peak_parameter_id = exp_col_param_map["Peak Wavelength (nm)"]
+    analysis_stats = StageStats("Analysis", analysis_workers)
+    upload_stats = StageStats("Upload", upload_workers)
+    upload_queue = queue.Queue(maxsize=UPLOAD_QUEUE_SIZE)
+    failures = []
+
+    def fail(file_path: str, exception: Exception) -> None:
+        logger.warning("  ✗ Failed to process measurement %s: %s", file_path, exception)
+        failures.append((file_path, exception))
+
+    def upload_worker() -> None:
+        while (task := upload_queue.get()) is not None:
+            file_path, peak_x = task
+            start = time.perf_counter()
+            try:
+                item_id = experiments_ids_map[experiment_title_from_path(file_path)]
+                upload_measurement(file_path, item_id, peak_parameter_id, peak_x)
+                if state is not None:
+                    state.save_measurement(file_path, item_id)
+            except Exception as exception:
+                fail(file_path, exception)
+                upload_stats.record(time.perf_counter() - start, failed=True)
+            else:
+                upload_stats.record(time.perf_counter() - start)
+
+    upload_threads = [threading.Thread(target=upload_worker) for _ in range(upload_workers)]
+    for thread in upload_threads:
+        thread.start()
+    try:
+        # Spread the files over the analysis processes in batches, which are small enough for the uploads to start
+        # early but large enough for the peak detection to run on many spectra at once
+        batch_size = max(1, min(ANALYSIS_BATCH_SIZE, -(-len(file_paths) // analysis_workers)))
+        batches = [file_paths[start:start + batch_size] for start in range(0, len(file_paths), batch_size)]
+        with ProcessPoolExecutor(max_workers=analysis_workers) as executor:
+            for batch, (results, seconds) in zip(batches, executor.map(analyze_measurements, batches)):
+                for file_path, peak_x in zip(batch, results):
+                    if isinstance(peak_x, Exception):
+                        fail(file_path, peak_x)
+                        analysis_stats.record(seconds / len(batch), failed=True)
+                        continue
+                    analysis_stats.record(seconds / len(batch))
+                    # Files without a peak have nothing to upload
+                    if peak_x is not None:
+                        upload_queue.put((file_path, peak_x))  # Blocks while the upload workers are behind
+                    elif state is not None and experiment_title_from_path(file_path) in experiments_ids_map:
+                        state.save_measurement(file_path, experiments_ids_map[experiment_title_from_path(file_path)])
+    finally:
+        for _ in upload_threads:
+            upload_queue.put(None)
+        for thread in upload_threads:
+            thread.join()
+
+    for stats in (analysis_stats, upload_stats):
+        logger.info("  %s", stats.summary())
+    return failures, {"analysis": analysis_stats, "upload": upload_stats}
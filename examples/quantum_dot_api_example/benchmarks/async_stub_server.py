@@ -0,0 +1,103 @@
+"""
+async_stub_server.py
+
+A minimal local stand-in for the MaterialsZone API built on `aiohttp.web`, used to check the
+async helpers. Unlike `stub_server.py`, it serves requests on an event loop, so thousands of
+requests can wait on the artificial latency at the same time without a thread each.
+
+It answers every request with a `{"data": ...}` JSON body like the real API: POST and PATCH
+requests echo the JSON payload back with an `id` derived from the path and title, multipart
+uploads are answered with their fields and the size and SHA-256 hash of every file, GET
+requests return an empty list and DELETE requests an empty object. Requests whose
+`authorization` header isn't `api_key` are rejected with a 401 response, and the first
+`fail_first_posts` POSTs are answered with a 503 response and a `Retry-After` header to
+exercise retries. The number of requests per method is counted in `request_counts`, and the
+largest number of requests handled at the same time in `max_in_flight`.
+"""
+
+import asyncio
+import hashlib
+import threading
+import uuid
+from collections import Counter
+
+from aiohttp import web
+
+API_KEY = "stub-api-key"
+
+
+class AsyncStubAPIServer:
+    """Run the stub API on a random local port, on an event loop in a background thread.
+
+    Use it as a context manager; `base_url` can be passed to `AsyncMZClient` or `MZClient`.
+    """
+
+    def __init__(self, latency: float = 0.0, api_key: str = API_KEY, fail_first_posts: int = 0):
+        self.latency = latency
+        self.api_key = api_key
+        self.fail_first_posts = fail_first_posts
+        self.request_counts = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.base_url = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.request_counts[request.method] += 1
+        # Decided on arrival, as the counts of concurrent requests change during the latency
+        fail = request.method == "POST" and self.request_counts["POST"] <= self.fail_first_posts
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if request.headers.get("authorization") != self.api_key:
+                return web.json_response({"message": "Unauthorized"}, status=401)
+            if fail:
+                await request.read()
+                return web.json_response({"message": "Service unavailable"}, status=503, headers={"Retry-After": "0"})
+            if request.method == "GET":
+                return web.json_response({"data": []})
+            if request.method == "DELETE":
+                return web.json_response({"data": {}})
+            if request.content_type == "multipart/form-data":
+                payload = {}
+                async for part in await request.multipart():
+                    if part.filename is None:
+                        payload[part.name] = await part.text()
+                        continue
+                    digest, size = hashlib.sha256(), 0
+                    while chunk := await part.read_chunk():
+                        digest.update(chunk)
+                        size += len(chunk)
+                    payload[part.name] = {"filename": part.filename, "size": size, "sha256": digest.hexdigest()}
+            else:
+                payload = await request.json()
+            if request.method == "PATCH":
+                return web.json_response({"data": {**payload, "id": request.path.rsplit("/", 1)[-1], "title": ""}})
+            item_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{request.path}/{payload.get('title', '')}"))
+            return web.json_response({"data": {**payload, "id": item_id}})
+        finally:
+            self.in_flight -= 1
+
+    async def _start(self) -> None:
+        app = web.Application(client_max_size=2 ** 30)  # Accept uploads of up to 1 GB
+        app.router.add_route("*", "/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = site._server.sockets[0].getsockname()[:2]
+        self.base_url = f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -0,0 +1,86 @@
+"""
+bench_analysis_pipeline.py
+
+Compares the serial analysis loop (peak detection, `update_item` and `create_measurement` for
+one file after the other, as `analysis.py` used to do) with the staged pipeline of
+`upload_emission_spectrum_measurements`, on synthetic spectra and against a local stub API
+that adds latency to every request. It also checks that both upload the same peak wavelengths.
+
+Run it from the example directory:
+
+    python benchmarks/bench_analysis_pipeline.py [number of files]
+"""
+
+import contextlib
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import analysis  # noqa: E402
+import mz_api_helpers  # noqa: E402
+from analysis import experiment_title_from_path, find_emission_spectrum_peak_wavelength  # noqa: E402
+from mz_api_helpers import MZClient  # noqa: E402
+from mz_operations import create_measurement, update_item  # noqa: E402
+from stub_server import StubAPIServer  # noqa: E402
+from synthetic_spectra import write_spectra  # noqa: E402
+
+LATENCY = 0.02  # Seconds added by the stub server to every request
+PEAK_PARAMETER = "Peak Wavelength (nm)"
+
+
+def upload_serially(file_paths: list[Path], ids_map: dict[str, str]) -> dict[str, float]:
+    peaks = {}
+    for file_path in file_paths:
+        peak_x = find_emission_spectrum_peak_wavelength(str(file_path))
+        item_id = ids_map[experiment_title_from_path(str(file_path))]
+        if peak_x is not None:
+            update_item(item_id, [{"parameterId": "p", "value": str(peak_x)}])
+            with open(file_path, "rb") as f:
+                create_measurement(item_id, "Emission Spectrum", "MZ-PH-AG-CA", (file_path.name, f, "text/csv"))
+            peaks[item_id] = peak_x
+    return peaks
+
+
+def main():
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with tempfile.TemporaryDirectory() as folder, StubAPIServer(latency=LATENCY) as server:
+        file_paths = write_spectra(Path(folder), n_files)
+        ids_map = {experiment_title_from_path(str(path)): f"item-{index}" for index, path in enumerate(file_paths)}
+        analysis.MEASUREMENT_FOLDER = folder
+        mz_api_helpers.set_client(MZClient(base_url=server.base_url, max_retries=0))
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = upload_serially(file_paths, ids_map)
+        elapsed = time.perf_counter() - start
+        print(f"{'serial':<10} {n_files / elapsed:>8.1f} files/sec")
+
+        # Record the peak wavelengths uploaded by the pipeline
+        uploaded = {}
+        update_item_in_pipeline = analysis.update_item
+
+        def recording_update_item(item_id, values):
+            uploaded[item_id] = float(values[0]["value"])
+            return update_item_in_pipeline(item_id, values)
+
+        analysis.update_item = recording_update_item
+        start = time.perf_counter()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            failures, stats = analysis.upload_emission_spectrum_measurements({PEAK_PARAMETER: "p"}, ids_map)
+        elapsed = time.perf_counter() - start
+        print(f"{'pipeline':<10} {n_files / elapsed:>8.1f} files/sec")
+        for stage in stats.values():
+            print(f"  {stage.summary()}")
+
+    assert not failures and uploaded.keys() == expected.keys()
+    assert all(abs(uploaded[item_id] - peak_x) <= 1e-9 * peak_x for item_id, peak_x in expected.items())
+    print("Both runs uploaded the same peak wavelengths.")
+
+
+if __name__ == "__main__":
+    main()
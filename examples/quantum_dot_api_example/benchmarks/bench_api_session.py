@@ -0,0 +1,52 @@
+"""
+bench_api_session.py
+
+Compares the throughput of bare `requests.post` calls (a new connection per request)
+with the pooled, keep-alive `MZClient` used by `mz_api_helpers`, against a local stub API.
+
+Run it from the example directory:
+
+    python benchmarks/bench_api_session.py
+"""
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mz_api_helpers import HEADERS, MZClient  # noqa: E402
+from stub_server import StubAPIServer  # noqa: E402
+
+N_REQUESTS = 2000
+N_THREADS = 8
+PAYLOAD = {"title": "QD_EXP_01", "values": [{"parameterId": "p", "value": "1.0"}]}
+
+
+def bare_post(base_url: str) -> None:
+    response = requests.post(f"{base_url}/tables/t/items", headers=HEADERS, json=PAYLOAD)
+    response.raise_for_status()
+
+
+def measure(label: str, send, threads: int) -> None:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda _: send(), range(N_REQUESTS)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {N_REQUESTS / elapsed:>10.0f} requests/sec")
+
+
+def main():
+    with StubAPIServer() as server:
+        for threads in (1, N_THREADS):
+            measure(f"bare requests.post ({threads} threads)", lambda: bare_post(server.base_url), threads)
+            with MZClient(base_url=server.base_url) as client:
+                measure(f"MZClient.post ({threads} threads)", lambda: client.post("/tables/t/items", PAYLOAD),
+                        threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+bench_async_client.py
+
+Compares creating many items with the thread pool of `mz_operations.create_items` and with
+`mz_async_operations.create_item` coroutines run with `asyncio.gather`, against a local aiohttp
+stub API with a simulated round-trip latency. It also checks that:
+
+- both produce the same items;
+- the async client never has more than `max_concurrency` requests in flight;
+- a wrong API key raises the same RuntimeError as `_raise_for_auth`;
+- a file upload answered with 503 responses is retried and the whole file is sent again.
+
+Run it from the example directory:
+
+    python benchmarks/bench_async_client.py [number of items]
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import mz_api_helpers  # noqa: E402
+import mz_async_api_helpers  # noqa: E402
+from async_stub_server import API_KEY, AsyncStubAPIServer  # noqa: E402
+from mz_api_helpers import MZClient  # noqa: E402
+from mz_async_api_helpers import AsyncMZClient  # noqa: E402
+from mz_async_operations import create_item, create_measurement_from_file  # noqa: E402
+from mz_operations import create_items  # noqa: E402
+
+LATENCY = 0.02  # Simulated round trip to the API, in seconds
+HEADERS = {"authorization": API_KEY}
+
+
+def make_items(count: int) -> list[tuple[str, list[dict]]]:
+    return [(f"QD_EXP_{index:05d}", [{"parameterId": "p", "value": str(index)}]) for index in range(count)]
+
+
+async def create_items_async(table_id: str, items: list[tuple[str, list[dict]]]) -> dict[str, str]:
+    created = await asyncio.gather(*(create_item(table_id, title, values) for title, values in items))
+    return {item["title"]: item["id"] for item in created}
+
+
+def time_async(client: AsyncMZClient, coroutine) -> tuple[object, float]:
+    async def run():
+        mz_async_api_helpers.set_client(client)
+        try:
+            return await coroutine
+        finally:
+            await mz_async_api_helpers.close_client()
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = asyncio.run(run())
+    return result, time.perf_counter() - start
+
+
+def main():
+    n_items = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    items = make_items(n_items)
+
+    with AsyncStubAPIServer(latency=LATENCY) as server:
+        mz_api_helpers.set_client(MZClient(base_url=server.base_url, headers=HEADERS, max_retries=0))
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected, _ = create_items("t", items)
+        elapsed = time.perf_counter() - start
+        print(f"{'create_items (16 threads)':<32} {n_items / elapsed:>8.0f} items/sec")
+
+        for max_concurrency in (16, 64, 256):
+            server.max_in_flight = 0
+            client = AsyncMZClient(base_url=server.base_url, headers=HEADERS, pool_maxsize=max_concurrency,
+                                   max_concurrency=max_concurrency, max_retries=0, adaptive_concurrency=False)
+            ids_map, elapsed = time_async(client, create_items_async("t", items))
+            print(f"{f'asyncio ({max_concurrency} concurrent)':<32} {n_items / elapsed:>8.0f} items/sec")
+            assert ids_map == expected
+            assert server.max_in_flight <= max_concurrency
+
+        client = AsyncMZClient(base_url=server.base_url, headers={"authorization": "wrong"}, max_retries=0)
+        try:
+            time_async(client, create_item("t", "QD_EXP_00001", []))
+        except RuntimeError as error:
+            assert str(error).startswith("Authentication failed")
+        else:
+            raise AssertionError("A wrong API key did not raise")
+
+    with tempfile.TemporaryDirectory() as folder, AsyncStubAPIServer(fail_first_posts=2) as server:
+        file_path = Path(folder) / "experiment_01_measurement.csv"
+        file_path.write_bytes(os.urandom(5 * 1024 * 1024))
+        client = AsyncMZClient(base_url=server.base_url, headers=HEADERS, max_retries=2, backoff_factor=0)
+        measurement, _ = time_async(
+            client, create_measurement_from_file("i", "Emission Spectrum", "MZ-PH-AG-CA", str(file_path)))
+        assert server.request_counts["POST"] == 3
+        assert measurement["rawFile"]["sha256"] == hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+    print("Both clients created the same items; the concurrency limit, auth errors and upload retries behave "
+          "as expected.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+bench_file_upload.py
+
+Compares the memory used to upload a large measurement file with `requests` building the
+multipart body in memory (as `post_with_file` used to do) and with the streamed
+`MultipartStream` body of `mz_api_helpers.py`, against a local stub API. It also checks that
+the streamed body is byte-for-byte the body `requests` builds, that the upload is retried from
+the start after a 503 response, and that no file handles are left open after many uploads.
+
+Run it from the example directory:
+
+    python benchmarks/bench_file_upload.py [file size in MB]
+"""
+
+import hashlib
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from requests.models import RequestEncodingMixin
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import mz_api_helpers  # noqa: E402
+from mz_api_helpers import MultipartStream, MZClient  # noqa: E402
+from mz_operations import create_measurement_from_file  # noqa: E402
+from stub_server import StubAPIServer  # noqa: E402
+
+PAYLOAD = {"title": "Emission Spectrum", "parserCode": "MZ-PH-AG-CA"}
+
+
+def upload_in_memory(client: MZClient, endpoint: str, file_path: Path) -> dict:
+    with open(file_path, "rb") as f:
+        files = {"rawFile": (file_path.name, f, "text/csv")}
+        return client.request("POST", endpoint, data=PAYLOAD, files=files).json()["data"]
+
+
+def measure(upload) -> tuple[dict, float, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = upload()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 2 ** 20
+
+
+def open_file_count() -> int:
+    return len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else 0
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with tempfile.TemporaryDirectory() as folder:
+        # The streamed body is the body requests builds, apart from the random boundary
+        small_file = Path(folder) / "small.csv"
+        small_file.write_bytes(b"Wavelength (nm),Intensity (a.u.)\n400.0,1.5\n")
+        with open(small_file, "rb") as f:
+            body = MultipartStream(PAYLOAD, {"rawFile": ("small.csv", f, "text/csv")}).read()
+            f.seek(0)
+            expected, content_type = RequestEncodingMixin._encode_files({"rawFile": ("small.csv", f, "text/csv")},
+                                                                       PAYLOAD)
+        boundary = content_type.split("boundary=")[1]
+        assert body.replace(body[2:body.index(b"\r\n")], boundary.encode()) == expected
+
+        large_file = Path(folder) / "large.csv"
+        with open(large_file, "wb") as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        with StubAPIServer() as server:
+            client = MZClient(base_url=server.base_url, max_retries=0)
+            mz_api_helpers.set_client(client)
+
+            _, elapsed, peak = measure(lambda: upload_in_memory(client, "/items/i/measurements", large_file))
+            print(f"{'requests files=':<16} {size_mb / elapsed:>8.0f} MB/s {peak:>8.0f} MB peak memory")
+            _, elapsed, peak = measure(
+                lambda: create_measurement_from_file("i", PAYLOAD["title"], PAYLOAD["parserCode"], str(large_file)))
+            print(f"{'MultipartStream':<16} {size_mb / elapsed:>8.0f} MB/s {peak:>8.0f} MB peak memory")
+
+            open_files = open_file_count()
+            for _ in range(200):
+                create_measurement_from_file("i", PAYLOAD["title"], PAYLOAD["parserCode"], str(small_file))
+            assert open_file_count() == open_files
+
+        # The first attempt is answered with a 503; the retry must send the whole body again
+        with StubAPIServer(fail_first_posts=1) as server, open(large_file, "rb") as f:
+            client = MZClient(base_url=server.base_url, max_retries=1, backoff_factor=0)
+            body = MultipartStream(PAYLOAD, {"rawFile": (large_file.name, f, "text/csv")})
+            received = client.request("POST", "/items/i/measurements", data=body,
+                                      headers={"Content-Type": body.content_type}).json()["data"]
+            body.seek(0)
+            assert server.request_counts["POST"] == 2
+            assert received["bodySha256"] == hashlib.sha256(body.read()).hexdigest()
+
+    print("The streamed body matches the body built by requests, is sent again in full on retries, "
+          "and no file handles were leaked.")
+
+
+if __name__ == "__main__":
+    main()
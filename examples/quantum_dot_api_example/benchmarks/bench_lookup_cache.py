@@ -0,0 +1,77 @@
+"""
+bench_lookup_cache.py
+
+Compares repeated folder and table lookups without a cache (a full `/folders` or `/tables`
+listing per call, as `mz_operations.py` used to do) with the cached lookups of
+`mz_operations.py`, against a local stub API with a large organisation and some latency per
+request. It counts the GET requests of each run and checks that tables created or deleted
+through `create_table` and `delete_table` show up in the cached lookups without a new listing.
+
+Run it from the example directory:
+
+    python benchmarks/bench_lookup_cache.py
+"""
+
+import contextlib
+import io
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import mz_api_helpers  # noqa: E402
+import mz_operations  # noqa: E402
+from mz_api_helpers import MZClient, get  # noqa: E402
+from stub_server import StubAPIServer  # noqa: E402
+
+N_FOLDERS = 2_000
+N_TABLES = 20_000
+N_LOOKUPS = 200
+LATENCY = 0.02  # Seconds added by the stub server to every request
+FOLDERS = [{"id": f"folder-{index}", "title": f"Folder {index}"} for index in range(N_FOLDERS)]
+TABLES = [{"id": f"table-{index}", "title": f"Table {index}", "folderId": f"folder-{index % N_FOLDERS}"}
+          for index in range(N_TABLES)]
+
+
+def lookup_without_cache(folder_title: str) -> list[dict]:
+    folder_id = next(folder["id"] for folder in get("/folders") if folder["title"] == folder_title)
+    return [table for table in get("/tables") if table["folderId"] == folder_id]
+
+
+def lookup_with_cache(folder_title: str) -> list[dict]:
+    return mz_operations.get_tables_in_folder(mz_operations.get_folder_id_by_name(folder_title))
+
+
+def timed(server: StubAPIServer, lookup) -> tuple[float, int, list]:
+    server.request_counts.clear()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [lookup(f"Folder {index % 50}") for index in range(N_LOOKUPS)]
+    return time.perf_counter() - start, server.request_counts["GET"], results
+
+
+def main():
+    with StubAPIServer(latency=LATENCY, listings={"/folders": FOLDERS, "/tables": TABLES}) as server:
+        mz_api_helpers.set_client(MZClient(base_url=server.base_url, max_retries=0))
+
+        elapsed, requests, expected = timed(server, lookup_without_cache)
+        print(f"{'without cache':<16} {N_LOOKUPS / elapsed:>10.0f} lookups/sec {requests:>6} GET requests")
+        elapsed, requests, results = timed(server, lookup_with_cache)
+        print(f"{'with cache':<16} {N_LOOKUPS / elapsed:>10.0f} lookups/sec {requests:>6} GET requests")
+        assert results == expected
+
+        # Writes through mz_operations keep the cached tables coherent without listing them again
+        server.request_counts.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            table_id = mz_operations.create_table("folder-7", "New table")
+            assert table_id in {table["id"] for table in mz_operations.get_tables_in_folder("folder-7")}
+            mz_operations.delete_table(table_id)
+            assert table_id not in {table["id"] for table in mz_operations.get_tables_in_folder("folder-7")}
+        assert server.request_counts["GET"] == 0
+
+    print("Cached lookups return the same tables and follow the tables created and deleted in between.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+bench_measurement_reader.py
+
+Compares reading measurement files with `pd.read_csv` and with `read_measurement` of
+`measurement_reader.py`, in files per second, on synthetic emission spectra and on instrument
+exports with `#` metadata lines (like `parser_manager_cli/measurement_files/keithley_iv.csv`).
+It also checks that all readers return the same values.
+
+Run it from the example directory:
+
+    python benchmarks/bench_measurement_reader.py [number of files]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from measurement_reader import read_measurement  # noqa: E402
+from synthetic_spectra import make_spectra, write_spectra  # noqa: E402
+
+METADATA = "# Instrument: Keithley 2450 SourceMeter\n# Measurement Type: I-V Sweep\n"
+
+
+def write_iv_sweeps(folder: Path, count: int) -> list[Path]:
+    """Write I-V sweeps with metadata lines, shaped like the Keithley export of the parser example."""
+    folder.mkdir(parents=True, exist_ok=True)
+    voltages, currents = make_spectra(count)
+    paths = []
+    for index, current in enumerate(currents):
+        path = folder / f"iv_{index}.csv"
+        rows = zip((voltages / 100).tolist(), (current / 1e4).tolist())
+        path.write_text(METADATA + "Voltage (V),Current (A)\n" + "".join(f"{v!r},{i!r}\n" for v, i in rows))
+        paths.append(path)
+    return paths
+
+
+READERS = {
+    "pd.read_csv": lambda path: pd.read_csv(path, comment="#", float_precision="round_trip").to_numpy(),
+    "read_measurement": lambda path: read_measurement(path)[1],
+}
+
+
+def main():
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    with tempfile.TemporaryDirectory() as folder:
+        datasets = {
+            "spectra": write_spectra(Path(folder) / "spectra", n_files),
+            "I-V sweeps with metadata": write_iv_sweeps(Path(folder) / "iv", n_files),
+        }
+        for dataset, file_paths in datasets.items():
+            print(f"{dataset} ({n_files} files):")
+            expected = None
+            for name, read in READERS.items():
+                start = time.perf_counter()
+                arrays = [read(path) for path in file_paths]
+                elapsed = time.perf_counter() - start
+                print(f"  {name:<18} {n_files / elapsed:>8.0f} files/sec")
+                if expected is None:
+                    expected = arrays
+                assert all(np.array_equal(array, reference) for array, reference in zip(arrays, expected))
+
+    print("All readers return the same values.")
+
+
+if __name__ == "__main__":
+    main()
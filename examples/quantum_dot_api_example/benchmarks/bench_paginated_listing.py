@@ -0,0 +1,88 @@
+"""
+bench_paginated_listing.py
+
+Compares a cold folder and table lookup made from whole `/folders` and `/tables` listings (as
+`mz_operations.py` used to do) with the paginated lookups of `mz_operations.py`, which stop
+fetching folders at the page with the folder and let the server filter the tables by folder,
+against a local stub API with a large organisation. It reports the requests, the bytes
+received and the peak memory of each lookup (of the client and the stub together, as they
+run in the same process), and checks that:
+
+- both lookups return the same tables;
+- a server that ignores the pagination and the filter gives the same result, without
+  fetching its listing twice.
+
+Run it from the example directory:
+
+    python benchmarks/bench_paginated_listing.py
+"""
+
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import mz_api_helpers  # noqa: E402
+import mz_operations  # noqa: E402
+from mz_api_helpers import MZClient, add_request_hook, get, remove_request_hook  # noqa: E402
+from mz_metrics import RequestMetrics  # noqa: E402
+from stub_server import StubAPIServer  # noqa: E402
+
+N_FOLDERS = 5_000
+N_TABLES = 50_000
+FOLDER_TITLE = "Folder 42"
+FOLDERS = [{"id": f"folder-{index}", "title": f"Folder {index}", "description": "x" * 100}
+           for index in range(N_FOLDERS)]
+TABLES = [{"id": f"table-{index}", "title": f"Table {index}", "folderId": f"folder-{index % N_FOLDERS}",
+           "description": "x" * 100} for index in range(N_TABLES)]
+
+
+def lookup_whole_listings(folder_title: str) -> list[dict]:
+    folder_id = next(folder["id"] for folder in get("/folders") if folder["title"] == folder_title)
+    return [table for table in get("/tables") if table["folderId"] == folder_id]
+
+
+def lookup_paginated(folder_title: str) -> list[dict]:
+    mz_operations.invalidate_cache()
+    return mz_operations.get_tables_in_folder(mz_operations.get_folder_id_by_name(folder_title))
+
+
+def measure(label: str, lookup) -> list[dict]:
+    metrics = RequestMetrics()
+    add_request_hook(metrics)
+    tracemalloc.start()
+    start = time.perf_counter()
+    tables = lookup(FOLDER_TITLE)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    remove_request_hook(metrics)
+    summary = metrics.summary().values()
+    requests = sum(endpoint["count"] for endpoint in summary)
+    received = sum(endpoint["bytes_received"] for endpoint in summary)
+    print(f"{label:<28} {elapsed * 1000:>8.1f} ms {requests:>4} GET {received / 1e6:>8.2f} MB received "
+          f"{peak / 1e6:>8.2f} MB peak memory")
+    return tables
+
+
+def main():
+    listings = {"/folders": FOLDERS, "/tables": TABLES}
+    with StubAPIServer(listings=listings) as server:
+        mz_api_helpers.set_client(MZClient(base_url=server.base_url, max_retries=0))
+        expected = measure("whole listings", lookup_whole_listings)
+        tables = measure("paginated, filtered", lookup_paginated)
+        assert tables == expected and len(tables) == N_TABLES // N_FOLDERS
+
+    with StubAPIServer(listings=listings, ignore_query=True) as server:
+        mz_api_helpers.set_client(MZClient(base_url=server.base_url, max_retries=0))
+        tables = measure("server ignoring the query", lookup_paginated)
+        assert tables == expected
+        assert server.request_counts["GET"] == 2
+
+    print("Paginated lookups return the same tables, also from a server that ignores the pagination.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+bench_peak_detection.py
+
+Compares finding the peak wavelength of synthetic emission spectra file by file (pandas
+`read_csv` and scipy `find_peaks` per file, as `analysis.py` used to do) with the batch API
+`find_emission_spectrum_peak_wavelengths`, which stacks the spectra into one array and searches
+them for peaks in one vectorized pass. It also times the peak search alone on the stacked array,
+and checks that both find the same peaks, including for spectra with flat peaks and for files
+on a different wavelength grid, which take the fallback paths.
+
+Run it from the example directory:
+
+    python benchmarks/bench_peak_detection.py [number of spectra]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.signal import find_peaks
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from analysis import find_emission_spectrum_peak_wavelengths, find_peak_indices  # noqa: E402
+from synthetic_spectra import make_spectra, write_spectra  # noqa: E402
+
+
+def find_peak_wavelength_with_pandas(file_path: str) -> float | None:
+    """The original implementation of find_emission_spectrum_peak_wavelength."""
+    df = pd.read_csv(file_path)
+    x = df.iloc[:, 0].values
+    y = df.iloc[:, 1].values
+    peaks, _ = find_peaks(y)
+    return x[peaks[np.argmax(y[peaks])]] if len(peaks) > 0 else None
+
+
+def find_peak_indices_row_by_row(y: np.ndarray) -> np.ndarray:
+    indices = []
+    for row in y:
+        peaks, _ = find_peaks(row)
+        indices.append(peaks[np.argmax(row[peaks])] if len(peaks) > 0 else -1)
+    return np.array(indices)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    n_spectra = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+
+    # Peak search alone, on spectra that are already in memory. Some spectra get a flat peak.
+    _, y = make_spectra(n_spectra)
+    y[::100, 150:153] = y[::100].max(axis=1, keepdims=True) + 1
+    expected, elapsed_loop = timed(find_peak_indices_row_by_row, y)
+    actual, elapsed_batch = timed(find_peak_indices, y)
+    print(f"{'find_peaks per row':<34} {n_spectra / elapsed_loop:>10.0f} spectra/sec")
+    print(f"{'find_peak_indices':<34} {n_spectra / elapsed_batch:>10.0f} spectra/sec")
+    assert np.array_equal(actual, expected)
+
+    # Full analysis, from the files. The last spectra are on a different grid and take the per-file path.
+    with tempfile.TemporaryDirectory() as folder:
+        file_paths = [str(path) for path in write_spectra(Path(folder), n_spectra)]
+        for file_path in file_paths[-10:]:
+            lines = Path(file_path).read_text().splitlines()
+            Path(file_path).write_text("\n".join(lines[:1] + lines[1::2]) + "\n")
+
+        expected, elapsed_loop = timed(lambda: [find_peak_wavelength_with_pandas(path) for path in file_paths])
+        actual, elapsed_batch = timed(find_emission_spectrum_peak_wavelengths, file_paths)
+    print(f"{'read_csv and find_peaks per file':<34} {n_spectra / elapsed_loop:>10.0f} files/sec")
+    print(f"{'find_emission_spectrum_peak_wavelengths':<34} {n_spectra / elapsed_batch:>10.0f} files/sec")
+    # read_measurement parses the numbers exactly, pandas may differ in the last digit
+    assert np.allclose(np.array(actual, dtype=float), np.array(expected, dtype=float), rtol=1e-12, equal_nan=True)
+    print("Both implementations find the same peaks.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+bench_rate_limit.py
+
+Creates many items with `create_items` against a local stub API that throttles requests with
+429 responses, like a rate-limited API, and compares clients with and without the pacing of
+`MZClient` (token bucket and adaptive concurrency limit). For each client it reports the
+throughput, the number of 429 responses received and the number of items that failed.
+
+Two kinds of limits are simulated: a limit on the number of requests handled at the same time
+(429 without Retry-After), and a limit on the number of requests per second (429 with a
+Retry-After header).
+
+Run it from the example directory:
+
+    python benchmarks/bench_rate_limit.py [number of items]
+"""
+
+import contextlib
+import io
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import mz_api_helpers  # noqa: E402
+from mz_api_helpers import MZClient  # noqa: E402
+from mz_operations import create_items  # noqa: E402
+from stub_server import StubAPIServer  # noqa: E402
+
+LATENCY = 0.02  # Simulated round trip to the API, in seconds
+MAX_IN_FLIGHT = 6  # Requests the stub handles at the same time
+RATE_LIMIT = 100  # Requests per second the stub accepts
+
+
+def run(label: str, server_options: dict, client_options: dict, n_items: int) -> None:
+    items = [(f"QD_EXP_{index:05d}", [{"parameterId": "p", "value": str(index)}]) for index in range(n_items)]
+    with StubAPIServer(latency=LATENCY, **server_options) as server:
+        mz_api_helpers.set_client(MZClient(base_url=server.base_url, backoff_factor=0.05, **client_options))
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, failures = create_items("t", items)
+        elapsed = time.perf_counter() - start
+        created = n_items - len(failures)
+        print(f"{label:<46} {created / elapsed:>6.0f} items/sec {server.throttled_count:>6} x 429 "
+              f"{len(failures):>6} failed")
+
+
+def main():
+    n_items = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    print(f"Server handles at most {MAX_IN_FLIGHT} requests at a time:")
+    server_options = {"max_in_flight": MAX_IN_FLIGHT}
+    run("  no pacing, no retries", server_options, {"adaptive_concurrency": False, "max_retries": 0}, n_items)
+    run("  no pacing, retries", server_options, {"adaptive_concurrency": False}, n_items)
+    run("  adaptive concurrency", server_options, {}, n_items)
+
+    print(f"Server accepts at most {RATE_LIMIT} requests per second:")
+    server_options = {"rate_limit": RATE_LIMIT}
+    run("  no pacing, no retries", server_options, {"adaptive_concurrency": False, "max_retries": 0}, n_items)
+    run("  adaptive concurrency, Retry-After", server_options, {}, n_items)
+    run(f"  adaptive concurrency, rate_limit={RATE_LIMIT}", server_options, {"rate_limit": RATE_LIMIT}, n_items)
+
+
+if __name__ == "__main__":
+    main()
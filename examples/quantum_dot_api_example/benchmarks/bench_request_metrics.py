@@ -0,0 +1,150 @@
+"""
+bench_request_metrics.py
+
+Measures what the instrumentation costs per call: the per-item messages printed as they used to
+be, logged, and filtered out by the log level, and the request hooks with and without a
+`mz_metrics.RequestMetrics` collecting statistics. It also checks that:
+
+- the estimated latency percentiles are within 20% of the real ones;
+- the metrics count every request a stub API received, with the retries, failures and bytes;
+- the requests of `AsyncMZClient` are recorded too;
+- the Prometheus text is well formed and its histograms are cumulative.
+
+Run it from the example directory:
+
+    python benchmarks/bench_request_metrics.py [number of calls]
+"""
+
+import asyncio
+import logging
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import mz_api_helpers  # noqa: E402
+import mz_async_api_helpers  # noqa: E402
+from async_stub_server import API_KEY, AsyncStubAPIServer  # noqa: E402
+from mz_api_helpers import MZClient, add_request_hook, notify_request_hooks, remove_request_hook  # noqa: E402
+from mz_async_api_helpers import AsyncMZClient  # noqa: E402
+from mz_async_operations import create_item  # noqa: E402
+from mz_metrics import RequestMetrics  # noqa: E402
+from mz_operations import create_items  # noqa: E402
+from stub_server import StubAPIServer  # noqa: E402
+
+N_THREADS = 8
+FAILING_TITLE = "QD_EXP_00007"
+# A sample line of the Prometheus text format: name, optional labels and value
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]\w*="([^"\\]|\\.)*",?)*\})? \S+$')
+
+
+def make_items(count: int) -> list[tuple[str, list[dict]]]:
+    return [(f"QD_EXP_{index:05d}", [{"parameterId": "p", "value": str(index)}]) for index in range(count)]
+
+
+def measure(label: str, function, count: int) -> None:
+    start = time.perf_counter()
+    for index in range(count):
+        function(index)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<48} {elapsed / count * 1e6:>8.2f} µs/call")
+
+
+def check_prometheus(text: str) -> None:
+    buckets = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            assert line.split()[1] in ("HELP", "TYPE"), line
+            continue
+        assert SAMPLE_LINE.match(line), line
+        name, value = line.rsplit(" ", 1)
+        float(value)
+        if "_bucket{" in name:
+            series = re.sub(r',le="[^"]*"', "", name)
+            assert float(value) >= buckets.get(series, 0), f"{line} is not cumulative"
+            buckets[series] = float(value)
+
+
+def main():
+    n_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    items = make_items(100)
+    operations_logger = logging.getLogger("mz_operations")
+
+    # Write to a line-buffered file, which costs a write per message like printing to a terminal does
+    with tempfile.TemporaryFile("w", buffering=1) as console:
+        measure("print (before)", lambda index: print(f"  ✓ Created item QD_EXP_{index:05d} with id {index}",
+                                                      file=console), n_calls)
+        handler = logging.StreamHandler(console)
+        operations_logger.addHandler(handler)
+        operations_logger.propagate = False
+        operations_logger.setLevel(logging.DEBUG)
+        measure("logger.debug, DEBUG level", lambda index: operations_logger.debug(
+            "  ✓ Created item %s with id %s", f"QD_EXP_{index:05d}", index), n_calls)
+        operations_logger.setLevel(logging.INFO)
+        measure("logger.debug, INFO level (the default)", lambda index: operations_logger.debug(
+            "  ✓ Created item %s with id %s", f"QD_EXP_{index:05d}", index), n_calls)
+        operations_logger.removeHandler(handler)
+        operations_logger.propagate = True
+        operations_logger.setLevel(logging.NOTSET)
+
+    def notify(index: int) -> None:
+        notify_request_hooks("POST", f"/tables/t{index % 2}/items", 200, 0.001 * (index % 100), 100, 200, 0, None)
+
+    measure("notify_request_hooks, no hook", notify, n_calls)
+    metrics = RequestMetrics()
+    add_request_hook(metrics)
+    measure("notify_request_hooks, RequestMetrics hook", notify, n_calls)
+    remove_request_hook(metrics)
+    summary = metrics.summary()["POST /tables/{id}/items"]
+    assert summary["count"] == n_calls and summary["statuses"] == {"200": n_calls}
+    assert 0 < summary["p50_seconds"] <= summary["p95_seconds"] <= summary["p99_seconds"]
+    # The real percentiles of the durations are 0.049, 0.094 and 0.098 seconds
+    for percentile, expected in ((50, 0.049), (95, 0.094), (99, 0.098)):
+        assert abs(summary[f"p{percentile}_seconds"] - expected) / expected < 0.2
+
+    with StubAPIServer(fail_titles={FAILING_TITLE}, fail_first_posts=3) as server:
+        mz_api_helpers.set_client(MZClient(base_url=server.base_url, max_retries=5, backoff_factor=0))
+        metrics = RequestMetrics()
+        add_request_hook(metrics)
+        operations_logger.setLevel(logging.ERROR)  # Hide the expected failure
+        _, failures = create_items("t", items, N_THREADS)
+        operations_logger.setLevel(logging.NOTSET)
+        remove_request_hook(metrics)
+
+        summary = metrics.summary()["POST /tables/{id}/items"]
+        assert [title for _, title, _ in failures] == [FAILING_TITLE]
+        assert summary["count"] == 100 and summary["retries"] == 3
+        assert summary["statuses"] == {"200": 99, "400": 1}
+        assert summary["errors"] == {"HTTP 400": 1}
+        assert summary["count"] + summary["retries"] == server.request_counts["POST"]
+        check_prometheus(metrics.to_prometheus())
+        assert 'mz_api_requests_total{method="POST",endpoint="/tables/{id}/items",status="400"} 1' in (
+            metrics.to_prometheus())
+
+    with AsyncStubAPIServer(fail_first_posts=2) as server:
+        async def run():
+            mz_async_api_helpers.set_client(AsyncMZClient(base_url=server.base_url, headers={"authorization": API_KEY},
+                                                          max_retries=2, backoff_factor=0))
+            try:
+                await asyncio.gather(*(create_item("t", title, values) for title, values in items))
+            finally:
+                await mz_async_api_helpers.close_client()
+
+        metrics = RequestMetrics()
+        add_request_hook(metrics)
+        asyncio.run(run())
+        remove_request_hook(metrics)
+
+        summary = metrics.summary()["POST /tables/{id}/items"]
+        assert summary["count"] == 100 and summary["retries"] == 2
+        assert summary["count"] + summary["retries"] == server.request_counts["POST"]
+        check_prometheus(metrics.to_prometheus())
+
+    print("The metrics match the requests received by the stubs, and the Prometheus text is well formed.")
+
+
+if __name__ == "__main__":
+    main()
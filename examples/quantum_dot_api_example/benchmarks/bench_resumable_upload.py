@@ -0,0 +1,102 @@
+"""
+bench_resumable_upload.py
+
+Runs the full workflow of `main.py` several times against a local stub API, on a synthetic
+workbook and synthetic measurement files, and counts the requests of every run:
+
+1. a first run, in which some experiments are rejected by the server (like a run that stops
+   half-way);
+2. a second run, which only creates the rejected experiments and uploads their measurements;
+3. a run without any change, which only looks up the folder and tables;
+4. a run after changing a few rows and measurement files, which only sends those.
+
+Run it from the example directory:
+
+    python benchmarks/bench_resumable_upload.py [number of experiments]
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import analysis  # noqa: E402
+import main as workflow  # noqa: E402
+import mz_api_helpers  # noqa: E402
+import mz_operations  # noqa: E402
+from mz_api_helpers import MZClient  # noqa: E402
+from stub_server import StubAPIServer  # noqa: E402
+from synthetic_spectra import write_spectra  # noqa: E402
+
+N_MATERIALS = 10
+N_CHANGED = 10
+
+
+def write_workbook(path: Path, n_experiments: int, seed: int = 0) -> None:
+    """Write a workbook like quantum_dot_example.xlsx with more experiments."""
+    rng = np.random.default_rng(seed)
+    materials = pd.read_excel(workflow.EXCEL_PATH, sheet_name="Materials").head(N_MATERIALS)
+    experiments = pd.DataFrame({"Experiment ID": [f"QD_EXP_{index:02d}" for index in range(1, n_experiments + 1)]})
+    for column in ("Spin Speed (rpm)", "Annealing Temp (C)", "Annealing Time (min)", "Photoluminescence (a.u.)",
+                   "Conductivity (S/m)", "Quantum Efficiency (%)"):
+        experiments[column] = rng.uniform(1, 100, n_experiments).round(2)
+    for name in materials["Name"]:
+        experiments[name] = rng.uniform(0, 10, n_experiments).round(2)
+    with pd.ExcelWriter(path) as writer:
+        materials.to_excel(writer, sheet_name="Materials", index=False)
+        experiments.to_excel(writer, sheet_name="Experiments", index=False)
+
+
+def run(server: StubAPIServer, label: str) -> None:
+    mz_operations.invalidate_cache()  # Every run starts like a new process
+    server.request_counts.clear()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        workflow.main()
+    elapsed = time.perf_counter() - start
+    counts = ", ".join(f"{count} {method}" for method, count in sorted(server.request_counts.items()))
+    print(f"{label:<28} {elapsed:>6.1f} s   {counts}")
+
+
+def main():
+    n_experiments = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    folders = [{"id": "folder", "title": workflow.FOLDER_TITLE}]
+    rejected = {f"QD_EXP_{index:02d}" for index in range(n_experiments // 2, n_experiments + 1, 7)}
+
+    with tempfile.TemporaryDirectory() as folder:
+        write_workbook(Path(folder) / "workbook.xlsx", n_experiments)
+        workflow.EXCEL_PATH = str(Path(folder) / "workbook.xlsx")
+        file_paths = write_spectra(Path(folder) / "measurements", n_experiments)
+        analysis.MEASUREMENT_FOLDER = str(Path(folder) / "measurements")
+        workflow.STATE_PATH = str(Path(folder) / "upload_state.sqlite")
+
+        with StubAPIServer(latency=0.005, fail_titles=rejected, listings={"/folders": folders}) as server:
+            mz_api_helpers.set_client(MZClient(base_url=server.base_url, max_retries=0))
+            workflow.SYNC_TABLES = False  # Only the record of the last run tells what to upload
+            run(server, f"first run ({len(rejected)} rejected)")
+            server._server.fail_titles = frozenset()
+            run(server, "resumed run")
+            run(server, "run without changes")
+
+            df = pd.read_excel(workflow.EXCEL_PATH, sheet_name=None)
+            df["Experiments"].loc[:N_CHANGED - 1, "Spin Speed (rpm)"] += 1
+            with pd.ExcelWriter(workflow.EXCEL_PATH) as writer:
+                for sheet, df_sheet in df.items():
+                    df_sheet.to_excel(writer, sheet_name=sheet, index=False)
+            for file_path in file_paths[-N_CHANGED:]:
+                with open(file_path, "a") as f:
+                    f.write("700.5,0.0\n")
+                os.utime(file_path)
+            run(server, f"{N_CHANGED} rows, {N_CHANGED} files changed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+bench_table_sync.py
+
+Counts the requests `main.py` sends to bring the Materials and Experiments tables up to date
+with a synthetic workbook, against a local stub API, when it deletes and recreates the tables
+(as it used to do on every run) and when it syncs the existing tables (`SYNC_TABLES`). It also
+checks that the synced tables end up with the same items and values as recreated ones.
+
+Measurement files are left out, so only the tables and items are compared. Run it from the
+example directory:
+
+    python benchmarks/bench_table_sync.py [number of experiments]
+"""
+
+import contextlib
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import analysis  # noqa: E402
+import main as workflow  # noqa: E402
+import mz_api_helpers  # noqa: E402
+import mz_operations  # noqa: E402
+from bench_resumable_upload import write_workbook  # noqa: E402
+from mz_api_helpers import MZClient  # noqa: E402
+from stub_server import StubAPIServer  # noqa: E402
+
+N_CHANGED = 10
+
+
+def run(server: StubAPIServer, label: str, sync: bool) -> None:
+    workflow.SYNC_TABLES = sync
+    if not sync:
+        Path(workflow.STATE_PATH).unlink(missing_ok=True)  # Without a record of the last run, tables are recreated
+    mz_operations.invalidate_cache()
+    server.request_counts.clear()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        workflow.main()
+    elapsed = time.perf_counter() - start
+    counts = ", ".join(f"{count} {method}" for method, count in sorted(server.request_counts.items()))
+    print(f"{label:<38} {elapsed:>6.1f} s   {counts}")
+
+
+def table_contents(server: StubAPIServer) -> dict:
+    """Return the items of every table of the stub as a map from table titles to item titles to values."""
+    listings = server._server.listings
+    return {
+        table["title"]: {
+            item["title"]: {mz_operations._value_key(value): float(value["value"]) for value in item["values"]}
+            for item in listings.get(f"/tables/{table['id']}/items", [])
+        }
+        for table in listings["/tables"]
+    }
+
+
+def change_rows(excel_path: str) -> None:
+    df = pd.read_excel(excel_path, sheet_name=None)
+    df["Experiments"].loc[:N_CHANGED - 1, "Spin Speed (rpm)"] += 1
+    with pd.ExcelWriter(excel_path) as writer:
+        for sheet, df_sheet in df.items():
+            df_sheet.to_excel(writer, sheet_name=sheet, index=False)
+
+
+def main():
+    n_experiments = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    folders = [{"id": "folder", "title": workflow.FOLDER_TITLE}]
+
+    with tempfile.TemporaryDirectory() as folder:
+        write_workbook(Path(folder) / "workbook.xlsx", n_experiments)
+        workflow.EXCEL_PATH = str(Path(folder) / "workbook.xlsx")
+        analysis.MEASUREMENT_FOLDER = str(Path(folder) / "measurements")
+        workflow.STATE_PATH = str(Path(folder) / "upload_state.sqlite")
+
+        with StubAPIServer(latency=0.005, listings={"/folders": list(folders)}) as recreated, \
+                StubAPIServer(latency=0.005, listings={"/folders": list(folders)}) as synced:
+            mz_api_helpers.set_client(MZClient(base_url=recreated.base_url, max_retries=0))
+            run(recreated, "delete and recreate, first run", sync=False)
+            run(recreated, "delete and recreate, no changes", sync=False)
+
+            mz_api_helpers.set_client(MZClient(base_url=synced.base_url, max_retries=0))
+            run(synced, "sync, first run", sync=True)
+            run(synced, "sync, no changes", sync=True)
+            assert sum(synced.request_counts[method] for method in ("POST", "PATCH", "DELETE")) == 0
+
+            change_rows(workflow.EXCEL_PATH)
+            run(synced, f"sync, {N_CHANGED} rows changed", sync=True)
+            assert synced.request_counts["PATCH"] == N_CHANGED and synced.request_counts["POST"] == 0
+            mz_api_helpers.set_client(MZClient(base_url=recreated.base_url, max_retries=0))
+            run(recreated, f"delete and recreate, {N_CHANGED} rows changed", sync=False)
+
+        assert table_contents(synced) == table_contents(recreated)
+    print("The synced tables have the same items and values as the recreated ones.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+stub_server.py
+
+A minimal local stand-in for the MaterialsZone API, used by the benchmarks in this folder.
+
+It answers every request with a `{"data": ...}` JSON body like the real API: POST requests
+echo the JSON payload back with an `id` derived from the path and title (so repeated runs
+return the same ids) and add the new object to the listing of their path, GET requests return
+the listing of their path (given to the constructor or built by POSTs, an empty list by
+default), PATCH requests update the object with the ID at the end of their path (item values
+one parameter at a time) and return it, and DELETE requests remove that object from all
+listings and return an empty object. Bodies that aren't JSON, such as file uploads, are read
+in chunks and answered with their size and SHA-256 hash. The number of requests per method is
+counted in `request_counts`.
+
+Listings are paginated with the `limit` and `offset` query parameters and filtered by the
+other query parameters (e.g. `folderId`), unless `ignore_query` is set to simulate a server
+that always returns whole listings.
+
+An artificial latency can be injected to simulate the round trip to the real server, POSTs
+whose title is in `fail_titles` are rejected with a 400 response, and the first
+`fail_first_posts` POSTs are answered with a 503 response and a `Retry-After` header to
+exercise retries.
+
+Like a rate-limited API, the stub can also throttle requests with 429 responses: requests
+above `rate_limit` per second (with a `Retry-After` header telling when to try again), and
+requests that arrive while `max_in_flight` requests are already being handled. Throttled
+requests are counted in `throttled_count`.
+"""
+
+import functools
+import hashlib
+import json
+import math
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+def _value_key(value: dict) -> tuple:
+    return value.get("parameterId"), value.get("formulationProtocolId"), value.get("formulationItemId")
+
+
+def _throttled(handler):
+    """Answer with a 429 response instead of running the handler while the request limits of the stub are exceeded."""
+    @functools.wraps(handler)
+    def throttled_handler(self):
+        server = self.server
+        retry_after = None
+        with server.lock:
+            if server.rate_limit is not None:
+                now = time.monotonic()
+                refill = (now - server.tokens_updated_at) * server.rate_limit
+                server.tokens = min(server.rate_limit, server.tokens + refill)
+                server.tokens_updated_at = now
+                if server.tokens < 1:
+                    retry_after = math.ceil((1 - server.tokens) / server.rate_limit)
+            throttled = retry_after is not None or (server.max_in_flight is not None
+                                                    and server.in_flight >= server.max_in_flight)
+            if throttled:
+                server.throttled_count += 1
+            else:
+                server.in_flight += 1
+                if server.rate_limit is not None:
+                    server.tokens -= 1
+        if throttled:
+            self._read_payload()
+            headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+            self._respond({"message": "Too many requests"}, status=429, headers=headers)
+            return
+        try:
+            handler(self)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+    return throttled_handler
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep connections alive between requests
+    disable_nagle_algorithm = True
+
+    def _respond(self, data: object, status: int = 200, headers: dict | None = None) -> None:
+        with self.server.lock:
+            self.server.request_counts[self.command] += 1
+        time.sleep(self.server.latency)
+        body = json.dumps({"data": data}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_payload(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            body = self.rfile.read(length)
+            return json.loads(body) if body else {}
+        # Other bodies (file uploads) are read in chunks and only their size and hash are kept
+        digest = hashlib.sha256()
+        while length > 0:
+            chunk = self.rfile.read(min(length, 1024 * 1024))
+            if not chunk:
+                break
+            digest.update(chunk)
+            length -= len(chunk)
+        return {"bodySize": int(self.headers.get("Content-Length", 0)), "bodySha256": digest.hexdigest()}
+
+    @_throttled
+    def do_GET(self):
+        url = urlsplit(self.path)
+        listing = self.server.listings.get(url.path, [])
+        if self.server.ignore_query:
+            self._respond(listing)
+            return
+        params = dict(parse_qsl(url.query))
+        offset = int(params.pop("offset", 0))
+        limit = int(params.pop("limit", len(listing)))
+        if params:
+            listing = [item for item in listing if all(str(item.get(name)) == value for name, value in params.items())]
+        self._respond(listing[offset:offset + limit])
+
+    @_throttled
+    def do_POST(self):
+        payload = self._read_payload()
+        with self.server.lock:
+            unavailable = self.server.request_counts["POST"] < self.server.fail_first_posts
+        if unavailable:
+            self._respond({"message": "Service unavailable"}, status=503, headers={"Retry-After": "0"})
+            return
+        title = payload.get("title", "")
+        if title in self.server.fail_titles:
+            self._respond({"message": f"Item {title} was rejected"}, status=400)
+            return
+        created = {**payload, "id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{self.path}/{title}"))}
+        with self.server.lock:
+            self.server.listings.setdefault(self.path, []).append(created)
+            self.server.objects[created["id"]] = created
+        self._respond(created)
+
+    @_throttled
+    def do_PATCH(self):
+        payload = self._read_payload()
+        object_id = self.path.rsplit("/", 1)[-1]
+        with self.server.lock:
+            updated = self.server.objects.setdefault(object_id, {"id": object_id, "title": ""})
+            # Values are updated one by one, keeping the values of the parameters that aren't in the payload
+            values = {_value_key(value): value for value in updated.get("values", []) + payload.get("values", [])}
+            updated.update(payload, **({"values": list(values.values())} if "values" in payload else {}))
+        self._respond(updated)
+
+    @_throttled
+    def do_DELETE(self):
+        object_id = self.path.rsplit("/", 1)[-1]
+        with self.server.lock:
+            self.server.objects.pop(object_id, None)
+            for listing in self.server.listings.values():
+                listing[:] = [item for item in listing if item.get("id") != object_id]
+        self._respond({})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubAPIServer:
+    """Run the stub API on a random local port in a background thread.
+
+    Use it as a context manager; `base_url` can be passed to `MZClient` or assigned to
+    `mz_api_helpers.API_BASE_URL`.
+    """
+
+    def __init__(self, latency: float = 0.0, fail_titles: set[str] = frozenset(), listings: dict | None = None,
+                 fail_first_posts: int = 0, rate_limit: float | None = None, max_in_flight: int | None = None,
+                 ignore_query: bool = False):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.latency = latency
+        self._server.fail_titles = fail_titles
+        self._server.listings = listings or {}
+        self._server.ignore_query = ignore_query
+        self._server.objects = {item["id"]: item for listing in self._server.listings.values() for item in listing}
+        self._server.fail_first_posts = fail_first_posts
+        self._server.request_counts = Counter()
+        self._server.rate_limit = rate_limit
+        self._server.tokens = rate_limit or 0.0  # The stub allows bursts of up to one second of requests
+        self._server.tokens_updated_at = time.monotonic()
+        self._server.max_in_flight = max_in_flight
+        self._server.in_flight = 0
+        self._server.throttled_count = 0
+        self._server.lock = threading.Lock()
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def request_counts(self) -> Counter:
+        return self._server.request_counts
+
+    @property
+    def throttled_count(self) -> int:
+        return self._server.throttled_count
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
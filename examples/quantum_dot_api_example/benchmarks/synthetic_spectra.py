@@ -0,0 +1,39 @@
+"""
+synthetic_spectra.py
+
+Writes synthetic emission spectrum files shaped like the ones in `measurements/` (300
+wavelengths between 400 and 700 nm, a Gaussian emission peak on top of noise), used by the
+benchmarks in this folder.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+N_POINTS = 300
+
+
+def make_spectra(count: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Return the wavelength grid and a (count, N_POINTS) array of intensities."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(400, 700, N_POINTS)
+    centers = rng.uniform(450, 650, (count, 1))
+    widths = rng.uniform(10, 30, (count, 1))
+    heights = rng.uniform(100, 250, (count, 1))
+    y = heights * np.exp(-0.5 * ((x - centers) / widths) ** 2) + rng.normal(0, 4, (count, N_POINTS))
+    return x, y
+
+
+def write_spectra(folder: Path, count: int, seed: int = 0) -> list[Path]:
+    """Write `count` spectra as experiment_<n>_measurement.csv files and return their paths."""
+    folder.mkdir(parents=True, exist_ok=True)
+    x, y = make_spectra(count, seed)
+    paths = []
+    for index, intensities in enumerate(y, start=1):
+        path = folder / f"experiment_{index:02d}_measurement.csv"
+        with open(path, "w") as f:
+            f.write("Wavelength (nm),Intensity (a.u.)\n")
+            rows = zip(x.tolist(), intensities.tolist())
+            f.writelines(f"{wavelength!r},{intensity!r}\n" for wavelength, intensity in rows)
+        paths.append(path)
+    return paths
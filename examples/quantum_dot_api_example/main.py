@@ -11,23 +11,38 @@ To run the full example, just execute this file. Make sure you've set your API k
 in the environment and placed your Excel and CSV files in the correct locations.
 """
 
+import logging
+import sys
 import pandas as pd
+from mz_api_helpers import add_request_hook
+from mz_metrics import RequestMetrics
 from mz_operations import (
     get_folder_id_by_name,
     get_tables_in_folder,
     create_table,
     delete_table,
-    create_item,
-    create_protocols_and_parameters
+    create_items,
+    update_items,
+    create_protocols_and_parameters,
+    sync_table,
+    sync_items,
+    MAX_CONCURRENT_UPLOADS
 )
 from analysis import upload_emission_spectrum_measurements
+from upload_state import STATE_PATH, UploadState, hash_content
 
 EXCEL_PATH = "quantum_dot_example.xlsx"
 FOLDER_TITLE = "Quantum Dot Example" # Replace with the title of the folder you created
+SYNC_TABLES = True  # Update the existing tables in place; set to False to delete and recreate them when they change
+LOG_LEVEL = logging.INFO  # Set to logging.DEBUG to log every item and measurement, or logging.WARNING for failures only
+METRICS_PATH = None  # Set to a file path, e.g. "request_metrics.json", to save statistics of the API requests there
 
-def delete_existing_tables(folder_id: str, materials_table_title, experiments_table_title):
+logger = logging.getLogger(__name__)
+
+def delete_existing_tables(folder_id: str, materials_table_title: str | None, experiments_table_title: str):
     """Delete tables with given titles from the specified folder if they exist. Note that the Formulations table
-    must be deleted before the Materials table since it refers to it."""
+    must be deleted before the Materials table since it refers to it. Pass None as the Materials table title to
+    delete the Experiments table only."""
     tables = get_tables_in_folder(folder_id)
 
     materials_table_id = next((table["id"] for table in tables if table["title"] == materials_table_title), None)
@@ -38,10 +53,9 @@ def delete_existing_tables(folder_id: str, materials_table_title, experiments_ta
     if materials_table_id:
         delete_table(materials_table_id)
 
-def create_materials_table(folder_id: str, materials_table_title: str) -> tuple[str, dict]:
-    """Create the Materials table with predefined protocols and return its ID and column-to-parameter map."""
-    materials_table_id = create_table(folder_id, materials_table_title)
-    materials_table_protocols = [
+def materials_table_protocols() -> list[dict]:
+    """Return the protocols and parameters of the Materials table."""
+    return [
         {
             "title": "Properties",
             "type": "protocol",
@@ -64,15 +78,11 @@ def create_materials_table(folder_id: str, materials_table_title: str) -> tuple[
             ]
         }
     ]
-    mat_col_param_map = create_protocols_and_parameters(materials_table_id, materials_table_protocols)
-
-    return materials_table_id, mat_col_param_map
 
-def create_experiments_table(folder_id: str, experiments_table_title: str,
-                             materials_table_id: str) -> tuple[str, dict, str]:
-    """Create the experiments table and return its ID, column-to-parameter map, and formulation protocol ID."""
-    table_id = create_table(folder_id, experiments_table_title)
-    protocols = [
+def experiments_table_protocols(materials_table_id: str) -> list[dict]:
+    """Return the protocols and parameters of the Experiments table, whose formulations refer to the Materials
+    table."""
+    return [
         {
             "title": "Formulation",
             "type": "formulation",
@@ -127,28 +137,113 @@ def create_experiments_table(folder_id: str, experiments_table_title: str,
             ]
         }
     ]
+
+def table_definition(folder_id: str, protocols: list[dict]) -> dict:
+    """Return what a table is created from, to find out whether a table created by the last run can be reused."""
+    return {"folderId": folder_id, "protocols": protocols}
+
+def find_reusable_table(state: UploadState, folder_id: str, title: str, protocols: list[dict]) -> dict | None:
+    """Return the IDs of the table created by the last run, if it still exists and its protocols haven't changed."""
+    table = state.get_table(title, table_definition(folder_id, protocols))
+    if table is None or table["table_id"] not in {table["id"] for table in get_tables_in_folder(folder_id)}:
+        return None
+    logger.info("  ✓ Reusing table %s with id %s from the last run", title, table["table_id"])
+    return table
+
+def create_materials_table(folder_id: str, materials_table_title: str) -> tuple[str, dict]:
+    """Create the Materials table with predefined protocols and return its ID and column-to-parameter map."""
+    materials_table_id = create_table(folder_id, materials_table_title)
+    mat_col_param_map = create_protocols_and_parameters(materials_table_id, materials_table_protocols())
+
+    return materials_table_id, mat_col_param_map
+
+def create_experiments_table(folder_id: str, experiments_table_title: str,
+                             materials_table_id: str) -> tuple[str, dict, str]:
+    """Create the experiments table and return its ID, column-to-parameter map, and formulation protocol ID."""
+    table_id = create_table(folder_id, experiments_table_title)
+    protocols = experiments_table_protocols(materials_table_id)
     exp_col_param_map = create_protocols_and_parameters(table_id, protocols)
     formulation_protocol_id = [protocol["id"] for protocol in protocols if protocol["title"] == "Formulation"][0]
 
     return table_id, exp_col_param_map, formulation_protocol_id
 
+def report_failures(failures: list[tuple[int, str, Exception]]) -> None:
+    """Log a summary of the rows that failed to upload."""
+    if failures:
+        logger.warning("\n  ⚠ %d rows failed to upload:", len(failures))
+        for index, title, exception in failures:
+            logger.warning("    - row %d (%s): %s", index + 1, title, exception)
+
+def upload_items(table_id: str, items: list[tuple[str, list[dict]]], max_workers: int = MAX_CONCURRENT_UPLOADS,
+                 state: UploadState | None = None, sync: bool = False) -> dict[str, str]:
+    """Create the items of a table and return a map from titles to item IDs.
+
+    With `sync`, the items already in the table are compared to `items`, and only the missing items are created and
+    the items whose values differ are updated. Otherwise, with a state, the same is done by comparing `items` to the
+    items recorded in the state by the last run, and every item is recorded in the state as soon as it is uploaded,
+    so an interrupted run continues where it stopped.
+    """
+    if sync:
+        def on_updated(index: int, item: dict) -> None:
+            # Upload the measurements of the item again, in case the update replaced their analysis results
+            if state is not None:
+                state.forget_measurements(item["id"])
+
+        ids_map, failures = sync_items(table_id, items, max_workers, on_updated)
+        report_failures(failures)
+        return ids_map
+
+    if state is None:
+        ids_map, failures = create_items(table_id, items, max_workers)
+        report_failures(failures)
+        return ids_map
+
+    saved_items = state.get_items(table_id)
+    new_indices = [index for index, (title, _) in enumerate(items) if title not in saved_items]
+    changed_indices = [index for index, (title, values) in enumerate(items)
+                       if title in saved_items and saved_items[title][1] != hash_content(values)]
+    logger.info("  ✓ %d items unchanged since the last run, %d new and %d changed",
+                len(items) - len(new_indices) - len(changed_indices), len(new_indices), len(changed_indices))
+
+    def on_created(index: int, item: dict) -> None:
+        state.save_item(table_id, item["title"], item["id"], items[new_indices[index]][1])
+
+    def on_updated(index: int, item: dict) -> None:
+        title, values = items[changed_indices[index]]
+        state.save_item(table_id, title, saved_items[title][0], values)
+        # Upload the measurements of the item again, in case the update replaced their analysis results
+        state.forget_measurements(saved_items[title][0])
+
+    _, create_failures = create_items(table_id, [items[index] for index in new_indices], max_workers, on_created)
+    update_failures = update_items([(saved_items[items[index][0]][0], items[index][1]) for index in changed_indices],
+                                   max_workers, on_updated)
+    failures = [(new_indices[index], title, exception) for index, title, exception in create_failures]
+    failures += [(changed_indices[index], items[changed_indices[index]][0], exception)
+                 for index, _, exception in update_failures]
+    report_failures(sorted(failures, key=lambda failure: failure[0]))
+
+    saved_items = state.get_items(table_id)
+    return {title: saved_items[title][0] for title, _ in items if title in saved_items}
+
 def upload_materials(materials_table_id: str, mat_col_param_map: dict[str, str],
-                     df_materials: pd.DataFrame) -> dict[str, str]:
+                     df_materials: pd.DataFrame, max_workers: int = MAX_CONCURRENT_UPLOADS,
+                     state: UploadState | None = None, sync: bool = False) -> dict[str, str]:
     """Upload material items from a DataFrame and return a map from titles to item IDs."""
-    materials_ids_map = {}
+    items = []
     for _, row in df_materials.iterrows():
         values = [
             {"parameterId": mat_col_param_map[col], "value": str(row[col])} for col in mat_col_param_map
         ]
-        item = create_item(materials_table_id, row["Name"], values)
-        materials_ids_map[item["title"]] = item["id"]
+        items.append((row["Name"], values))
 
-    return materials_ids_map
+    return upload_items(materials_table_id, items, max_workers, state, sync)
 
 def upload_experiments(experiments_table_id: str, exp_col_param_map: dict[str, str], materials_ids_map: dict[str, str],
-                       formulation_protocol_id: str, df_experiments: pd.DataFrame) -> dict[str, str]:
+                       formulation_protocol_id: str, df_experiments: pd.DataFrame,
+                       max_workers: int = MAX_CONCURRENT_UPLOADS, state: UploadState | None = None,
+                       sync: bool = False) -> dict[str, str]:
     """Upload experiment items from a DataFrame and return a map from titles to item IDs."""
-    experiments_ids_map = {}
+    items = []
     for _, row in df_experiments.iterrows():
         values = []
         for col, val in row.items():
@@ -164,12 +259,16 @@ def upload_experiments(experiments_table_id: str, exp_col_param_map: dict[str, s
                     "value": str(val)
                 })
 
-        item = create_item(experiments_table_id, row["Experiment ID"], values)
-        experiments_ids_map[item["title"]] = item["id"]
+        items.append((row["Experiment ID"], values))
 
-    return experiments_ids_map
+    return upload_items(experiments_table_id, items, max_workers, state, sync)
 
 def main():
+    logging.basicConfig(level=LOG_LEVEL, format="%(message)s", stream=sys.stdout)
+    if METRICS_PATH is not None:
+        metrics = RequestMetrics()
+        add_request_hook(metrics)
+
     print("=" * 60)
     print("🚀  Upload Quantum Dots Data Example")
     print("=" * 60)
@@ -181,28 +280,77 @@ def main():
     print("\n=== Step 2: Fetching folder_id of the parent folder of the Materials and Experiments tables ===\n")
     folder_id = get_folder_id_by_name(FOLDER_TITLE)
 
-    print("\n=== Step 3: Deleting existing tables in the folder ===\n")
+    # The state of the last run tells which measurements (and, without SYNC_TABLES, which tables and items) are
+    # already uploaded
+    state = UploadState(STATE_PATH)
+
     materials_table_title = "Materials"
     experiments_table_title = "Experiments"
-    delete_existing_tables(folder_id, materials_table_title, experiments_table_title)
+    if SYNC_TABLES:
+        print("\n=== Step 3: Checking the existing tables in the folder ===\n")
+        table_titles = {table["title"] for table in get_tables_in_folder(folder_id)}
+        if materials_table_title not in table_titles:
+            # The formulations of an Experiments table refer to the Materials table, which is gone
+            delete_existing_tables(folder_id, None, experiments_table_title)
+
+        print("\n=== Step 4: Syncing the Materials table ===\n")
+        materials_table_id, mat_col_param_map = sync_table(folder_id, materials_table_title,
+                                                           materials_table_protocols())
 
-    print("\n=== Step 4: Creating the Materials table ===\n")
-    materials_table_id, mat_col_param_map = create_materials_table(folder_id, materials_table_title)
+        print("\n=== Step 5: Syncing the Experiments table ===\n")
+        protocols = experiments_table_protocols(materials_table_id)
+        experiments_table_id, exp_col_param_map = sync_table(folder_id, experiments_table_title, protocols)
+        formulation_protocol_id = [protocol["id"] for protocol in protocols if protocol["title"] == "Formulation"][0]
+    else:
+        print("\n=== Step 3: Deleting existing tables in the folder that can't be reused ===\n")
+        materials_table = find_reusable_table(state, folder_id, materials_table_title, materials_table_protocols())
+        experiments_table = materials_table and find_reusable_table(
+            state, folder_id, experiments_table_title, experiments_table_protocols(materials_table["table_id"]))
+        if experiments_table is None:
+            delete_existing_tables(folder_id, None if materials_table else materials_table_title,
+                                   experiments_table_title)
 
-    print("\n=== Step 5: Creating the Experiments table ===\n")
-    experiments_table_id, exp_col_param_map, formulation_protocol_id = (
-        create_experiments_table(folder_id, experiments_table_title,materials_table_id))
+        print("\n=== Step 4: Creating the Materials table ===\n")
+        if materials_table:
+            materials_table_id, mat_col_param_map = materials_table["table_id"], materials_table["col_param_map"]
+        else:
+            materials_table_id, mat_col_param_map = create_materials_table(folder_id, materials_table_title)
+            state.save_table(materials_table_title, table_definition(folder_id, materials_table_protocols()),
+                             materials_table_id, mat_col_param_map)
+
+        print("\n=== Step 5: Creating the Experiments table ===\n")
+        if experiments_table:
+            experiments_table_id = experiments_table["table_id"]
+            exp_col_param_map = experiments_table["col_param_map"]
+            formulation_protocol_id = experiments_table["formulation_protocol_id"]
+        else:
+            experiments_table_id, exp_col_param_map, formulation_protocol_id = (
+                create_experiments_table(folder_id, experiments_table_title,materials_table_id))
+            state.save_table(experiments_table_title,
+                             table_definition(folder_id, experiments_table_protocols(materials_table_id)),
+                             experiments_table_id, exp_col_param_map, formulation_protocol_id)
 
     print("\n=== Step 6: Uploading the Material items ===\n")
-    materials_ids_map = upload_materials(materials_table_id, mat_col_param_map, df_materials)
+    materials_ids_map = upload_materials(materials_table_id, mat_col_param_map, df_materials, state=state,
+                                         sync=SYNC_TABLES)
 
     print("\n=== Step 7: Uploading the Experiment items ===\n")
     experiments_ids_map = upload_experiments(experiments_table_id, exp_col_param_map, materials_ids_map,
-                                             formulation_protocol_id, df_experiments)
+                                             formulation_protocol_id, df_experiments, state=state,
+                                             sync=SYNC_TABLES)
 
     print("\n=== Step 8: Analyzing the measurements, extracting the peak wavelength, and uploading files"
           " and results ===\n")
-    upload_emission_spectrum_measurements(exp_col_param_map, experiments_ids_map)
+    measurement_failures, _ = upload_emission_spectrum_measurements(exp_col_param_map, experiments_ids_map,
+                                                                    state=state)
+    if measurement_failures:
+        print(f"\n  ⚠ {len(measurement_failures)} measurement files failed to be analyzed or uploaded")
+    state.close()
+
+    if METRICS_PATH is not None:
+        with open(METRICS_PATH, "w") as f:
+            f.write(metrics.to_json())
+        print(f"\n  ✓ Saved the statistics of the API requests to {METRICS_PATH}")
 
 if __name__ == "__main__":
     main()
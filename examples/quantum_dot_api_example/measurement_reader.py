@@ -0,0 +1,56 @@
+"""
+measurement_reader.py
+
+This module contains a lightweight reader for numeric measurement files, such as the emission
+spectra in `measurements/` or instrument exports that start with `#` metadata lines.
+
+For small files, most of the time of `pd.read_csv` goes into setting up the parser and building
+the DataFrame rather than into parsing the numbers. `read_measurement` reads the file once,
+finds the header after the metadata lines itself and hands the rest to the C parser of
+`np.loadtxt`, which fills a float64 array directly.
+"""
+
+import io
+import numpy as np
+
+COMMENT = "#"  # Lines starting with this prefix are metadata and are skipped
+
+def _is_numeric_line(line: str, delimiter: str) -> bool:
+    try:
+        [float(value) for value in line.split(delimiter)]
+    except ValueError:
+        return False
+    return True
+
+def read_measurement(file_path: str, delimiter: str = ",") -> tuple[list[str], np.ndarray]:
+    """Return the column names and a 2-D float64 array of the values of a delimited measurement file.
+
+    Metadata lines starting with `#` before the data are skipped. The first other line is used as the header,
+    unless it is numeric, in which case the columns are named by their position. Raise a ValueError if a value
+    isn't numeric, or if the rows don't all have the same number of values.
+    """
+    with open(file_path) as f:
+        content = f.read()
+
+    # Skip the metadata lines and find the header
+    lines = io.StringIO(content)
+    skipped_lines = 0
+    for line in lines:
+        if line.strip() and not line.startswith(COMMENT):
+            break
+        skipped_lines += 1
+    else:
+        return [], np.empty((0, 0))
+    first_line = line.rstrip("\r\n")
+    if _is_numeric_line(first_line, delimiter):
+        columns = [str(index) for index in range(len(first_line.split(delimiter)))]
+    else:
+        columns = [name.strip() for name in first_line.split(delimiter)]
+        skipped_lines += 1
+        if not lines.read().strip():
+            return columns, np.empty((0, len(columns)))
+
+    data = np.loadtxt(io.StringIO(content), delimiter=delimiter, comments=COMMENT, skiprows=skipped_lines, ndmin=2)
+    if data.size and data.shape[1] != len(columns):
+        raise ValueError(f"{file_path} has {data.shape[1]} values per row but {len(columns)} columns")
+    return columns, data
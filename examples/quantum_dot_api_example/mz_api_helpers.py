@@ -5,42 +5,527 @@ This module contains helper functions for interacting with the MaterialsZone API
 It defines how to send GET, POST, PATCH, and DELETE requests, including support for
 file uploads. It also stores the base API URL, API key, and request headers.
 
+All requests go through a shared `MZClient`, which keeps a pool of open connections
+to the API (so repeated calls don't pay for a new TCP/TLS handshake each time) and
+retries requests that fail with 429 or 5xx responses using exponential backoff. Requests
+that create objects (POST and PATCH) are only sent again when the server tells that it
+didn't process them, so a slow response never creates an item twice (see `SafeRetry`).
+File uploads are streamed from disk, so large files are never loaded into memory.
+
+The client also paces its requests so that concurrent uploads stay within the API's
+limits: a token bucket caps the request rate (`RATE_LIMIT`), the number of requests in
+flight adapts to the server (halved on 429 responses and when responses slow down,
+raised again while they don't), and a 429 response with a Retry-After header pauses
+all requests of the client for that long.
+
+Listings are fetched one page of `PAGE_SIZE` records at a time with `iter_pages` and
+`iter_listing`, which only request the next page when the caller gets to it.
+
+Functions registered with `add_request_hook` are called with a record of every request
+(endpoint, status, duration, bytes, retries and error), e.g. to collect the statistics of
+`mz_metrics.RequestMetrics`.
+
 You do not need to change anything here. Just use the functions provided to
 communicate with the API.
 """
 
+import io
+import logging
 import os
+import threading
+import time
+from bisect import bisect_right
+from collections.abc import Callable, Iterator
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.fields import RequestField
+from urllib3.filepost import choose_boundary
+from urllib3.util.retry import Retry
 
 API_BASE_URL = "https://api.materials.zone/v2beta1"
 API_KEY = os.getenv("MZ_API_KEY")  # Set this in your environment (see README)
 HEADERS = {"authorization": API_KEY}
 
-def get(endpoint: str) -> dict:
-    """Send a GET request to the API to fetch an object."""
-    response = requests.get(f"{API_BASE_URL}{endpoint}", headers=HEADERS)
-    response.raise_for_status()
-    return response.json()["data"]
+POOL_MAXSIZE = 16  # Maximum number of open connections kept to the API
+TIMEOUT = (5, 60)  # (connect, read) timeouts in seconds
+MAX_RETRIES = 5  # Number of retries for failed requests
+BACKOFF_FACTOR = 0.5  # Retries wait 0.5s, 1s, 2s, 4s, ... between attempts
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Responses with which the server tells that it didn't process a request. POST and PATCH are retried on these if they
+# have a Retry-After header, and on every 429 response, which MZClient.request retries for all methods.
+RETRY_AFTER_STATUS_CODES = (429, 503)
+IDEMPOTENT_METHODS = Retry.DEFAULT_ALLOWED_METHODS  # Methods that are safe to send again (not POST and PATCH)
+PAGE_SIZE = 500  # Number of records fetched per request by iter_pages and iter_listing
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Size of the chunks in which multipart bodies are read from the files
+
+RATE_LIMIT = None  # Maximum number of requests per second sent to the API (None for no limit)
+RATE_LIMIT_BURST = 10  # Number of requests that may be sent at once, above RATE_LIMIT, after a quiet period
+CONCURRENCY_DECREASE_FACTOR = 0.5  # The limit on requests in flight is multiplied by this when the API is overloaded
+LATENCY_TOLERANCE = 3.0  # The API counts as overloaded while responses take this many times longer than the fastest
+THROTTLED_STATUS_CODE = 429
+
+logger = logging.getLogger(__name__)
+_request_hooks = []
+
+
+def add_request_hook(hook: Callable[[dict], None]) -> None:
+    """Call `hook` after every request sent to the API, with a record of the request.
+
+    The record is a dict with the `method`, the `endpoint` template (see `endpoint_template`), the final `status`
+    code (None if no response was received), the total `seconds` spent on the request including waits and retries,
+    the `bytes_sent` and `bytes_received` in the bodies, the number of `retries`, and the `error` ("HTTP <status>" for
+    error responses, otherwise the class of the exception raised; None on success). Hooks are called from the thread
+    or task that sent the request, so they must be thread-safe and quick.
+    """
+    _request_hooks.append(hook)
+
+
+def remove_request_hook(hook: Callable[[dict], None]) -> None:
+    """Stop calling a hook added with `add_request_hook`."""
+    _request_hooks.remove(hook)
+
+
+def notify_request_hooks(method: str, endpoint: str, status: int | None, seconds: float, bytes_sent: int,
+                         bytes_received: int, retries: int, error: BaseException | None) -> None:
+    """Call the request hooks with the record of a request. A failing hook is logged and doesn't fail the request."""
+    if not _request_hooks:
+        return
+    if status is not None and status >= 400:
+        error_class = f"HTTP {status}"
+    else:
+        error_class = type(error).__name__ if error is not None else None
+    record = {"method": method, "endpoint": endpoint_template(endpoint), "status": status, "seconds": seconds,
+              "bytes_sent": bytes_sent, "bytes_received": bytes_received, "retries": retries, "error": error_class}
+    for hook in list(_request_hooks):
+        try:
+            hook(record)
+        except Exception:
+            logger.exception("Request hook %r failed", hook)
+
+
+def endpoint_template(endpoint: str) -> str:
+    """Return an endpoint with the IDs in its path replaced by `{id}`, e.g. `/tables/{id}/items`.
+
+    The paths of the API alternate between collections and IDs, so every second segment is an ID.
+    """
+    segments = endpoint.split("?")[0].split("/")
+    for index in range(2, len(segments), 2):
+        segments[index] = "{id}"
+    return "/".join(segments)
+
+
+def retry_after_seconds(value: str | None) -> float | None:
+    """Return the number of seconds given by a Retry-After header, or None if it doesn't give one."""
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """A thread-safe token-bucket rate limiter, which can also be paused.
+
+    Tokens are added at `rate` per second, up to `burst`. Each request takes one token; `reserve` returns how long
+    the caller must wait before sending it, so the limiter works with `time.sleep` and `asyncio.sleep` alike. With a
+    `rate` of None, requests are only delayed while the bucket is paused.
+    """
+
+    def __init__(self, rate: float | None = RATE_LIMIT, burst: int = RATE_LIMIT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return the number of seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self._paused_until - now, 0.0)
+            if self.rate is not None:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate) - 1
+                self._updated_at = now
+                # A negative balance reserves the next tokens for the requests already waiting
+                wait = max(wait, -self._tokens / self.rate)
+            return wait
+
+    def pause(self, seconds: float) -> None:
+        """Delay every request for the given number of seconds, e.g. as asked by a Retry-After header."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0.0)  # Resume at the steady rate rather than with a burst
+
+
+class AdaptiveConcurrencyLimit:
+    """A thread-safe limit on the number of requests in flight that adapts to the API (AIMD).
+
+    The limit starts at `max_limit`. It is multiplied by `decrease_factor` when a request is throttled with a 429
+    response, or when responses to an endpoint get `latency_tolerance` times slower than the fastest recent ones, and
+    grows back by one for every round of `limit` successful requests. The limit is cut at most once per round trip:
+    requests that started before the last cut don't cut it again.
+    """
+
+    def __init__(self, max_limit: int = POOL_MAXSIZE, min_limit: int = 1,
+                 decrease_factor: float = CONCURRENCY_DECREASE_FACTOR, latency_tolerance: float = LATENCY_TOLERANCE):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(max_limit)
+        self._in_flight = 0
+        self._started = 0  # Number of requests started so far, which numbers the requests
+        self._cut_after = 0  # Number of the last request started before the limit was last cut
+        self._latencies = {}  # Endpoint template -> [fastest recent latency, moving average, number of responses]
+        self._condition = threading.Condition()
+
+    def try_acquire(self) -> int | None:
+        """Start a request if the limit allows it and return its number, or return None."""
+        with self._condition:
+            if self._in_flight >= max(int(self.limit), self.min_limit):
+                return None
+            self._in_flight += 1
+            self._started += 1
+            return self._started
+
+    def acquire(self) -> int:
+        """Wait until the limit allows another request, start it and return its number."""
+        with self._condition:
+            while (ticket := self.try_acquire()) is None:
+                self._condition.wait()
+            return ticket
+
+    def _is_slow(self, key: str, latency: float) -> bool:
+        fastest, average, count = self._latencies.get(key, (latency, latency, 0))
+        # The fastest latency slowly drifts up, so that the limit can recover if the API gets slower for good
+        fastest = min(latency, fastest * 1.01)
+        average = 0.9 * average + 0.1 * latency
+        self._latencies[key] = (fastest, average, count + 1)
+        return count >= 10 and average > self.latency_tolerance * fastest
+
+    def release(self, ticket: int, key: str | None = None, latency: float | None = None,
+                throttled: bool = False) -> None:
+        """Finish a request and adapt the limit to how it went. Requests that failed without a response are released
+        without a latency and leave the limit as it is."""
+        with self._condition:
+            self._in_flight -= 1
+            if throttled or (latency is not None and self._is_slow(key, latency)):
+                if ticket > self._cut_after:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self._cut_after = self._started
+            elif latency is not None:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class MultipartStream:
+    """A multipart/form-data request body that is read from the uploaded files while it is sent.
+
+    `fields` and `files` are given like the `data` and `files` arguments of `requests` (files as
+    (filename, file object, content type) tuples), and the body is the same as the one `requests` would
+    build, but only one chunk of it is in memory at a time. The stream is seekable, so a request can be
+    retried from the start. The files must stay open until the request is sent; closing them is up to
+    the caller.
+    """
+
+    def __init__(self, fields: dict, files: dict):
+        self.boundary = choose_boundary()
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self._parts = []  # Byte strings, or (file, start, size) regions of the files
+        for name, values in fields.items():
+            for value in values if isinstance(values, (list, tuple)) else [values]:
+                if value is not None:
+                    value = value if isinstance(value, bytes) else str(value).encode()
+                    self._add_part(RequestField.from_tuples(name, value), value)
+        for name, (filename, file, *rest) in files.items():
+            field = RequestField(name=name, data=b"", filename=filename, headers=rest[1] if len(rest) > 1 else None)
+            field.make_multipart(content_type=rest[0] if rest else None)
+            self._add_part(field, file)
+        self._parts.append(f"--{self.boundary}--\r\n".encode())
+
+        self._offsets = []
+        offset = 0
+        for part in self._parts:
+            self._offsets.append(offset)
+            offset += len(part) if isinstance(part, bytes) else part[2]
+        self._length = offset
+        self._position = 0
+
+    def _add_part(self, field: RequestField, content) -> None:
+        self._parts.append(f"--{self.boundary}\r\n".encode() + field.render_headers().encode())
+        if isinstance(content, str):
+            content = content.encode()
+        elif not isinstance(content, (bytes, bytearray)):
+            if isinstance(content, io.TextIOBase) or not content.seekable():
+                # Text files and pipes can't be read again in chunks, so they are read into memory
+                content = content.read()
+                content = content.encode() if isinstance(content, str) else content
+            else:
+                start = content.tell()
+                content = (content, start, content.seek(0, io.SEEK_END) - start)
+        self._parts.append(bytes(content) if isinstance(content, bytearray) else content)
+        self._parts.append(b"\r\n")
+
+    def __len__(self) -> int:
+        return self._length
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self._length}[whence]
+        self._position = min(max(base + offset, 0), self._length)
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self._length - self._position
+        chunks = []
+        while size > 0 and self._position < self._length:
+            index = bisect_right(self._offsets, self._position) - 1
+            part, offset = self._parts[index], self._position - self._offsets[index]
+            if isinstance(part, bytes):
+                chunk = part[offset:offset + size]
+            else:
+                file, start, part_size = part
+                file.seek(start + offset)
+                chunk = file.read(min(size, part_size - offset))
+                if not chunk:
+                    raise IOError(f"{file} was truncated while it was uploaded")
+            chunks.append(chunk)
+            self._position += len(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def __iter__(self):
+        # requests only sends bodies that can be iterated as streams
+        while chunk := self.read(UPLOAD_CHUNK_SIZE):
+            yield chunk
+
+
+class SafeRetry(Retry):
+    """The retry policy of `MZClient`, which never sends a request again if the server may have processed it.
+
+    GET, PUT, DELETE and the other idempotent methods are retried on connection errors, read timeouts and the
+    status codes of `status_forcelist`. POST and PATCH, which would create an object twice, are only retried when
+    the connection failed before the request was sent, and on the `RETRY_AFTER_STATUS_CODES` responses with a
+    Retry-After header, with which the server tells that it didn't process the request. 429 responses aren't in the
+    `status_forcelist` of `MZClient`, which retries them itself for every method, with or without Retry-After.
+    """
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if self.allowed_methods is None or method.upper() in self.allowed_methods:
+            return super().is_retry(method, status_code, has_retry_after)
+        return bool(self.total and has_retry_after and status_code in RETRY_AFTER_STATUS_CODES
+                    and status_code in (self.status_forcelist or ()))
+
+
+class MZClient:
+    """A client for the MaterialsZone API that reuses connections and retries failed requests.
+
+    The client is safe to share between threads. Requests block while all `pool_maxsize`
+    connections are busy, so the pool size bounds the number of concurrent requests. Below
+    that, requests also wait for the `rate_limiter` and, with `adaptive_concurrency`, for the
+    adaptive `concurrency_limit`.
+    """
+
+    def __init__(self, base_url: str = API_BASE_URL, headers: dict | None = None,
+                 pool_maxsize: int = POOL_MAXSIZE, timeout: float | tuple[float, float] = TIMEOUT,
+                 max_retries: int = MAX_RETRIES, backoff_factor: float = BACKOFF_FACTOR,
+                 rate_limit: float | None = RATE_LIMIT, adaptive_concurrency: bool = True):
+        self.base_url = base_url
+        self.headers = HEADERS if headers is None else headers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.rate_limiter = TokenBucket(rate_limit)
+        self.concurrency_limit = AdaptiveConcurrencyLimit(pool_maxsize) if adaptive_concurrency else None
+        retry = SafeRetry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            # 429 responses are retried by request(), so that the retries go through the rate limiter too
+            status_forcelist=[code for code in RETRY_STATUS_CODES if code != THROTTLED_STATUS_CODE],
+            respect_retry_after_header=True,
+            raise_on_status=False,  # Return the last response so raise_for_status() reports it
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, pool_block=True, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _send(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        """Send one attempt of a request once the rate and concurrency limits allow it."""
+        time.sleep(self.rate_limiter.reserve())
+        if self.concurrency_limit is None:
+            return self.session.request(method, f"{self.base_url}{endpoint}", **kwargs)
+
+        ticket = self.concurrency_limit.acquire()
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, f"{self.base_url}{endpoint}", **kwargs)
+        except Exception:
+            self.concurrency_limit.release(ticket)
+            raise
+        self.concurrency_limit.release(ticket, endpoint_template(endpoint), time.monotonic() - start,
+                                       throttled=response.status_code == THROTTLED_STATUS_CODE)
+        return response
+
+    def request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        """Send a request to the API and return the response, raising an HTTPError on failure.
+
+        Requests throttled with a 429 response, which the server didn't process, are retried up to `max_retries`
+        times whatever their method. A Retry-After header pauses all requests of the client for that long; otherwise
+        the request waits with exponential backoff.
+        """
+        kwargs["headers"] = {**self.headers, **kwargs.get("headers", {})}
+        kwargs.setdefault("timeout", self.timeout)
+        body = kwargs.get("data")
+        body_start = body.tell() if hasattr(body, "seek") else None
+        start = time.monotonic()
+        response, retries, error = None, 0, None
+        try:
+            for attempt in range(self.max_retries + 1):
+                if attempt > 0 and body_start is not None:
+                    body.seek(body_start)
+                response = self._send(method, endpoint, **kwargs)
+                # Retries of 5xx responses and connection errors made by urllib3 within this attempt
+                urllib3_retries = getattr(response.raw, "retries", None)
+                retries += (attempt > 0) + (len(urllib3_retries.history) if urllib3_retries is not None else 0)
+                if response.status_code != THROTTLED_STATUS_CODE or attempt == self.max_retries:
+                    break
+                retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+                if retry_after is not None:
+                    self.rate_limiter.pause(retry_after)
+                else:
+                    time.sleep(self.backoff_factor * 2 ** attempt)
+            response.raise_for_status()
+            return response
+        except Exception as exception:
+            error = exception
+            raise
+        finally:
+            if response is None:
+                notify_request_hooks(method, endpoint, None, time.monotonic() - start, 0, 0, retries, error)
+            else:
+                request_body = response.request.body
+                notify_request_hooks(method, endpoint, response.status_code, time.monotonic() - start,
+                                     len(request_body) if request_body is not None else 0, len(response.content),
+                                     retries, error)
+
+    def get(self, endpoint: str, params: dict | None = None) -> dict:
+        """Send a GET request to the API to fetch an object, with optional query parameters."""
+        return self.request("GET", endpoint, params=params).json()["data"]
+
+    def iter_pages(self, endpoint: str, params: dict | None = None,
+                   page_size: int = PAGE_SIZE) -> Iterator[list[dict]]:
+        """Fetch a listing from the API one page at a time, with `limit` and `offset` query parameters, and yield
+        the pages as they arrive.
+
+        No more pages are fetched once the caller stops iterating, so a search can stop at the first match. A
+        server that ignores the pagination and returns the whole listing at once is detected (a page longer than
+        `page_size`), and its listing is yielded once. A server that applies the limit but ignores the offset sends
+        the first page again; the rest of the listing is then fetched in one request without pagination, and a
+        RuntimeError is raised if it doesn't start with the first page.
+        """
+        params = dict(params or {})
+        offset = 0
+        first_id = None
+        while True:
+            page = self.get(endpoint, {**params, "limit": page_size, "offset": offset})
+            if offset > 0 and page and page[0].get("id") == first_id:
+                # The server ignores the offset and sent the first page again
+                rest = self._unpaginated_rest(endpoint, self.get(endpoint, params or None), first_id, offset)
+                if rest:
+                    yield rest
+                return
+            yield page
+            if len(page) != page_size:
+                return  # The last page, or the whole listing if the server ignores the limit
+            if offset == 0:
+                first_id = page[0].get("id")
+            offset += len(page)
+
+    @staticmethod
+    def _unpaginated_rest(endpoint: str, listing: list[dict], first_id: str | None, offset: int) -> list[dict]:
+        """Return the records of an unpaginated `listing` past the `offset` records that were already yielded."""
+        if listing and listing[0].get("id") != first_id:
+            raise RuntimeError(f"The server ignores the offset of {endpoint} and its unpaginated listing is in a "
+                               f"different order, so the listing can't be fetched completely.")
+        return listing[offset:]
+
+    def post(self, endpoint: str, payload: dict) -> dict:
+        """Send a POST request to the API to create an object."""
+        return self.request("POST", endpoint, json=payload).json()["data"]
+
+    def post_with_file(self, endpoint: str, payload: dict, files: dict) -> dict:
+        """Send a multipart POST request to the API to create an object that requires uploading a file.
+
+        The files are streamed from disk in chunks while the request is sent.
+        """
+        body = MultipartStream(payload, files)
+        return self.request("POST", endpoint, data=body, headers={"Content-Type": body.content_type}).json()["data"]
+
+    def patch(self, endpoint: str, payload: dict) -> dict:
+        """Send a PATCH request to the API to update an object."""
+        return self.request("PATCH", endpoint, json=payload).json()["data"]
+
+    def delete(self, endpoint: str) -> None:
+        """Send a DELETE request to the API to delete an object."""
+        self.request("DELETE", endpoint)
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_client: MZClient | None = None
+_client_lock = threading.Lock()
+
+def get_client() -> MZClient:
+    """Return the shared client used by the module-level request functions."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MZClient()
+        return _client
+
+def set_client(client: MZClient) -> None:
+    """Replace the shared client, e.g. to change the pool size, timeouts or retry settings."""
+    global _client
+    with _client_lock:
+        _client = client
+
+def get(endpoint: str, params: dict | None = None) -> dict:
+    """Send a GET request to the API to fetch an object, with optional query parameters."""
+    return get_client().get(endpoint, params)
+
+def iter_pages(endpoint: str, params: dict | None = None, page_size: int = PAGE_SIZE) -> Iterator[list[dict]]:
+    """Fetch a listing from the API one page at a time and yield the pages as they arrive."""
+    return get_client().iter_pages(endpoint, params, page_size)
+
+def iter_listing(endpoint: str, params: dict | None = None, page_size: int = PAGE_SIZE) -> Iterator[dict]:
+    """Fetch a listing from the API one page at a time and yield its records one by one."""
+    for page in iter_pages(endpoint, params, page_size):
+        yield from page
 
 def post(endpoint: str, payload: dict) -> dict:
     """Send a POST request to the API to create an object."""
-    response = requests.post(f"{API_BASE_URL}{endpoint}", headers=HEADERS, json=payload)
-    response.raise_for_status()
-    return response.json()["data"]
+    return get_client().post(endpoint, payload)
 
 def post_with_file(endpoint: str, payload: dict, files: dict) -> dict:
     """Send a multipart POST request to the API to create an object that requires uploading a file."""
-    response = requests.post(f"{API_BASE_URL}{endpoint}", headers=HEADERS, data=payload, files=files)
-    response.raise_for_status()
-    return response.json()["data"]
+    return get_client().post_with_file(endpoint, payload, files)
 
 def patch(endpoint: str, payload: dict) -> dict:
     """Send a PATCH request to the API to update an object."""
-    response = requests.patch(f"{API_BASE_URL}{endpoint}", headers=HEADERS, json=payload)
-    response.raise_for_status()
-    return response.json()["data"]
+    return get_client().patch(endpoint, payload)
 
 def delete(endpoint: str) -> None:
     """Send a DELETE request to the API to delete an object."""
-    response = requests.delete(f"{API_BASE_URL}{endpoint}", headers=HEADERS)
-    response.raise_for_status()
+    get_client().delete(endpoint)
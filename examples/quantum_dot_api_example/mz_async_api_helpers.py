@@ -0,0 +1,232 @@
+"""
+mz_async_api_helpers.py
+
+This module is the asyncio counterpart of `mz_api_helpers.py`, for programs that call the
+MaterialsZone API from async code. It provides coroutines for sending GET, POST, PATCH, and
+DELETE requests, including file uploads, with the same base API URL, API key and headers.
+
+All requests go through a shared `AsyncMZClient`, which keeps a pool of open connections to
+the API and retries requests that fail with 429 or 5xx responses using exponential backoff,
+like `MZClient` does. It also paces requests with the same token bucket and adaptive limit
+on the number of requests in flight as `MZClient`. Requests rejected with a 401 response
+raise a RuntimeError explaining that the API key is wrong. The hooks added with
+`mz_api_helpers.add_request_hook` are called for these requests too.
+
+The client must be used from a single event loop; close it with `await close_client()` before
+the loop ends.
+"""
+
+import asyncio
+import json
+import aiohttp
+from mz_api_helpers import (API_BASE_URL, BACKOFF_FACTOR, CONCURRENCY_DECREASE_FACTOR, HEADERS, IDEMPOTENT_METHODS,
+                            MAX_RETRIES, POOL_MAXSIZE, RATE_LIMIT, RETRY_AFTER_STATUS_CODES, RETRY_STATUS_CODES,
+                            THROTTLED_STATUS_CODE, TIMEOUT, UPLOAD_CHUNK_SIZE, AdaptiveConcurrencyLimit,
+                            MultipartStream, TokenBucket, endpoint_template, notify_request_hooks,
+                            retry_after_seconds)
+
+MAX_CONCURRENT_REQUESTS = POOL_MAXSIZE  # Maximum number of requests in flight at a time
+# Errors raised before a request was sent, after which even POST and PATCH requests are retried
+NOT_SENT_ERRORS = (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError)
+
+
+async def _raise_for_auth(response: aiohttp.ClientResponse):
+    if response.status == 401:
+        raise RuntimeError("Authentication failed. Check that MZ_API_KEY is correct. "
+                           f"Server response: {await response.text()}")
+
+
+class AsyncMZClient:
+    """An asyncio client for the MaterialsZone API that reuses connections and retries failed requests.
+
+    At most `max_concurrency` requests are sent at a time; the others wait for their turn, so any number of
+    coroutines can share the client. With `adaptive_concurrency`, that limit is lowered while the API throttles
+    requests or slows down, like in `MZClient`, and every request also waits for the `rate_limiter`. The connection
+    pool is created on the first request.
+    """
+
+    def __init__(self, base_url: str = API_BASE_URL, headers: dict | None = None,
+                 pool_maxsize: int = POOL_MAXSIZE, max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+                 timeout: float | tuple[float, float] = TIMEOUT, max_retries: int = MAX_RETRIES,
+                 backoff_factor: float = BACKOFF_FACTOR, rate_limit: float | None = RATE_LIMIT,
+                 adaptive_concurrency: bool = True):
+        self.base_url = base_url
+        self.headers = HEADERS if headers is None else headers
+        self.pool_maxsize = pool_maxsize
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.rate_limiter = TokenBucket(rate_limit)
+        # Without adaptive concurrency, the limit is never decreased and stays at max_concurrency
+        self.concurrency_limit = AdaptiveConcurrencyLimit(
+            max_concurrency, decrease_factor=CONCURRENCY_DECREASE_FACTOR if adaptive_concurrency else 1.0)
+        self._slot_released = asyncio.Condition()
+        self._session: aiohttp.ClientSession | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_maxsize)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def _acquire(self) -> int:
+        async with self._slot_released:
+            while (ticket := self.concurrency_limit.try_acquire()) is None:
+                await self._slot_released.wait()
+            return ticket
+
+    async def _release(self, ticket: int, *args, **kwargs) -> None:
+        self.concurrency_limit.release(ticket, *args, **kwargs)
+        async with self._slot_released:
+            self._slot_released.notify_all()
+
+    async def request(self, method: str, endpoint: str, **kwargs) -> dict | None:
+        """Send a request to the API and return its JSON response, raising a ClientResponseError on failure.
+
+        `kwargs` are passed to `aiohttp.ClientSession.request`. A callable `data` is called to build the body of
+        every attempt, for bodies such as streams that can only be sent once. A 429 response with a Retry-After
+        header pauses all requests of the client for that long.
+
+        Like `mz_api_helpers.SafeRetry`, POST and PATCH requests, which would create an object twice, are only
+        retried if the connection failed before they were sent, on 429 responses and on the
+        `RETRY_AFTER_STATUS_CODES` responses with a Retry-After header; the other methods are retried on every
+        connection error, timeout and `RETRY_STATUS_CODES` response.
+        """
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        headers = {**self.headers, **kwargs.pop("headers", {})}
+        data = kwargs.pop("data", None)
+        if "json" in kwargs:
+            bytes_sent = len(json.dumps(kwargs["json"]).encode())
+        else:
+            bytes_sent = int(headers.get("Content-Length", len(data) if isinstance(data, (bytes, str)) else 0))
+        loop = asyncio.get_running_loop()
+        request_start = loop.time()
+        status, body, attempt, error = None, b"", 0, None
+        try:
+            for attempt in range(self.max_retries + 1):
+                await asyncio.sleep(self.rate_limiter.reserve())
+                ticket = await self._acquire()
+                start = loop.time()
+                try:
+                    async with self._get_session().request(method, f"{self.base_url}{endpoint}", headers=headers,
+                                                           data=data() if callable(data) else data,
+                                                           **kwargs) as response:
+                        status = response.status
+                        await self._release(ticket, endpoint_template(endpoint), loop.time() - start,
+                                            throttled=status == THROTTLED_STATUS_CODE)
+                        ticket = None
+                        body = await response.read()
+                        retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+                        retryable = status in RETRY_STATUS_CODES and (
+                            idempotent or status == THROTTLED_STATUS_CODE
+                            or status in RETRY_AFTER_STATUS_CODES and retry_after is not None)
+                        if retryable and attempt < self.max_retries:
+                            if status == THROTTLED_STATUS_CODE and retry_after is not None:
+                                self.rate_limiter.pause(retry_after)  # Delays this request and all the others
+                                delay = 0.0
+                            else:
+                                delay = self.backoff_factor * 2 ** attempt if retry_after is None else retry_after
+                        else:
+                            await _raise_for_auth(response)
+                            response.raise_for_status()
+                            return json.loads(body) if body else None
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exception:
+                    # A server disconnect or a read timeout may come after the server processed the request
+                    if attempt == self.max_retries or not (idempotent or isinstance(exception, NOT_SENT_ERRORS)):
+                        raise
+                    delay = self.backoff_factor * 2 ** attempt
+                finally:
+                    if ticket is not None:
+                        await self._release(ticket)
+                await asyncio.sleep(delay)
+        except Exception as exception:
+            error = exception
+            raise
+        finally:
+            notify_request_hooks(method, endpoint, status, loop.time() - request_start, bytes_sent, len(body),
+                                 attempt, error)
+
+    async def get(self, endpoint: str) -> dict | list:
+        """Send a GET request to the API to fetch an object."""
+        return (await self.request("GET", endpoint))["data"]
+
+    async def post(self, endpoint: str, payload: dict) -> dict:
+        """Send a POST request to the API to create an object."""
+        return (await self.request("POST", endpoint, json=payload))["data"]
+
+    async def post_with_file(self, endpoint: str, payload: dict, files: dict) -> dict:
+        """Send a multipart POST request to the API to create an object that requires uploading a file.
+
+        `files` are given like in `mz_api_helpers.post_with_file`, and the body is the same `MultipartStream`: the
+        files are read in chunks (in a worker thread, so the event loop isn't blocked) while the request is sent, and
+        are read again from the start if the request is retried. Closing the files is up to the caller.
+        """
+        body = MultipartStream(payload, files)
+
+        async def read_body():
+            body.seek(0)
+            while chunk := await asyncio.to_thread(body.read, UPLOAD_CHUNK_SIZE):
+                yield chunk
+
+        headers = {"Content-Type": body.content_type, "Content-Length": str(len(body))}
+        return (await self.request("POST", endpoint, data=read_body, headers=headers))["data"]
+
+    async def patch(self, endpoint: str, payload: dict) -> dict:
+        """Send a PATCH request to the API to update an object."""
+        return (await self.request("PATCH", endpoint, json=payload))["data"]
+
+    async def delete(self, endpoint: str) -> None:
+        """Send a DELETE request to the API to delete an object."""
+        await self.request("DELETE", endpoint)
+
+    async def close(self) -> None:
+        """Close all pooled connections."""
+        if self._session is not None:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+_client: AsyncMZClient | None = None
+
+def get_client() -> AsyncMZClient:
+    """Return the shared client used by the module-level request coroutines."""
+    global _client
+    if _client is None:
+        _client = AsyncMZClient()
+    return _client
+
+def set_client(client: AsyncMZClient) -> None:
+    """Replace the shared client, e.g. to change the pool size, concurrency limit, timeouts or retry settings."""
+    global _client
+    _client = client
+
+async def close_client() -> None:
+    """Close the connections of the shared client."""
+    if _client is not None:
+        await _client.close()
+
+async def get(endpoint: str) -> dict | list:
+    """Send a GET request to the API to fetch an object."""
+    return await get_client().get(endpoint)
+
+async def post(endpoint: str, payload: dict) -> dict:
+    """Send a POST request to the API to create an object."""
+    return await get_client().post(endpoint, payload)
+
+async def post_with_file(endpoint: str, payload: dict, files: dict) -> dict:
+    """Send a multipart POST request to the API to create an object that requires uploading a file."""
+    return await get_client().post_with_file(endpoint, payload, files)
+
+async def patch(endpoint: str, payload: dict) -> dict:
+    """Send a PATCH request to the API to update an object."""
+    return await get_client().patch(endpoint, payload)
+
+async def delete(endpoint: str) -> None:
+    """Send a DELETE request to the API to delete an object."""
+    await get_client().delete(endpoint)
@@ -0,0 +1,46 @@
+"""
+mz_async_operations.py
+
+This module contains asyncio versions of the item and measurement operations of
+`mz_operations.py`, built on the async API helpers from `mz_async_api_helpers.py`.
+
+Use them from async code to upload many items or measurements concurrently, e.g. with
+`asyncio.gather`; the shared client limits how many requests are sent at a time.
+"""
+
+import logging
+import os
+from mz_async_api_helpers import patch, post, post_with_file
+
+logger = logging.getLogger(__name__)
+
+async def create_item(table_id: str, title: str, values: list[dict]) -> dict:
+    """Create an item with values in a table and return the item details."""
+    payload = {"title": title, "values": values}
+    item = await post(f"/tables/{table_id}/items", payload)
+    logger.debug("  ✓ Created item %s with id %s", title, item["id"])
+    return item
+
+async def update_item(item_id: str, values: list[dict]) -> dict:
+    """Update an existing item with new values and return the updated item."""
+    payload = {"values": values}
+    item = await patch(f"/items/{item_id}", payload)
+    logger.debug("  ✓ Updated item %s with id %s", item["title"], item["id"])
+    return item
+
+async def create_measurement(item_id: str, title: str, parser_code: str, file: tuple) -> dict:
+    """Upload a measurement file to an item and return the measurement details."""
+    payload = {"title": title, "parserCode": parser_code}
+    files = {"rawFile": file}
+    measurement = await post_with_file(f"/items/{item_id}/measurements", payload, files)
+    logger.debug("  ✓ Created measurement %s in item with id %s", title, item_id)
+    return measurement
+
+async def create_measurement_from_file(item_id: str, title: str, parser_code: str, file_path: str,
+                                       content_type: str = "text/csv") -> dict:
+    """Upload a measurement file from disk to an item and return the measurement details.
+
+    The file is streamed to the API in chunks and closed as soon as the upload is done.
+    """
+    with open(file_path, "rb") as f:
+        return await create_measurement(item_id, title, parser_code, (os.path.basename(file_path), f, content_type))
@@ -0,0 +1,165 @@
+"""
+mz_metrics.py
+
+This module collects statistics of the requests sent to the MaterialsZone API, to see where
+the time of a run goes. Register a `RequestMetrics` as a request hook of the API helpers:
+
+    metrics = RequestMetrics()
+    add_request_hook(metrics)
+    ...
+    print(metrics.to_json())
+
+For every method and endpoint template (e.g. `POST /tables/{id}/items`), it counts the
+requests, responses by status code, retries, errors by class and bytes sent and received,
+and keeps a histogram of the request durations from which the p50, p95 and p99 latencies are
+estimated. The statistics can be dumped as JSON or in the Prometheus text format.
+"""
+
+import bisect
+import json
+import threading
+from collections import Counter
+
+# Upper bounds of the latency histogram buckets in seconds, four per doubling from 1 ms to about 2 minutes, so
+# estimated percentiles are within 20% of the real ones
+LATENCY_BUCKETS = tuple(0.001 * 2 ** (index / 4) for index in range(69))
+PERCENTILES = (50, 95, 99)
+
+
+def _escape_label(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class EndpointMetrics:
+    """The statistics of the requests to one endpoint template with one method."""
+
+    def __init__(self):
+        self.count = 0
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # The last bucket counts the slower requests
+
+    def record(self, record: dict) -> None:
+        self.count += 1
+        self.statuses[record["status"]] += 1
+        if record["error"] is not None:
+            self.errors[record["error"]] += 1
+        self.retries += record["retries"]
+        self.bytes_sent += record["bytes_sent"]
+        self.bytes_received += record["bytes_received"]
+        self.seconds += record["seconds"]
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, record["seconds"])] += 1
+
+    def percentile(self, percentile: float) -> float | None:
+        """Return an estimate of a percentile of the durations, interpolated within its histogram bucket."""
+        if self.count == 0:
+            return None
+        rank = percentile / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                lower = LATENCY_BUCKETS[index - 1] if index > 0 else 0.0
+                # Requests slower than the last bucket are estimated at its upper bound
+                upper = LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return LATENCY_BUCKETS[-1]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items(), key=str)},
+            "errors": dict(self.errors),
+            "retries": self.retries,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "seconds_total": self.seconds,
+            **{f"p{percentile}_seconds": self.percentile(percentile) for percentile in PERCENTILES},
+        }
+
+
+class RequestMetrics:
+    """A request hook that collects statistics per method and endpoint template.
+
+    It is safe to share between threads. Pass it to `add_request_hook` to start collecting, and read the statistics
+    with `summary`, `to_json` or `to_prometheus` at any time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: dict[tuple[str, str], EndpointMetrics] = {}
+
+    def __call__(self, record: dict) -> None:
+        with self._lock:
+            key = (record["method"], record["endpoint"])
+            if key not in self._endpoints:
+                self._endpoints[key] = EndpointMetrics()
+            self._endpoints[key].record(record)
+
+    def reset(self) -> None:
+        """Forget the statistics collected so far."""
+        with self._lock:
+            self._endpoints.clear()
+
+    def summary(self) -> dict[str, dict]:
+        """Return the statistics as a map from "METHOD endpoint" to the statistics of that endpoint."""
+        with self._lock:
+            return {f"{method} {endpoint}": metrics.summary()
+                    for (method, endpoint), metrics in sorted(self._endpoints.items())}
+
+    def to_json(self, indent: int | None = 2) -> str:
+        """Return the statistics as a JSON document."""
+        return json.dumps(self.summary(), indent=indent)
+
+    def to_prometheus(self, prefix: str = "mz_api") -> str:
+        """Return the statistics in the Prometheus text exposition format."""
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = []
+
+            def family(name: str, metric_type: str, help_text: str) -> None:
+                lines.append(f"# HELP {prefix}_{name} {help_text}")
+                lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+
+            def labels(method: str, endpoint: str, **extra: object) -> str:
+                pairs = {"method": method, "endpoint": endpoint, **extra}
+                return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs.items()) + "}"
+
+            family("requests_total", "counter", "Requests sent to the API, by final status code.")
+            for (method, endpoint), metrics in endpoints:
+                for status, count in sorted(metrics.statuses.items(), key=str):
+                    status_label = status if status is not None else "none"
+                    lines.append(f"{prefix}_requests_total{labels(method, endpoint, status=status_label)} {count}")
+
+            family("request_errors_total", "counter", "Requests that failed, by error class.")
+            for (method, endpoint), metrics in endpoints:
+                for error, count in sorted(metrics.errors.items()):
+                    lines.append(f"{prefix}_request_errors_total{labels(method, endpoint, error=error)} {count}")
+
+            family("request_retries_total", "counter", "Retries of requests to the API.")
+            for (method, endpoint), metrics in endpoints:
+                lines.append(f"{prefix}_request_retries_total{labels(method, endpoint)} {metrics.retries}")
+
+            for direction in ("sent", "received"):
+                family(f"bytes_{direction}_total", "counter", f"Bytes {direction} in request and response bodies.")
+                for (method, endpoint), metrics in endpoints:
+                    value = getattr(metrics, f"bytes_{direction}")
+                    lines.append(f"{prefix}_bytes_{direction}_total{labels(method, endpoint)} {value}")
+
+            family("request_duration_seconds", "histogram", "Duration of requests to the API, including retries.")
+            for (method, endpoint), metrics in endpoints:
+                cumulative = 0
+                for upper, count in zip(LATENCY_BUCKETS, metrics.buckets):
+                    cumulative += count
+                    lines.append(f"{prefix}_request_duration_seconds_bucket"
+                                 f"{labels(method, endpoint, le=f'{upper:.6g}')} {cumulative}")
+                lines.append(f"{prefix}_request_duration_seconds_bucket{labels(method, endpoint, le='+Inf')} "
+                             f"{metrics.count}")
+                lines.append(f"{prefix}_request_duration_seconds_sum{labels(method, endpoint)} {metrics.seconds}")
+                lines.append(f"{prefix}_request_duration_seconds_count{labels(method, endpoint)} {metrics.count}")
+
+        return "\n".join(lines) + "\n"
@@ -8,50 +8,151 @@ These functions use the lower-level API helpers from `mz_api_helpers.py` to carr
 specific tasks like creating materials and experiment tables, or uploading data from Excel files.
 
 You can use these operations in your main script to build and manage your workspace.
+Progress is reported through the `mz_operations` logger: one INFO line per folder, table,
+protocol and parameter, DEBUG lines for every item and measurement, and WARNING lines for
+failed uploads.
 """
 
-from mz_api_helpers import get, post, post_with_file, patch, delete
+import logging
+import math
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from mz_api_helpers import POOL_MAXSIZE, get, iter_listing, iter_pages, post, post_with_file, patch, delete
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_UPLOADS = POOL_MAXSIZE  # Number of items created in parallel by create_items
+CACHE_TTL = 300  # Seconds before the cached folder and table listings are fetched again
+
+class LookupCache:
+    """Cache of the folder and table listings, indexed for constant-time lookups.
+
+    Folders are indexed by title and tables by folder ID. The tables of a folder are fetched on first use, filtered
+    by the server, and folders are fetched page by page until the title that is looked up is found. Each listing is
+    fetched again once it is older than `ttl` seconds; in between, lookups make no API calls. `create_table` and
+    `delete_table` update the cached tables, so the cache stays coherent with the changes made through this module.
+    Call `invalidate` after changing folders or tables in another way (e.g. in the MaterialsZone web app).
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._folders_by_title = None
+        self._folders_fetched_at = 0.0
+        self._tables_by_folder = {}  # Folder ID -> (time fetched, tables by ID)
+
+    def _is_fresh(self, fetched_at: float) -> bool:
+        return time.monotonic() - fetched_at < self.ttl
+
+    def folder_by_title(self, title: str) -> dict | None:
+        """Return the first folder with the given title, or None if there is none.
+
+        The listing is only fetched up to the page with the folder. A title that is missing from the cached pages is
+        looked up again in a fresh listing, in case the folder comes later or was created since they were fetched.
+        """
+        with self._lock:
+            is_cached = self._folders_by_title is not None and self._is_fresh(self._folders_fetched_at)
+            if not is_cached or title not in self._folders_by_title:
+                self._folders_by_title = {}
+                self._folders_fetched_at = time.monotonic()
+                for page in iter_pages("/folders"):
+                    for folder in page:
+                        self._folders_by_title.setdefault(folder["title"], folder)
+                    if title in self._folders_by_title:
+                        break
+            return self._folders_by_title.get(title)
+
+    def tables_in_folder(self, folder_id: str) -> list[dict]:
+        """Return the tables within the given folder."""
+        with self._lock:
+            fetched_at, tables = self._tables_by_folder.get(folder_id, (0.0, None))
+            if tables is None or not self._is_fresh(fetched_at):
+                tables = {table["id"]: table for table in iter_tables(folder_id)}
+                self._tables_by_folder[folder_id] = (time.monotonic(), tables)
+            return list(tables.values())
+
+    def add_table(self, table: dict) -> None:
+        """Record a table that was just created."""
+        with self._lock:
+            if table["folderId"] in self._tables_by_folder:
+                self._tables_by_folder[table["folderId"]][1][table["id"]] = table
+
+    def remove_table(self, table_id: str) -> None:
+        """Forget a table that was just deleted."""
+        with self._lock:
+            for _, tables in self._tables_by_folder.values():
+                tables.pop(table_id, None)
+
+    def invalidate(self) -> None:
+        """Drop the cached listings, so that the next lookups fetch them again."""
+        with self._lock:
+            self._folders_by_title = None
+            self._tables_by_folder.clear()
+
+def iter_folders() -> Iterator[dict]:
+    """Yield the folders of the organization, fetching them one page at a time."""
+    return iter_listing("/folders")
+
+def iter_tables(folder_id: str | None = None) -> Iterator[dict]:
+    """Yield the tables of the organization, or of one folder, fetching them one page at a time.
+
+    The tables are filtered by folder on the server, and again here in case the server ignores the filter.
+    """
+    params = {"folderId": folder_id} if folder_id is not None else None
+    for table in iter_listing("/tables", params):
+        if folder_id is None or table["folderId"] == folder_id:
+            yield table
+
+_cache = LookupCache()
+
+def invalidate_cache() -> None:
+    """Drop the cached folder and table listings used by the lookup functions."""
+    _cache.invalidate()
 
 def get_folder_id_by_name(folder_title: str) -> str:
     """Return the ID of a folder matching the given title."""
-    folders = get("/folders")
-    for folder in folders:
-        if folder["title"] == folder_title:
-            print(f"  ✓ Found folder {folder_title} with id {folder['id']}")
-            return folder["id"]
-    raise ValueError("Folder not found")
+    folder = _cache.folder_by_title(folder_title)
+    if folder is None:
+        raise ValueError("Folder not found")
+    logger.info("  ✓ Found folder %s with id %s", folder_title, folder["id"])
+    return folder["id"]
 
 def get_tables_in_folder(folder_id: str) -> list[dict] | None:
     """Return a list of tables within the specified folder ID."""
-    all_tables = get("/tables")
-    tables_in_folder = [table for table in all_tables if table["folderId"] == folder_id]
-    print(f"  ✓ Found {len(tables_in_folder)} tables in folder {folder_id}")
+    tables_in_folder = _cache.tables_in_folder(folder_id)
+    logger.info("  ✓ Found %d tables in folder %s", len(tables_in_folder), folder_id)
     return tables_in_folder
 
 def create_table(folder_id: str, title: str) -> str:
     """Create a table in a folder and return its ID."""
     payload = {"title": title, "description": title, "folderId": folder_id}
-    table_id = post("/tables", payload)["id"]
-    print(f"  ✓ Created table {title} with id {table_id}")
+    table = {**payload, **post("/tables", payload)}
+    table_id = table["id"]
+    _cache.add_table(table)
+    logger.info("  ✓ Created table %s with id %s", title, table_id)
     return table_id
 
 def delete_table(table_id: str) -> None:
     """Delete the specified table by ID."""
     delete(f"/tables/{table_id}")
-    print(f"  ✓ Deleted table {table_id}")
+    _cache.remove_table(table_id)
+    logger.info("  ✓ Deleted table %s", table_id)
 
 def create_protocol(table_id: str, title: str) -> str:
     """Create a protocol in a table and return its ID."""
     payload = {"title": title}
     protocol_id = post(f"/tables/{table_id}/protocols", payload)["id"]
-    print(f"  ✓ Created protocol {title} with id {protocol_id}")
+    logger.info("  ✓ Created protocol %s with id %s", title, protocol_id)
     return protocol_id
 
 def create_formulation_protocol(table_id: str, title: str, title_table_ids: list[str]) -> str:
     """Create a formulation protocol and return its ID."""
     payload = {"title": title, "unit": "%", "titleTableIds": title_table_ids}
     formulation_protocol_id = post(f"/tables/{table_id}/formulation-protocols", payload)["id"]
-    print(f"  ✓ Created formation protocol {title} with id {formulation_protocol_id}")
+    logger.info("  ✓ Created formation protocol %s with id %s", title, formulation_protocol_id)
     return formulation_protocol_id
 
 def create_parameter(protocol_id: str, title: str, unit: str=None) -> str:
@@ -60,7 +161,7 @@ def create_parameter(protocol_id: str, title: str, unit: str=None) -> str:
     if unit:
         payload["unit"] = unit
     parameter_id = post(f"/protocols/{protocol_id}/parameters", payload)["id"]
-    print(f"  ✓ Created parameter {title} with id {parameter_id}")
+    logger.info("  ✓ Created parameter %s with id %s", title, parameter_id)
     return parameter_id
 
 def create_protocols_and_parameters(table_id: str, protocols: list[dict]) -> dict[str, str]:
@@ -79,24 +180,212 @@ def create_protocols_and_parameters(table_id: str, protocols: list[dict]) -> dic
 
     return col_param_map
 
+def sync_protocols_and_parameters(table_id: str, protocols: list[dict]) -> dict[str, str]:
+    """Create the protocols and parameters that are missing from an existing table and return a map from column names
+    to parameter IDs.
+
+    The protocols and parameters already in the table are read once and matched to `protocols` by title, so a table
+    that already has them all is left untouched. Like `create_protocols_and_parameters`, the ID of every protocol is
+    set in `protocols`.
+    """
+    existing_protocols = {protocol["title"]: protocol["id"] for protocol in get(f"/tables/{table_id}/protocols")}
+    existing_formulation_protocols = {protocol["title"]: protocol["id"]
+                                      for protocol in get(f"/tables/{table_id}/formulation-protocols")}
+    col_param_map = {}
+    for protocol in protocols:
+        if protocol["type"] == "protocol":
+            protocol_id = existing_protocols.get(protocol["title"])
+            existing_parameters = {}
+            if protocol_id is None:
+                protocol_id = create_protocol(table_id, protocol["title"])
+            else:
+                existing_parameters = {parameter["title"]: parameter["id"]
+                                       for parameter in get(f"/protocols/{protocol_id}/parameters")}
+            protocol["id"] = protocol_id
+            for parameter in protocol["parameters"]:
+                parameter_id = existing_parameters.get(parameter["title"])
+                if parameter_id is None:
+                    parameter_id = create_parameter(protocol_id, parameter["title"], parameter["unit"])
+                col_param_map[parameter["column"]] = parameter_id
+        elif protocol["type"] == "formulation":
+            protocol_id = existing_formulation_protocols.get(protocol["title"])
+            if protocol_id is None:
+                protocol_id = create_formulation_protocol(table_id, protocol["title"], protocol["titleTableIds"])
+            protocol["id"] = protocol_id
+
+    return col_param_map
+
+def sync_table(folder_id: str, title: str, protocols: list[dict]) -> tuple[str, dict[str, str]]:
+    """Return the ID and column-to-parameter map of the table with the given title in a folder, after creating the
+    protocols and parameters missing from it. The table is created if the folder has none with this title."""
+    table_id = next((table["id"] for table in get_tables_in_folder(folder_id) if table["title"] == title), None)
+    if table_id is None:
+        table_id = create_table(folder_id, title)
+        return table_id, create_protocols_and_parameters(table_id, protocols)
+
+    logger.info("  ✓ Found table %s with id %s", title, table_id)
+    return table_id, sync_protocols_and_parameters(table_id, protocols)
+
 def create_item(table_id: str, title: str, values: list[dict]) -> dict:
     """Create an item with values in a table and return the item details."""
     payload = {"title": title, "values": values}
     item = post(f"/tables/{table_id}/items", payload)
-    print(f"  ✓ Created item {title} with id {item['id']}")
+    logger.debug("  ✓ Created item %s with id %s", title, item["id"])
     return item
 
+def create_items(table_id: str, items: list[tuple[str, list[dict]]],
+                 max_workers: int = MAX_CONCURRENT_UPLOADS,
+                 on_created: Callable[[int, dict], None] | None = None
+                 ) -> tuple[dict[str, str], list[tuple[int, str, Exception]]]:
+    """Create many items in a table concurrently and return a map from titles to item IDs and a list of failures.
+
+    Each entry of `items` is a (title, values) pair. The title-to-ID map is built in the order of `items`, so it is
+    the same as the one produced by calling `create_item` for each entry in turn. An item that fails to upload does
+    not stop the others; it is reported in the failures list as an (index, title, exception) tuple instead. If
+    given, `on_created` is called with the index and details of every item as soon as it is created.
+    """
+    def upload(index: int, item: tuple[str, list[dict]]) -> dict | Exception:
+        title, values = item
+        try:
+            created = create_item(table_id, title, values)
+            if on_created is not None:
+                on_created(index, created)
+            return created
+        except Exception as exception:
+            return exception
+
+    ids_map = {}
+    failures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for index, ((title, _), result) in enumerate(zip(items, executor.map(upload, range(len(items)), items))):
+            if isinstance(result, Exception):
+                logger.warning("  ✗ Failed to create item %s: %s", title, result)
+                failures.append((index, title, result))
+            else:
+                ids_map[result["title"]] = result["id"]
+
+    return ids_map, failures
+
 def update_item(item_id: str, values: list[dict]) -> dict:
     """Update an existing item with new values and return the updated item."""
     payload = {"values": values}
     item = patch(f"/items/{item_id}", payload)
-    print(f"  ✓ Updated item {item['title']} with id {item['id']}")
+    logger.debug("  ✓ Updated item %s with id %s", item["title"], item["id"])
     return item
 
+def update_items(items: list[tuple[str, list[dict]]], max_workers: int = MAX_CONCURRENT_UPLOADS,
+                 on_updated: Callable[[int, dict], None] | None = None) -> list[tuple[int, str, Exception]]:
+    """Update many items concurrently and return a list of failures.
+
+    Each entry of `items` is an (item ID, values) pair. Like with `create_items`, an item that fails to update is
+    reported as an (index, item ID, exception) tuple without stopping the others, and `on_updated` is called with
+    the index and details of every item as soon as it is updated.
+    """
+    def upload(index: int, item: tuple[str, list[dict]]) -> Exception | None:
+        item_id, values = item
+        try:
+            updated = update_item(item_id, values)
+            if on_updated is not None:
+                on_updated(index, updated)
+        except Exception as exception:
+            return exception
+
+    failures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for index, ((item_id, _), result) in enumerate(zip(items, executor.map(upload, range(len(items)), items))):
+            if result is not None:
+                logger.warning("  ✗ Failed to update item %s: %s", item_id, result)
+                failures.append((index, item_id, result))
+
+    return failures
+
+def _value_key(value: dict) -> tuple:
+    """Return what identifies the column of an item value: its parameter, or its formulation protocol and item."""
+    return value.get("parameterId"), value.get("formulationProtocolId"), value.get("formulationItemId")
+
+def _normalize_value(value: object) -> object:
+    """Return a value in a form that compares equal whether it was sent as a string or returned as a number."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return value
+    return None if math.isnan(number) else number  # NaN never compares equal, even to itself
+
+def find_item_changes(items: list[tuple[str, list[dict]]], existing_items: list[dict]
+                      ) -> tuple[list[int], list[tuple[int, str]]]:
+    """Compare items to the items of a table and return the indices of the new ones and the (index, item ID) pairs of
+    the ones whose values differ.
+
+    Each entry of `items` is a (title, values) pair and `existing_items` are the items of the table as returned by the
+    API. Items are matched by title, and only the values in `items` are compared, so values of other columns (e.g.
+    analysis results) don't count as changes.
+    """
+    existing_by_title = {}
+    for item in existing_items:
+        existing_by_title.setdefault(item["title"], item)
+
+    new_indices, changed_items = [], []
+    for index, (title, values) in enumerate(items):
+        existing = existing_by_title.get(title)
+        if existing is None:
+            new_indices.append(index)
+            continue
+        existing_values = {_value_key(value): _normalize_value(value.get("value"))
+                           for value in existing.get("values", [])}
+        if any(_value_key(value) not in existing_values
+               or existing_values[_value_key(value)] != _normalize_value(value["value"]) for value in values):
+            changed_items.append((index, existing["id"]))
+
+    return new_indices, changed_items
+
+def sync_items(table_id: str, items: list[tuple[str, list[dict]]], max_workers: int = MAX_CONCURRENT_UPLOADS,
+               on_updated: Callable[[int, dict], None] | None = None
+               ) -> tuple[dict[str, str], list[tuple[int, str, Exception]]]:
+    """Bring the items of an existing table in line with `items` and return a map from titles to item IDs and a list
+    of failures.
+
+    The items of the table are read once, page by page, and compared to `items` with `find_item_changes`; only the
+    missing items are created and only the items whose values differ are updated. Items of the table that aren't in
+    `items` are left as they are. The map and failures are the same as those of `create_items`, and `on_updated` is
+    called with the index in `items` and details of every updated item.
+    """
+    existing_items = list(iter_listing(f"/tables/{table_id}/items"))
+    new_indices, changed_items = find_item_changes(items, existing_items)
+    logger.info("  ✓ %d items unchanged, %d new and %d changed", len(items) - len(new_indices) - len(changed_items),
+                len(new_indices), len(changed_items))
+
+    def on_item_updated(index: int, item: dict) -> None:
+        if on_updated is not None:
+            on_updated(changed_items[index][0], item)
+
+    created_ids_map, create_failures = create_items(table_id, [items[index] for index in new_indices], max_workers)
+    update_failures = update_items([(item_id, items[index][1]) for index, item_id in changed_items], max_workers,
+                                   on_item_updated)
+
+    ids_map = {}
+    for item in existing_items:
+        ids_map.setdefault(item["title"], item["id"])
+    ids_map.update(created_ids_map)
+    failures = [(new_indices[index], title, exception) for index, title, exception in create_failures]
+    failures += [(changed_items[index][0], items[changed_items[index][0]][0], exception)
+                 for index, _, exception in update_failures]
+    return ({title: ids_map[title] for title, _ in items if title in ids_map},
+            sorted(failures, key=lambda failure: failure[0]))
+
 def create_measurement(item_id: str, title: str, parser_code: str, file: tuple) -> dict:
     """Upload a measurement file to an item and return the measurement details."""
     payload = {"title": title, "parserCode": parser_code}
     files = {"rawFile": file}
     measurement = post_with_file(f"/items/{item_id}/measurements", payload, files)
-    print(f"  ✓ Created measurement {title} in item with id {item_id}")
+    logger.debug("  ✓ Created measurement %s in item with id %s", title, item_id)
     return measurement
+
+def create_measurement_from_file(item_id: str, title: str, parser_code: str, file_path: str,
+                                 content_type: str = "text/csv") -> dict:
+    """Upload a measurement file from disk to an item and return the measurement details.
+
+    The file is streamed to the API in chunks and closed as soon as the upload is done, so even large files can be
+    uploaded with little memory.
+    """
+    with open(file_path, "rb") as f:
+        return create_measurement(item_id, title, parser_code, (os.path.basename(file_path), f, content_type))
@@ -0,0 +1,137 @@
+"""
+upload_state.py
+
+This module keeps a local record of what previous runs of the example uploaded, so that a
+re-run only sends what changed, and a run that was interrupted continues where it stopped.
+
+The record is a small SQLite database. For every table it stores the MaterialsZone IDs of the
+table and its parameters together with a hash of the table definition; for every item, a hash
+of the values it was uploaded with; and for every measurement file, a hash of its content and
+the item it was uploaded to. Delete the database file to start from scratch.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+STATE_PATH = str(Path(__file__).resolve().parent / "upload_state.sqlite")  # Location of the state database
+FILE_HASH_CHUNK_SIZE = 1024 * 1024
+
+def hash_content(content: object) -> str:
+    """Return a hash of any JSON-serializable object."""
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+def hash_file(file_path: str) -> str:
+    """Return a hash of the content of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(FILE_HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class UploadState:
+    """The record of the tables, items and measurement files uploaded by previous runs.
+
+    Every change is committed right away, so the record is complete up to the last upload even if the run is
+    interrupted. The methods are safe to call from several threads.
+    """
+
+    def __init__(self, path: str = STATE_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        with self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS tables (
+                    title TEXT PRIMARY KEY,
+                    table_id TEXT NOT NULL,
+                    definition_hash TEXT NOT NULL,
+                    col_param_map TEXT NOT NULL,
+                    formulation_protocol_id TEXT
+                );
+                CREATE TABLE IF NOT EXISTS items (
+                    table_id TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    item_id TEXT NOT NULL,
+                    values_hash TEXT NOT NULL,
+                    PRIMARY KEY (table_id, title)
+                );
+                CREATE TABLE IF NOT EXISTS measurements (
+                    file_path TEXT PRIMARY KEY,
+                    item_id TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL
+                );
+            """)
+
+    def _execute(self, statement: str, parameters: tuple = ()) -> list[tuple]:
+        with self._lock, self._conn:
+            return self._conn.execute(statement, parameters).fetchall()
+
+    def get_table(self, title: str, definition: object) -> dict | None:
+        """Return the IDs of a table uploaded with the same definition, or None if there is none."""
+        rows = self._execute("SELECT table_id, col_param_map, formulation_protocol_id FROM tables "
+                             "WHERE title = ? AND definition_hash = ?", (title, hash_content(definition)))
+        if not rows:
+            return None
+        table_id, col_param_map, formulation_protocol_id = rows[0]
+        return {"table_id": table_id, "col_param_map": json.loads(col_param_map),
+                "formulation_protocol_id": formulation_protocol_id}
+
+    def save_table(self, title: str, definition: object, table_id: str, col_param_map: dict[str, str],
+                   formulation_protocol_id: str | None = None) -> None:
+        """Record a newly created table. The items recorded for a previous table with this title are forgotten."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM items WHERE table_id IN (SELECT table_id FROM tables WHERE title = ?)",
+                               (title,))
+            self._conn.execute("INSERT OR REPLACE INTO tables VALUES (?, ?, ?, ?, ?)",
+                               (title, table_id, hash_content(definition), json.dumps(col_param_map),
+                                formulation_protocol_id))
+
+    def get_items(self, table_id: str) -> dict[str, tuple[str, str]]:
+        """Return a map from the titles of the items recorded for a table to their IDs and values hashes."""
+        rows = self._execute("SELECT title, item_id, values_hash FROM items WHERE table_id = ?", (table_id,))
+        return {title: (item_id, values_hash) for title, item_id, values_hash in rows}
+
+    def save_item(self, table_id: str, title: str, item_id: str, values: list[dict]) -> None:
+        """Record an item that was created or updated with the given values."""
+        self._execute("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?)", (table_id, title, item_id, hash_content(values)))
+
+    def is_measurement_uploaded(self, file_path: str, item_id: str) -> bool:
+        """Return whether the file was uploaded to the item with its current content.
+
+        Files whose size and modification time haven't changed since the upload aren't read again.
+        """
+        rows = self._execute("SELECT item_id, size, mtime_ns, content_hash FROM measurements WHERE file_path = ?",
+                             (os.path.abspath(file_path),))
+        if not rows or rows[0][0] != item_id:
+            return False
+        _, size, mtime_ns, content_hash = rows[0]
+        stat = os.stat(file_path)
+        if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+            return True
+        return hash_file(file_path) == content_hash
+
+    def save_measurement(self, file_path: str, item_id: str) -> None:
+        """Record a file that was uploaded to an item."""
+        stat = os.stat(file_path)
+        self._execute("INSERT OR REPLACE INTO measurements VALUES (?, ?, ?, ?, ?)",
+                      (os.path.abspath(file_path), item_id, stat.st_size, stat.st_mtime_ns, hash_file(file_path)))
+
+    def forget_measurements(self, item_id: str) -> None:
+        """Forget the files uploaded to an item, so that they are uploaded again."""
+        self._execute("DELETE FROM measurements WHERE item_id = ?", (item_id,))
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()